@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+Content-addressed store for the large files cells write into a workspace.
+
+Run with: uv run --project runtime runtime/blob_store.py <workdir> <command> [options]
+
+Commands:
+  add       Store files a cell wrote and link them back into the workspace
+  gc        Delete objects no cell references
+  report    Show per-cell state and output sizes and what deduplication saves
+
+Objects live in ``{workdir}/.anyt/objects/<sha[:2]>/<sha256>`` (or the directory named
+by ``ANYT_OBJECT_STORE``, to share one store between workspaces on the same filesystem).
+Where the filesystem supports copy-on-write clones, objects are reflinks of the
+workspace files, and a stored file whose content is already in the store is replaced
+by a reflink of the object, so identical files take the space of one. Elsewhere a copy
+would double the space a file takes, so by default (mode ``auto``) only its digest is
+recorded and the object is copied in by ``preserve`` just before the cell runs again and
+overwrites the file; mode ``copy`` stores a copy right away. Files smaller than
+``BLOB_MIN_BYTES`` are left alone.
+
+Each cell lists the files it stored in ``.anyt/cells/<id>/objects.json``, so resetting
+a cell drops its references. Each workspace also lists the digests it uses in
+``refs/<workspace key>`` inside the store; ``gc`` rewrites its own list from the
+manifests and keeps every object that any workspace's list names, so a shared store
+is safe to collect from any of them.
+
+Objects never share an inode with a workspace file (no hardlinks), so objects can be
+read-only while workspace files stay writable: rewriting a stored output in place only
+changes the workspace file. ``detach`` gives private copies to files hardlinked to the
+store by earlier versions.
+"""
+
+import argparse
+import contextlib
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+from collections.abc import Iterable
+from pathlib import Path
+
+from config import (
+    BLOB_LINK_MODE,
+    BLOB_MIN_BYTES,
+    BLOB_STORE_ENV,
+    CELLS_DIR_NAME,
+    OBJECTS_DIR_NAME,
+    STATE_DIR_NAME,
+    NotebookError,
+    ValidationError,
+)
+from notebook_cache import file_hash
+
+_ERROR_PREFIXES: dict[type[NotebookError], str] = {
+    ValidationError: "Validation error",
+}
+
+MANIFEST_NAME = "objects.json"
+REFS_DIR_NAME = "refs"
+
+# Linux ioctl that clones a file's extents (copy-on-write) on btrfs, XFS and similar
+_FICLONE = 0x40049409
+
+# Errors that mean "this way of linking is not available here", as opposed to real failures
+_UNSUPPORTED = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EPERM, errno.ENOSYS}
+
+# Link mode -> ways to try, in order; "defer" records the digest and leaves copying to
+# ``preserve``. No mode hardlinks: objects are read-only, and a workspace file sharing
+# their inode would be too.
+_LINK_MODES = {
+    "auto": ("reflink", "defer"),
+    "reflink": ("reflink",),
+    "copy": ("copy",),
+}
+
+# How a stored file relates to its object, recorded in the manifest for ``size_report``:
+# sharing its extents, a private copy beside it, or waiting for ``preserve`` (no object yet)
+SHARED, COPIED, PENDING = "shared", "copied", "pending"
+
+
+def objects_dir(workdir: Path) -> Path:
+    shared = os.environ.get(BLOB_STORE_ENV)
+    return Path(shared) if shared else workdir / STATE_DIR_NAME / OBJECTS_DIR_NAME
+
+
+def object_path(workdir: Path, digest: str) -> Path:
+    return objects_dir(workdir) / digest[:2] / digest
+
+
+def _manifest_path(workdir: Path, cell_id: str) -> Path:
+    return workdir / STATE_DIR_NAME / CELLS_DIR_NAME / cell_id / MANIFEST_NAME
+
+
+def _refs_path(workdir: Path) -> Path:
+    key = hashlib.sha256(str(workdir.resolve()).encode("utf-8")).hexdigest()[:24]
+    return objects_dir(workdir) / REFS_DIR_NAME / key
+
+
+def _tmp_path(path: Path) -> Path:
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def _files_under(workdir: Path, relative: str) -> list[Path]:
+    """The regular files at a workspace path: the file itself, or a directory's files. Empty if missing."""
+    if Path(relative).is_absolute() or ".." in Path(relative).parts:
+        return []  # only files inside the workspace are stored
+    root = workdir / relative
+    if root.is_dir():
+        return sorted(p for p in root.rglob("*") if p.is_file() and not p.is_symlink())
+    return [root] if root.is_file() and not root.is_symlink() else []
+
+
+def _link_modes(mode: str) -> tuple[str, ...]:
+    if mode not in _LINK_MODES:
+        raise ValidationError(f"Unknown link mode '{mode}' (valid: {', '.join(_LINK_MODES)})")
+    return _LINK_MODES[mode]
+
+
+# ---------------------------------------------------------------------------
+# Linking
+# ---------------------------------------------------------------------------
+
+
+def _reflink(source: Path, target: Path) -> None:
+    with source.open("rb") as src, target.open("wb") as dst:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+
+
+def _clone(source: Path, target: Path, ways: tuple[str, ...]) -> str:
+    """Create ``target`` as a reflink or copy of ``source``, the first of ``ways`` that works. Returns the way used.
+
+    Either way ``target`` is a new inode, so changing its mode never affects ``source``.
+    Reaching "defer" returns it without creating ``target``.
+    """
+    for way in ways:
+        if way == "defer":
+            return way
+        try:
+            if way == "reflink":
+                _reflink(source, target)
+            else:
+                shutil.copyfile(source, target)
+            return way
+        except OSError as e:
+            target.unlink(missing_ok=True)
+            if e.errno not in _UNSUPPORTED or way == "copy":
+                raise
+    raise OSError(errno.EOPNOTSUPP, f"Cannot link {source} ({', '.join(ways)})")
+
+
+def materialize(workdir: Path, digest: str, relative: str, mode: str = BLOB_LINK_MODE) -> bool:
+    """Put object ``digest`` at a workspace path, replacing what is there. False if the object is missing."""
+    source = object_path(workdir, digest)
+    if not source.is_file():
+        return False
+    target = workdir / relative
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _tmp_path(target)
+    try:
+        # The file has to exist afterwards, so a deferring mode copies
+        _clone(source, tmp, tuple("copy" if way == "defer" else way for way in _link_modes(mode)))
+        tmp.chmod(0o644)
+        os.replace(tmp, target)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return True
+
+
+def _add_object(workdir: Path, path: Path, digest: str, mode: str) -> str:
+    """Create the object for ``path``'s content. Returns the way used, or "defer" if none was created."""
+    obj = object_path(workdir, digest)
+    obj.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _tmp_path(obj)
+    try:
+        way = _clone(path, tmp, _link_modes(mode))
+        if way != "defer":
+            tmp.chmod(0o444)
+            os.replace(tmp, obj)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return way
+
+
+def _store_file(workdir: Path, path: Path, digest: str, mode: str) -> str:
+    """Put ``path``'s content in the store. Returns how the file relates to its object (SHARED etc.)."""
+    obj = object_path(workdir, digest)
+    try:
+        if os.path.samefile(path, obj):
+            return SHARED  # hardlinked by an earlier version
+    except FileNotFoundError:
+        # New content: the object is a reflink or copy of the workspace file, with its own
+        # inode, or is deferred to ``preserve`` where only a full copy would do
+        way = _add_object(workdir, path, digest, mode)
+        return {"reflink": SHARED, "copy": COPIED}.get(way, PENDING)
+    # Content already stored: share the object's extents where the filesystem can; a
+    # copy would take as much space as the file it replaces, so that is left alone
+    if "reflink" in _link_modes(mode):
+        try:
+            materialize(workdir, digest, path.relative_to(workdir).as_posix(), "reflink")
+            return SHARED
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+    return COPIED
+
+
+def preserve(workdir: Path, paths: Iterable[str], digests: dict[str, str] | None = None) -> int:
+    """Copy deferred objects into the store from these workspace paths, before they are overwritten.
+
+    Only files whose content this workspace references and the store lacks are copied.
+    ``digests`` maps file paths to SHA-256 hashes already known to the caller. Returns how many.
+    """
+    pending = {d for d in _read_refs(_refs_path(workdir))[1] if not object_path(workdir, d).exists()}
+    if not pending:
+        return 0
+    digests = digests or {}
+    copied = 0
+    for relative in paths:
+        for path in _files_under(workdir, relative):
+            if path.stat().st_size < BLOB_MIN_BYTES:
+                continue
+            digest = digests.get(path.relative_to(workdir).as_posix()) or file_hash(path)
+            if digest in pending:
+                _add_object(workdir, path, digest, "copy")  # the file is about to change: copy it now
+                pending.discard(digest)
+                copied += 1
+    return copied
+
+
+def detach(workdir: Path, paths: Iterable[str]) -> int:
+    """Replace hardlinked files under these workspace paths with private writable copies. Returns how many.
+
+    The store no longer hardlinks, but workspaces stored by earlier versions may still share
+    read-only inodes with their objects.
+    """
+    detached = 0
+    for relative in paths:
+        for path in _files_under(workdir, relative):
+            if path.stat().st_nlink < 2:
+                continue
+            tmp = _tmp_path(path)
+            try:
+                shutil.copyfile(path, tmp)
+                tmp.chmod(0o644)
+                os.replace(tmp, path)
+            except BaseException:
+                tmp.unlink(missing_ok=True)
+                raise
+            detached += 1
+    return detached
+
+
+# ---------------------------------------------------------------------------
+# Cells
+# ---------------------------------------------------------------------------
+
+
+def _load_manifest(workdir: Path, cell_id: str) -> dict[str, dict[str, object]]:
+    """The manifest's sections: ``files`` (path -> digest), ``sharing`` and ``sizes``. Empty if none."""
+    try:
+        data = json.loads(_manifest_path(workdir, cell_id).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {name: section for name, section in data.items() if isinstance(section, dict)}
+
+
+def read_manifest(workdir: Path, cell_id: str) -> dict[str, str]:
+    """Workspace path -> object digest for the files a cell stored. Empty if none."""
+    return {str(k): str(v) for k, v in _load_manifest(workdir, cell_id).get("files", {}).items()}
+
+
+def _read_refs(path: Path) -> tuple[str | None, set[str]]:
+    """The workspace a refs file belongs to and the digests it lists. (None, empty) if unreadable."""
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+        owner = json.loads(lines[0])["workdir"]
+    except (OSError, ValueError, IndexError, KeyError, TypeError):
+        return None, set()
+    return str(owner), {line for line in lines[1:] if line}
+
+
+def _append_refs(workdir: Path, digests: Iterable[str]) -> None:
+    """Add digests to this workspace's refs file with one append, creating it if missing."""
+    path = _refs_path(workdir)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = _tmp_path(path)
+        tmp.write_text(json.dumps({"workdir": str(workdir.resolve())}) + "\n", encoding="utf-8")
+        with contextlib.suppress(FileExistsError):
+            os.link(tmp, path)  # atomic create-if-missing, header included
+        tmp.unlink()
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+    try:
+        os.write(fd, "".join(f"{d}\n" for d in digests).encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def _write_refs(workdir: Path, digests: set[str]) -> None:
+    """Replace this workspace's refs file with exactly these digests (removing it if there are none)."""
+    path = _refs_path(workdir)
+    if not digests:
+        path.unlink(missing_ok=True)
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _tmp_path(path)
+    header = json.dumps({"workdir": str(workdir.resolve())})
+    tmp.write_text("\n".join([header, *sorted(digests)]) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def store_files(
+    workdir: Path,
+    cell_id: str,
+    paths: Iterable[str],
+    digests: dict[str, str] | None = None,
+    mode: str = BLOB_LINK_MODE,
+) -> dict[str, str]:
+    """Store the files under these workspace paths for a cell and record them in its manifest.
+
+    ``digests`` maps file paths to SHA-256 hashes already known to the caller. Returns
+    the files stored by this call (path -> digest).
+    """
+    _link_modes(mode)
+    digests = digests or {}
+    stored: dict[str, str] = {}
+    sharing: dict[str, str] = {}
+    sizes: dict[str, int] = {}
+    for relative in paths:
+        for path in _files_under(workdir, relative):
+            size = path.stat().st_size
+            if size < BLOB_MIN_BYTES:
+                continue
+            name = path.relative_to(workdir).as_posix()
+            digest = digests.get(name) or file_hash(path)
+            sharing[name] = _store_file(workdir, path, digest, mode)
+            stored[name] = digest
+            sizes[name] = size
+
+    if stored:
+        # Referenced before the manifest names them, so a concurrent gc never sees them unused
+        _append_refs(workdir, set(stored.values()))
+        previous = _load_manifest(workdir, cell_id)
+        manifest = {
+            "files": {**previous.get("files", {}), **stored},
+            "sharing": {**previous.get("sharing", {}), **sharing},
+            "sizes": {**previous.get("sizes", {}), **sizes},
+        }
+        target = _manifest_path(workdir, cell_id)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = _tmp_path(target)
+        tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        os.replace(tmp, target)
+    return stored
+
+
+def _cell_ids(workdir: Path) -> list[str]:
+    cells = workdir / STATE_DIR_NAME / CELLS_DIR_NAME
+    with contextlib.suppress(FileNotFoundError):
+        return sorted(p.name for p in cells.iterdir() if p.is_dir())
+    return []
+
+
+def _objects(workdir: Path) -> list[Path]:
+    root = objects_dir(workdir)
+    if not root.is_dir():
+        return []
+    return [p for p in root.glob("??/*") if p.is_file() and not p.name.startswith(".")]
+
+
+# ---------------------------------------------------------------------------
+# Garbage collection and reporting
+# ---------------------------------------------------------------------------
+
+
+def gc(workdir: Path, dry_run: bool = False) -> dict[str, object]:
+    """Delete objects that neither this workspace's manifests nor any other workspace's refs list.
+
+    This workspace's refs file is rewritten from its manifests; refs files of workspaces
+    that no longer exist are dropped.
+    """
+    referenced = {digest for cid in _cell_ids(workdir) for digest in read_manifest(workdir, cid).values()}
+    own = _refs_path(workdir)
+    if not dry_run:
+        _write_refs(workdir, referenced)
+    keep = set(referenced)
+    with contextlib.suppress(FileNotFoundError):
+        for ref in own.parent.iterdir():
+            if ref == own or ref.name.startswith("."):
+                continue
+            owner, listed = _read_refs(ref)
+            if owner is not None and Path(owner).is_dir():
+                keep |= listed
+            elif not dry_run:
+                ref.unlink(missing_ok=True)
+
+    removed, freed, kept = 0, 0, 0
+    for obj in _objects(workdir):
+        if obj.name in keep:
+            kept += 1
+            continue
+        size = obj.stat().st_size
+        if not dry_run:
+            obj.unlink()
+        removed += 1
+        freed += size
+    return {"removed": removed, "freed_bytes": freed, "kept": kept, "dry_run": dry_run}
+
+
+def _tree_size(path: Path) -> int:
+    total = 0
+    for p in path.rglob("*"):
+        with contextlib.suppress(OSError):
+            if p.is_file() and not p.is_symlink():
+                total += p.stat().st_size
+    return total
+
+
+def size_report(workdir: Path) -> dict[str, object]:
+    """Per-cell sizes of state files and stored outputs, and what the store actually saves.
+
+    ``stored_bytes`` is the size of the stored workspace files and ``disk_bytes`` what they
+    and their objects take: each object once (with the files sharing its extents), plus
+    every file that is a private copy or still waiting for its object. ``saved_bytes`` is
+    the difference, negative when copies cost more than deduplication saves.
+    """
+    cells: list[dict[str, object]] = []
+    owners: dict[str, set[str]] = {}
+    sizes: dict[str, int] = {}
+    for obj in _objects(workdir):
+        sizes[obj.name] = obj.stat().st_size
+    used: set[str] = set()
+    unshared = 0
+    for cid in _cell_ids(workdir):
+        manifest = _load_manifest(workdir, cid)
+        files = read_manifest(workdir, cid)
+        sharing, file_sizes = manifest.get("sharing", {}), manifest.get("sizes", {})
+        logical = 0
+        for name, digest in files.items():
+            owners.setdefault(digest, set()).add(cid)
+            size = file_sizes.get(name)
+            size = size if isinstance(size, int) else sizes.get(digest, 0)
+            logical += size
+            if digest in sizes:
+                used.add(digest)
+            if sharing.get(name, COPIED) != SHARED:  # manifests without sharing predate it: assume copies
+                unshared += size
+        cells.append(
+            {
+                "id": cid,
+                "state_bytes": _tree_size(workdir / STATE_DIR_NAME / CELLS_DIR_NAME / cid),
+                "stored_files": len(files),
+                "stored_bytes": logical,
+            }
+        )
+    for entry in cells:
+        # Bytes only this cell's outputs keep alive: what resetting it and running gc would free
+        entry["exclusive_bytes"] = sum(size for digest, size in sizes.items() if owners.get(digest) == {entry["id"]})
+
+    logical_total = sum(int(str(c["stored_bytes"])) for c in cells)
+    disk = sum(sizes[d] for d in used) + unshared
+    return {
+        "cells": cells,
+        "objects": len(sizes),
+        "store_bytes": sum(sizes.values()),
+        "stored_bytes": logical_total,
+        "disk_bytes": disk,
+        "saved_bytes": logical_total - disk,
+    }
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Deduplicated storage for files written by notebook cells")
+    parser.add_argument("workdir", help="Notebook working directory")
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # add command
+    add_parser = subparsers.add_parser("add", help="Store files a cell wrote")
+    add_parser.add_argument("--cell", required=True, help="Cell ID")
+    add_parser.add_argument("paths", nargs="+", help="Workspace-relative files or directories")
+    add_parser.add_argument("--mode", default=BLOB_LINK_MODE, help=f"reflink, copy or auto (default: {BLOB_LINK_MODE})")
+
+    # gc command
+    gc_parser = subparsers.add_parser("gc", help="Delete objects no cell references")
+    gc_parser.add_argument("--dry-run", action="store_true", help="Only report what would be deleted")
+
+    # report command
+    subparsers.add_parser("report", help="Show per-cell and store sizes")
+
+    args = parser.parse_args(argv)
+
+    try:
+        workdir = Path(args.workdir)
+        if args.command == "add":
+            result: object = store_files(workdir, args.cell, args.paths, mode=args.mode)
+        elif args.command == "gc":
+            result = gc(workdir, args.dry_run)
+        else:
+            result = size_report(workdir)
+        print(json.dumps(result, indent=2))
+        return 0
+
+    except NotebookError as e:
+        prefix = _ERROR_PREFIXES.get(type(e), "Error")
+        print(f"\n{prefix}: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Infer the dependency graph between the cells of an AnyT Notebook.
+
+Run with: uv run --project runtime runtime/cell_graph.py <notebook.anyt.md> [--durations] [--compact]
+
+Each cell is given the resources it reads and writes:
+  task   writes the paths on its **Output:** lines; reads the paths it mentions and
+         every earlier input cell (the runtime passes input responses to tasks)
+  shell  writes redirect targets and the operands of mkdir/touch/cp/mv/...; reads the
+         other path operands and any input cell it names
+  input  writes its response
+  break  a barrier: waits for every earlier cell, and every later cell waits for it
+  note   nothing
+
+A task that mentions no paths reads everything, and one without an **Output:** line
+writes everything. A shell script that runs anything but plain file utilities does both,
+as does one whose file operands or redirects depend on variables or globs.
+Two cells are ordered when one writes what the other reads or writes. An
+``after="a, b"`` attribute on a cell replaces inference for that cell's own dependencies.
+
+Outputs JSON with each cell's reads, writes and direct dependencies, the levels of
+cells that can run in parallel, and the critical path. With --durations, the critical
+path is weighted by the durations recorded in the workdir's completion markers.
+"""
+
+import argparse
+import json
+import re
+import shlex
+import sys
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from config import NotebookError, ParseError, ValidationError
+from manage_state import get_all_status, read_marker
+from parse_notebook import Cell, Notebook, compile_form, load_notebook
+
+_ERROR_PREFIXES: dict[type[NotebookError], str] = {
+    ParseError: "Parse error",
+    ValidationError: "Validation error",
+}
+
+# Resource read or written by an opaque cell: overlaps every workspace path
+ANY = "*"
+
+# Prefix of per-cell state resources; these only overlap themselves
+_CELL_RESOURCE = "cell:"
+
+
+@dataclass(slots=True)
+class CellNode:
+    id: str
+    cell_type: str
+    reads: list[str] = field(default_factory=list)
+    writes: list[str] = field(default_factory=list)
+    depends_on: list[str] = field(default_factory=list)
+    explicit: bool = False
+    level: int = 0
+
+
+@dataclass
+class CellGraph:
+    nodes: list[CellNode] = field(default_factory=list)
+
+    def levels(self) -> list[list[str]]:
+        """Cell ids grouped by level; cells within a level do not depend on each other."""
+        grouped: list[list[str]] = []
+        for node in self.nodes:
+            while len(grouped) <= node.level:
+                grouped.append([])
+            grouped[node.level].append(node.id)
+        return grouped
+
+    def critical_path(self, weights: dict[str, float] | None = None) -> tuple[list[str], float]:
+        """Longest weighted dependency chain. Unweighted task and shell cells count 1, others 0."""
+        if weights is None:
+            weights = {n.id: 1.0 for n in self.nodes if n.cell_type in ("task", "shell")}
+
+        finish: dict[str, float] = {}
+        previous: dict[str, str | None] = {}
+        for node in self.nodes:
+            start, before = 0.0, None
+            for dep in node.depends_on:
+                if finish[dep] > start or before is None:
+                    start, before = finish[dep], dep
+            finish[node.id] = start + weights.get(node.id, 0.0)
+            previous[node.id] = before
+
+        if not finish:
+            return [], 0.0
+
+        # On ties prefer the latest cell, so zero-weight cells at the end stay on the path
+        end: str | None = max(reversed(finish), key=lambda cid: finish[cid])
+        total = finish[end]
+        path: list[str] = []
+        while end is not None:
+            path.append(end)
+            end = previous[end]
+        return path[::-1], total
+
+    def external_reads(self, node: CellNode) -> list[str]:
+        """Workspace paths a cell reads that no cell writes: its inputs from outside the notebook.
+
+        Patterns and cell state references are left out; with an opaque writer in the graph there are none.
+        """
+        written = [path for n in self.nodes for path in n.writes]
+        return [path for path in literal_paths(node.reads) if not any(_paths_overlap(path, w) for w in written)]
+
+
+# ---------------------------------------------------------------------------
+# Resource extraction
+# ---------------------------------------------------------------------------
+
+# **Output:** lines in task cells
+_OUTPUT_LINE_RE = re.compile(r"^\s*\*\*Output:?\*\*:?\s*(.+)$", re.MULTILINE)
+
+# References to another cell's state folder: .anyt/cells/<id>/...
+_CELL_REF_RE = re.compile(r"\.anyt/cells/([a-z0-9]+(?:[-_][a-z0-9]+)*)")
+
+_BACKTICK_RE = re.compile(r"`([^`\n]+)`")
+_URL_RE = re.compile(r"\b[a-z][a-z0-9+.-]*://\S+", re.IGNORECASE)
+
+# Bare words in prose that are paths: anything with a slash, or a file name with a known extension
+_PROSE_PATH_RE = re.compile(
+    r"(?<![\w/.:-])((?:\.{1,2}/)?[\w<>{}*.-]+/[\w<>{}*./-]*"
+    r"|[\w<>{}*-]+\.(?:json|jsonl|md|txt|csv|tsv|yaml|yml|html|xml|py|js|ts|sh|toml|log"
+    r"|mp4|mp3|wav|m4a|png|jpg|jpeg|gif|webp|svg|pdf|srt|vtt|zip))(?![\w/])"
+)
+
+# Placeholders in paths (<video-id>, {name}, $VAR, ${VAR}) stand for any name
+_PLACEHOLDER_RE = re.compile(r"<[^<>/]*>|\{[^{}/]*\}|\$\{[^}]*\}|\$\w+|[?\[\]]")
+
+_PATHISH_RE = re.compile(r"^[\w<>{}$*.~/-]+$")
+
+# Shell words whose file depends on the environment or the directory listing ($F, ${F}, *.txt, {a,b})
+_SHELL_EXPANSION_RE = re.compile(r"[$*?\[\]{}]")
+
+# Shell commands whose file effects are fully described by their operands
+_SHELL_INERT = {"echo", "printf", "true", "false", ":", "sleep", "date", "pwd", "set", "export", "exit", "wait"}
+_SHELL_READERS = {"cat", "ls", "head", "tail", "wc", "grep", "stat", "du", "file", "diff", "sort", "test", "["}
+_SHELL_WRITERS = {"mkdir", "touch", "rm", "rmdir", "tee", "truncate"}
+_SHELL_COPIERS = {"cp", "mv", "ln"}
+_SHELL_KEYWORDS = {"if", "then", "else", "elif", "fi", "do", "done", "!", "{", "}"}
+_SHELL_SEPARATORS = {";", "&&", "||", "|", "&", "(", ")", ";;"}
+
+
+def _normalize_path(path: str) -> str | None:
+    """Canonical workspace-relative form of a path, or None if it is not a workspace path."""
+    path = path.strip().strip("\"'`,;:()")
+    if not path or path.startswith(("-", "/dev/")) or not _PATHISH_RE.match(path):
+        return None
+    path = _PLACEHOLDER_RE.sub("*", path)
+    while path.startswith("./"):
+        path = path[2:]
+    path = path.rstrip("/")
+    if path in ("", ".", "*"):
+        return None
+    return path
+
+
+def _paths_overlap(a: str, b: str) -> bool:
+    if a.startswith(_CELL_RESOURCE) or b.startswith(_CELL_RESOURCE):
+        return a == b
+    if ANY in (a, b) or a == b:
+        return True
+    if "*" in a or "*" in b:
+        # Compare the literal prefixes; over-approximating only adds ordering
+        a, b = a.split("*", 1)[0], b.split("*", 1)[0]
+        return a.startswith(b) or b.startswith(a)
+    return b.startswith(a + "/") or a.startswith(b + "/")
+
+
+def literal_paths(resources: list[str]) -> list[str]:
+    """The plain workspace paths among a node's reads or writes, without patterns or cell state."""
+    return [r for r in resources if r != ANY and "*" not in r and not r.startswith(_CELL_RESOURCE)]
+
+
+def _overlaps(left: list[str], right: list[str]) -> bool:
+    return any(_paths_overlap(a, b) for a in left for b in right)
+
+
+def _cell_refs(text: str) -> set[str]:
+    return {_CELL_RESOURCE + cid for cid in _CELL_REF_RE.findall(text)}
+
+
+def _text_paths(text: str) -> set[str]:
+    """Paths mentioned in markdown: backticked paths and path-like words in prose."""
+    text = _URL_RE.sub(" ", _CELL_REF_RE.sub(" ", text))
+    found: set[str] = set()
+    for span in _BACKTICK_RE.findall(text):
+        if "/" in span or _PROSE_PATH_RE.fullmatch(span.strip()):
+            found.add(span)
+    found.update(_PROSE_PATH_RE.findall(_BACKTICK_RE.sub(" ", text)))
+    return {p for p in map(_normalize_path, found) if p}
+
+
+def _task_resources(cell: Cell) -> tuple[set[str], set[str]]:
+    content = cell.content
+    writes: set[str] = set()
+    for line in _OUTPUT_LINE_RE.findall(content):
+        for item in line.split(","):
+            words = item.replace("`", " ").split()
+            path = _normalize_path(words[0]) if words else None
+            if path:
+                writes.add(path)
+
+    reads = _text_paths(_OUTPUT_LINE_RE.sub(" ", content)) - writes
+    return reads or {ANY}, writes or {ANY}
+
+
+def _shell_words(script: str) -> list[list[str]] | None:
+    """Split a script into simple commands (word lists, redirections kept as tokens).
+
+    Returns None when the script uses constructs that are not analysed (heredocs,
+    command substitution, unbalanced quotes).
+    """
+    if "<<" in script or "$(" in script or "`" in script:
+        return None
+
+    commands: list[list[str]] = []
+    for line in script.replace("\\\n", " ").splitlines():
+        lexer = shlex.shlex(line, posix=True, punctuation_chars=True)
+        lexer.whitespace_split = True
+        try:
+            tokens = list(lexer)
+        except ValueError:
+            return None
+        current: list[str] = []
+        for token in tokens:
+            if token in _SHELL_SEPARATORS:
+                if current:
+                    commands.append(current)
+                current = []
+            else:
+                current.append(token)
+        if current:
+            commands.append(current)
+    return commands
+
+
+def _shell_resources(cell: Cell) -> tuple[set[str], set[str]]:
+    commands = _shell_words(cell.content)
+    if commands is None:
+        return {ANY}, {ANY}
+
+    reads: set[str] = set()
+    writes: set[str] = set()
+    for words in commands:
+        operands: list[str] = []
+        redirect: str | None = None
+        for word in words:
+            if redirect is not None:
+                if _SHELL_EXPANSION_RE.search(word):
+                    return {ANY}, {ANY}
+                path = _normalize_path(word)
+                if path:
+                    (writes if ">" in redirect else reads).add(path)
+                redirect = None
+            elif set(word) <= set("<>&|") and ("<" in word or ">" in word):
+                # A trailing & duplicates a file descriptor (2>&1), no file involved
+                redirect = None if word.endswith("&") else word
+            elif not word.isdigit():
+                operands.append(word)
+
+        while operands and operands[0] in _SHELL_KEYWORDS:
+            operands.pop(0)
+        if not operands or "=" in operands[0]:
+            continue
+
+        command, words = operands[0], operands[1:]
+        if command in _SHELL_INERT:
+            continue
+        if command == "[" and words[-1:] == ["]"]:
+            words.pop()
+        if any(_SHELL_EXPANSION_RE.search(word) for word in words):
+            return {ANY}, {ANY}  # which files it touches is only known when it runs
+        args = [p for p in map(_normalize_path, words) if p]
+        if command in _SHELL_READERS:
+            reads.update(args)
+        elif command in _SHELL_WRITERS:
+            writes.update(args)
+        elif command in _SHELL_COPIERS and args:
+            *sources, target = args
+            reads.update(sources)
+            writes.add(target)
+            if command == "mv":
+                writes.update(sources)
+        else:
+            return {ANY}, {ANY}
+
+    return reads, writes
+
+
+def _input_names(cell: Cell) -> list[str]:
+    try:
+        schema = compile_form(cell)
+    except NotebookError:
+        return []
+    return [f.name for f in schema.fields] if schema else []
+
+
+def _mentions(text: str, names: list[str]) -> bool:
+    lowered = text.lower()
+    return any(re.search(rf"(?<![\w-]){re.escape(name.lower())}(?![\w-])", lowered) for name in names if name)
+
+
+# ---------------------------------------------------------------------------
+# Graph construction
+# ---------------------------------------------------------------------------
+
+
+def build_graph(notebook: Notebook, barrier_types: Iterable[str] = ("break",)) -> CellGraph:
+    """Infer reads, writes and direct dependencies for every cell, in notebook order.
+
+    Cells whose type is in ``barrier_types`` wait for every earlier cell and are waited
+    on by every later one. The runner adds ``input`` so nothing runs past an open form.
+    """
+    barriers = frozenset(barrier_types)
+    graph = CellGraph()
+    inputs: list[tuple[str, list[str]]] = []  # (input cell id, id + field names) seen so far
+    ancestors: list[int] = []  # bitset of every transitive dependency, per node index
+    index: dict[str, int] = {}
+    barrier: int | None = None  # index of the last barrier cell
+
+    for i, cell in enumerate(notebook.cells):
+        node = CellNode(id=cell.id, cell_type=cell.cell_type)
+        reads: set[str] = set()
+        writes: set[str] = set()
+
+        if cell.cell_type == "task":
+            reads, writes = _task_resources(cell)
+            reads.update(_CELL_RESOURCE + cid for cid, _ in inputs)
+        elif cell.cell_type == "shell":
+            reads, writes = _shell_resources(cell)
+            reads.update(_CELL_RESOURCE + cid for cid, names in inputs if _mentions(cell.content, names))
+        elif cell.cell_type == "input":
+            inputs.append((cell.id, [cell.id, *_input_names(cell)]))
+
+        if cell.cell_type not in ("note", "break"):
+            reads.update(_cell_refs(cell.content))
+            reads.discard(_CELL_RESOURCE + cell.id)
+            writes.add(_CELL_RESOURCE + cell.id)
+        node.reads, node.writes = sorted(reads), sorted(writes)
+
+        if cell.cell_type in barriers:
+            # Waits for everything since the previous barrier (which covers everything before it)
+            start = 0 if barrier is None else barrier
+            deps = set(range(start, i))
+        elif cell.after is not None:
+            node.explicit = True
+            deps = {index[cid] for cid in cell.after if cid in index}
+        else:
+            start = 0 if barrier is None else barrier + 1
+            deps = {
+                j
+                for j in range(start, i)
+                if _overlaps(graph.nodes[j].writes, node.reads)
+                or _overlaps(graph.nodes[j].writes, node.writes)
+                or _overlaps(graph.nodes[j].reads, node.writes)
+            }
+        if barrier is not None and barrier != i:
+            deps.add(barrier)
+
+        # Keep only direct dependencies: drop any already implied through another one
+        implied = 0
+        for j in deps:
+            implied |= ancestors[j]
+        direct = sorted(j for j in deps if not implied >> j & 1)
+
+        reach = implied
+        for j in direct:
+            reach |= ancestors[j] | 1 << j
+        ancestors.append(reach)
+
+        node.depends_on = [graph.nodes[j].id for j in direct]
+        node.level = max((graph.nodes[j].level + 1 for j in direct), default=0)
+        index[cell.id] = i
+        if cell.cell_type in barriers:
+            barrier = i
+        graph.nodes.append(node)
+
+    return graph
+
+
+def recorded_durations(workdir: Path, graph: CellGraph) -> dict[str, float]:
+    """Durations from the completion markers of a previous run; cells without one are omitted."""
+    durations: dict[str, float] = {}
+    for entry in get_all_status(workdir, [node.id for node in graph.nodes]):
+        marker = read_marker(workdir, entry["id"], entry["status"]) or {}
+        duration = marker.get("duration")
+        if isinstance(duration, (int, float)):
+            durations[entry["id"]] = float(duration)
+    return durations
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Infer the cell dependency graph of an AnyT Notebook")
+    parser.add_argument("notebook", help="Path to .anyt.md file")
+    parser.add_argument(
+        "--durations", action="store_true", help="Weight the critical path by durations from the last run"
+    )
+    parser.add_argument("--compact", action="store_true", help="Print compact JSON")
+    args = parser.parse_args()
+
+    file_path = Path(args.notebook)
+    try:
+        notebook, errors = load_notebook(file_path)
+        if errors:
+            raise ValidationError("; ".join(errors))
+
+        graph = build_graph(notebook)
+        weights = None
+        if args.durations:
+            weights = recorded_durations(file_path.parent / notebook.workdir, graph)
+        path, length = graph.critical_path(weights)
+
+        result = {
+            "cells": [asdict(node) for node in graph.nodes],
+            "levels": graph.levels(),
+            "critical_path": {"cells": path, "length": round(length, 6)},
+        }
+        print(json.dumps(result, indent=None if args.compact else 2))
+        return 0
+
+    except NotebookError as e:
+        prefix = _ERROR_PREFIXES.get(type(e), "Error")
+        print(f"\n{prefix}: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
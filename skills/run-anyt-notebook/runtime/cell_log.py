@@ -0,0 +1,541 @@
+"""
+Streaming, rotating output logs for shell cells.
+
+A ``CellLogWriter`` takes output chunks from a running process and appends them to
+``.anyt/cells/<id>/output.log``. When that file reaches ``LOG_SEGMENT_BYTES`` it is
+renamed to ``output.log.<n>`` (n = 1, 2, ... oldest first) and, when compression is
+on, packed to ``output.log.<n>.gz`` or ``.zst``; a fresh ``output.log`` continues.
+Concatenating the segments in order, then ``output.log``, gives the exact output.
+
+The writer also keeps the last ``LOG_TAIL_LINES`` lines in memory and saves them to
+``output.log.tail`` (at most once per ``LOG_TAIL_FLUSH_INTERVAL`` and on close),
+together with the size of ``output.log`` they were taken at. ``read_log_tail`` serves
+from that file while it is current, so the end of a long log costs one small read.
+
+``output.log.idx`` records the offset of every ``LOG_INDEX_STRIDE``-th line, so
+``LogReader`` can serve a page of lines or a byte range by seeking rather than reading
+from the start; only a compressed segment is decompressed up to the requested point.
+``follow_log`` waits for new output with inotify (through ctypes) on Linux and polls
+elsewhere.
+
+zstd needs the optional ``zstandard`` package; ``"auto"`` uses it when installed and
+gzip otherwise.
+"""
+
+import contextlib
+import ctypes
+import ctypes.util
+import gzip
+import io
+import json
+import os
+import re
+import select
+import shutil
+import struct
+import sys
+import time
+from collections import deque
+from collections.abc import Iterator
+from pathlib import Path
+from types import TracebackType
+
+from config import (
+    CELLS_DIR_NAME,
+    LOG_COMPRESSION,
+    LOG_FILE_NAME,
+    LOG_FOLLOW_POLL_INTERVAL,
+    LOG_INDEX_STRIDE,
+    LOG_SEGMENT_BYTES,
+    LOG_TAIL_FLUSH_INTERVAL,
+    LOG_TAIL_LINES,
+    MARKER_DONE,
+    MARKER_FAILED,
+    MARKER_SKIPPED,
+    STATE_DIR_NAME,
+    ValidationError,
+)
+
+try:
+    import zstandard  # pyright: ignore[reportMissingImports]
+except ImportError:
+    zstandard = None
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+# Line-offset index entries: little-endian uint64 offsets into the whole output
+_OFFSET = struct.Struct("<Q")
+
+# Longest unterminated line kept for the tail index (progress bars rewrite one line with \r)
+_MAX_PARTIAL_BYTES = 64 << 10
+
+_SEGMENT_RE = re.compile(rf"^{re.escape(LOG_FILE_NAME)}\.(\d+)(\.gz|\.zst)?$")
+
+
+def log_path(workdir: Path, cell_id: str) -> Path:
+    """The active (newest) segment of a cell's output log."""
+    return workdir / STATE_DIR_NAME / CELLS_DIR_NAME / cell_id / LOG_FILE_NAME
+
+
+def _tail_path(log: Path) -> Path:
+    return log.with_name(f"{log.name}.tail")
+
+
+def _index_path(log: Path) -> Path:
+    return log.with_name(f"{log.name}.idx")
+
+
+def resolve_compression(compression: str | None) -> str | None:
+    """Map a compression setting ("auto", "gzip", "zstd", "none" or None) to "gzip", "zstd" or None."""
+    if compression in (None, "none"):
+        return None
+    if compression == "auto":
+        return "zstd" if zstandard is not None else "gzip"
+    if compression == "zstd" and zstandard is None:
+        raise ValidationError("zstd log compression needs the 'zstandard' package")
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValidationError(f"Unknown log compression '{compression}' (valid: auto, gzip, zstd, none)")
+    return compression
+
+
+def log_segments(log: Path) -> list[Path]:
+    """Rotated segments of a log, oldest first (the active ``output.log`` is not included)."""
+    try:
+        names = os.listdir(log.parent)
+    except FileNotFoundError:
+        return []
+    numbered = [(int(m.group(1)), name) for name in names if (m := _SEGMENT_RE.match(name))]
+    return [log.parent / name for _, name in sorted(numbered)]
+
+
+def open_segment(path: Path) -> io.BufferedIOBase:
+    """Open a log segment for binary reading, decompressing by suffix."""
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    if path.suffix == ".zst":
+        if zstandard is None:
+            raise ValidationError(f"Reading {path.name} needs the 'zstandard' package")
+        return zstandard.ZstdDecompressor().stream_reader(path.open("rb"), closefd=True)
+    return path.open("rb")
+
+
+def _compress_segment(path: Path, compression: str) -> None:
+    target = path.with_name(path.name + COMPRESSION_SUFFIXES[compression])
+    tmp = target.with_name(f".{target.name}.tmp")
+    with path.open("rb") as src, tmp.open("wb") as raw:
+        if compression == "gzip":
+            with gzip.GzipFile(filename=path.name, mode="wb", fileobj=raw, compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        else:
+            assert zstandard is not None
+            zstandard.ZstdCompressor(level=3).copy_stream(src, raw)
+    os.replace(tmp, target)
+    path.unlink()
+
+
+def clear_log(log: Path) -> None:
+    """Remove a log with its rotated segments and tail index."""
+    for path in [log, _tail_path(log), _index_path(log), *log_segments(log)]:
+        path.unlink(missing_ok=True)
+
+
+class CellLogWriter:
+    """Append-only writer for one cell's output, rotating at ``segment_bytes``.
+
+    Starting a writer replaces any previous log for the cell. Use as a context manager,
+    or call ``close()``, so the last segment's tail index is written.
+    """
+
+    def __init__(
+        self,
+        workdir: Path,
+        cell_id: str,
+        segment_bytes: int = LOG_SEGMENT_BYTES,
+        compression: str | None = LOG_COMPRESSION,
+        tail_lines: int = LOG_TAIL_LINES,
+    ) -> None:
+        self.path = log_path(workdir, cell_id)
+        self.segment_bytes = segment_bytes
+        self.compression = resolve_compression(compression)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        clear_log(self.path)
+
+        self._file = self.path.open("wb", buffering=0)  # readers polling the log see each chunk at once
+        self._size = 0  # bytes in the active segment
+        self._segment_sizes: list[int] = []  # uncompressed size of each rotated segment
+        self._offset = 0  # bytes written in total
+        self._lines = 0  # newlines written in total
+        self._index = _index_path(self.path).open("wb", buffering=0)
+        self._index.write(_OFFSET.pack(0))
+        self._tail: deque[bytes] = deque(maxlen=tail_lines)
+        self._partial = b""  # last line, not yet terminated
+        self._tail_written = 0.0
+
+    def __enter__(self) -> "CellLogWriter":
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: TracebackType | None
+    ) -> None:
+        self.close()
+
+    def write(self, chunk: bytes | str) -> None:
+        """Append a chunk of output. Chunks need not end on line boundaries."""
+        data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        if not data:
+            return
+        self._file.write(data)
+        self._index_lines(data)
+        self._size += len(data)
+        self._offset += len(data)
+
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()[-_MAX_PARTIAL_BYTES:]
+        self._tail.extend(lines)
+
+        if self._size >= self.segment_bytes:
+            self._rotate()
+        elif time.monotonic() - self._tail_written >= LOG_TAIL_FLUSH_INTERVAL:
+            self._write_tail()
+
+    def _index_lines(self, data: bytes) -> None:
+        """Record the offset of every LOG_INDEX_STRIDE-th line that starts in ``data``."""
+        newlines = data.count(b"\n")
+        mark = (self._lines // LOG_INDEX_STRIDE + 1) * LOG_INDEX_STRIDE  # next line number to index
+        pos = -1
+        seen = 0
+        while self._lines + newlines >= mark:
+            # Line ``mark`` starts after the (mark - self._lines)-th newline of this chunk
+            while seen < mark - self._lines:
+                pos = data.index(b"\n", pos + 1)
+                seen += 1
+            self._index.write(_OFFSET.pack(self._offset + pos + 1))
+            mark += LOG_INDEX_STRIDE
+        self._lines += newlines
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._segment_sizes.append(self._size)
+        segment = self.path.with_name(f"{self.path.name}.{len(self._segment_sizes)}")
+        os.replace(self.path, segment)
+        self._file = self.path.open("wb", buffering=0)
+        self._size = 0
+        self._write_tail()
+        if self.compression is not None:
+            _compress_segment(segment, self.compression)
+
+    def _write_tail(self) -> None:
+        lines = [line.decode("utf-8", errors="replace") for line in self._tail]
+        data = {
+            "size": self._size,
+            "lines": lines,
+            "partial": self._partial.decode("utf-8", errors="replace"),
+            "complete": len(self._tail) < (self._tail.maxlen or 0),  # every line of the output is here
+            "segments": self._segment_sizes,
+        }
+        tail = _tail_path(self.path)
+        tmp = tail.with_name(f".{tail.name}.tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, tail)
+        self._tail_written = time.monotonic()
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._file.close()
+        self._index.close()
+        self._write_tail()
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+
+def iter_log(workdir: Path, cell_id: str, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+    """Yield a cell's whole output in order, across rotated and compressed segments."""
+    log = log_path(workdir, cell_id)
+    for path in [*log_segments(log), log]:
+        try:
+            f = open_segment(path)
+        except FileNotFoundError:
+            continue
+        with f:
+            yield from iter(lambda f=f: f.read(chunk_size), b"")
+
+
+_READ_BLOCK = 1 << 16
+
+
+def _split_lines(data: bytes) -> list[bytes]:
+    lines = data.split(b"\n")
+    if lines[-1] == b"":
+        lines.pop()
+    return lines
+
+
+def _scan_tail(path: Path, count: int, block: int = 1 << 16) -> list[bytes]:
+    """The last ``count`` lines of an uncompressed file, reading backwards in blocks."""
+    try:
+        f = path.open("rb")
+    except FileNotFoundError:
+        return []
+    with f:
+        pos = f.seek(0, os.SEEK_END)
+        data = b""
+        while pos > 0 and data.count(b"\n") <= count:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = _split_lines(data)
+    if pos > 0:
+        lines = lines[1:]  # may have started before the first block read
+    return lines[-count:]
+
+
+def read_log_tail(workdir: Path, cell_id: str, count: int = 20) -> list[str]:
+    """The last ``count`` lines of a cell's output; an unterminated last line counts as a line.
+
+    Answered from the tail index when it matches the current ``output.log``, otherwise by
+    reading ``output.log`` backwards, plus the newest rotated segment if that is too short.
+    """
+    if count <= 0:
+        return []
+    log = log_path(workdir, cell_id)
+    tail = None
+    try:
+        tail = json.loads(_tail_path(log).read_text(encoding="utf-8"))
+        if log.stat().st_size != tail["size"]:
+            tail = None
+    except (FileNotFoundError, ValueError, KeyError, TypeError):
+        tail = None
+    if tail is not None:
+        lines = [*tail["lines"], tail["partial"]] if tail["partial"] else list(tail["lines"])
+        if len(lines) >= count or tail["complete"]:
+            return lines[-count:]
+
+    raw = _scan_tail(log, count)
+    segments = log_segments(log)
+    if len(raw) < count and segments:
+        # The active segment is short, so both it and the previous one are bounded by the segment cap
+        with open_segment(segments[-1]) as f:
+            data = f.read()
+        if log.exists():
+            data += log.read_bytes()
+        raw = _split_lines(data)[-count:] if data else []
+    return [line.decode("utf-8", errors="replace") for line in raw]
+
+
+class LogReader:
+    """Random access to a cell's whole output: the rotated segments followed by ``output.log``.
+
+    Offsets count bytes of the uncompressed output. The layout is read once; call
+    ``refresh()`` to see output written since.
+    """
+
+    def __init__(self, workdir: Path, cell_id: str) -> None:
+        self.path = log_path(workdir, cell_id)
+        self.size = 0
+        self._pieces: list[tuple[int, Path]] = []  # (start offset, file), in order
+        self.refresh()
+
+    def refresh(self) -> None:
+        segments = log_segments(self.path)
+        sizes: list[int] = []
+        try:
+            recorded = json.loads(_tail_path(self.path).read_text(encoding="utf-8"))["segments"]
+            if isinstance(recorded, list) and len(recorded) >= len(segments):
+                sizes = [int(n) for n in recorded[: len(segments)]]
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            pass
+        if len(sizes) != len(segments):
+            sizes = [_segment_size(p) for p in segments]
+
+        start = 0
+        self._pieces = []
+        for path, size in zip(segments, sizes, strict=True):
+            self._pieces.append((start, path))
+            start += size
+        self._pieces.append((start, self.path))
+        try:
+            self.size = start + self.path.stat().st_size
+        except FileNotFoundError:
+            self.size = start
+
+    @property
+    def segment_count(self) -> int:
+        return len(self._pieces) - 1
+
+    def read_range(self, start: int, end: int | None = None) -> bytes:
+        """Bytes ``start`` to ``end`` (exclusive; default: the end) of the output."""
+        end = self.size if end is None else min(end, self.size)
+        for _ in range(3):
+            try:
+                return self._read(max(start, 0), end)
+            except FileNotFoundError:
+                self.refresh()  # a segment was compressed or the log rotated under us
+        return self._read(max(start, 0), end)
+
+    def _read(self, start: int, end: int) -> bytes:
+        parts: list[bytes] = []
+        for i, (piece_start, path) in enumerate(self._pieces):
+            piece_end = self._pieces[i + 1][0] if i + 1 < len(self._pieces) else end
+            if piece_end <= start or piece_start >= end:
+                continue
+            with open_segment(path) as f:
+                f.seek(max(start - piece_start, 0))
+                parts.append(f.read(min(end, piece_end) - max(start, piece_start)))
+        return b"".join(parts)
+
+    def line_offset(self, line: int) -> int | None:
+        """Offset where line ``line`` (0-based) starts, or None past the end."""
+        index = _index_path(self.path)
+        start, skip = 0, line
+        try:
+            with index.open("rb") as f:
+                entries = os.fstat(f.fileno()).st_size // _OFFSET.size
+                slot = min(line // LOG_INDEX_STRIDE, entries - 1)
+                if slot > 0:
+                    f.seek(slot * _OFFSET.size)
+                    (start,) = _OFFSET.unpack(f.read(_OFFSET.size))
+                    skip = line - slot * LOG_INDEX_STRIDE
+        except FileNotFoundError:
+            pass  # written without a CellLogWriter: count from the start
+
+        pos = start
+        while skip > 0:
+            block = self.read_range(pos, pos + _READ_BLOCK)
+            if not block:
+                return None
+            found = -1
+            while skip > 0:
+                found = block.find(b"\n", found + 1)
+                if found == -1:
+                    break
+                skip -= 1
+            pos += len(block) if found == -1 else found + 1
+        return pos if pos < self.size else None
+
+    def head(self, count: int, skip: int = 0) -> list[str]:
+        """``count`` lines starting at line ``skip`` (0-based)."""
+        start = self.line_offset(skip)
+        if start is None or count <= 0:
+            return []
+        data = b""
+        pos = start
+        while data.count(b"\n") < count and pos < self.size:
+            block = self.read_range(pos, pos + _READ_BLOCK)
+            data += block
+            pos += len(block)
+        return [line.decode("utf-8", errors="replace") for line in _split_lines(data)[:count]]
+
+    def tail(self, count: int) -> list[str]:
+        """The last ``count`` lines up to ``size``, read backwards."""
+        data = b""
+        pos = self.size
+        while pos > 0 and data.count(b"\n") <= count:
+            step = min(_READ_BLOCK, pos)
+            pos -= step
+            data = self.read_range(pos, pos + step) + data
+        lines = _split_lines(data) if data else []
+        if pos > 0:
+            lines = lines[1:]
+        return [line.decode("utf-8", errors="replace") for line in lines[-count:]] if count > 0 else []
+
+
+def _segment_size(path: Path) -> int:
+    if path.suffix not in (".gz", ".zst"):
+        return path.stat().st_size
+    size = 0
+    with open_segment(path) as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            size += len(block)
+    return size
+
+
+# ---------------------------------------------------------------------------
+# Follow mode
+# ---------------------------------------------------------------------------
+
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+
+
+class _ChangeWatcher:
+    """Blocks until an entry of a directory changes: inotify via ctypes on Linux, polling otherwise."""
+
+    def __init__(self, directory: Path) -> None:
+        self._fd = -1
+        if not sys.platform.startswith("linux"):
+            return
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return
+        if fd < 0:
+            return
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+            os.close(fd)
+            return
+        self._fd = fd
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._fd >= 0
+
+    def wait(self, timeout: float) -> None:
+        if self._fd < 0:
+            time.sleep(min(timeout, LOG_FOLLOW_POLL_INTERVAL))
+            return
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if ready:
+            with contextlib.suppress(BlockingIOError):
+                while os.read(self._fd, 4096):
+                    pass
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def _cell_finished(cell_dir: Path) -> bool:
+    return any((cell_dir / marker).exists() for marker in (MARKER_DONE, MARKER_FAILED, MARKER_SKIPPED))
+
+
+def follow_log(workdir: Path, cell_id: str, offset: int | None = None, timeout: float | None = None) -> Iterator[bytes]:
+    """Yield output written after ``offset`` (default: the current end) as it arrives.
+
+    Stops once the cell has a completion marker and everything before it was yielded,
+    or after ``timeout`` seconds.
+    """
+    reader = LogReader(workdir, cell_id)
+    position = reader.size if offset is None else offset
+    deadline = None if timeout is None else time.monotonic() + timeout
+    watcher = _ChangeWatcher(reader.path.parent)
+    try:
+        while True:
+            finished = _cell_finished(reader.path.parent)
+            reader.refresh()
+            if reader.size > position:
+                segments = reader.segment_count
+                data = reader.read_range(position, min(reader.size, position + _READ_BLOCK * 16))
+                if len(log_segments(reader.path)) != segments:
+                    continue  # rotated while reading; re-read from the new layout
+                position += len(data)
+                yield data
+                continue
+            if finished:
+                return
+            remaining = 1.0 if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            # Re-check at least once a second: the cell directory may not exist yet to be watched
+            watcher.wait(min(remaining, 1.0))
+    finally:
+        watcher.close()
@@ -0,0 +1,128 @@
+"""
+Resource metrics for cells, recorded in their ``.done`` and ``.failed`` markers.
+
+For a shell cell the runner reaps the shell with ``os.wait4``, whose resource usage
+covers the shell and every process it waited for: user and system CPU time, the peak
+RSS of the largest of them, and the blocks read from and written to storage (page
+cache hits are not counted). A ``ProcessSampler`` thread walks the process tree every
+``CELL_METRICS_SAMPLE_INTERVAL`` through ``/proc/<pid>/task/<tid>/children`` on Linux,
+counting the distinct processes it sees and the most running at once; processes that
+start and exit between samples are missed, so these are lower bounds.
+
+Tools a cell runs can report remote API calls by appending JSON lines to the file
+named by ``$ANYT_CELL_METRICS``, e.g.
+``{"kind": "remote", "name": "tts", "queue_seconds": 4.2, "wait_seconds": 11.0}``:
+the time a request sat in the provider's queue, and the time the cell spent waiting
+on it in total. The runner sums them into the marker.
+"""
+
+import json
+import resource
+import sys
+import threading
+from pathlib import Path
+
+from config import CELL_METRICS_SAMPLE_INTERVAL
+
+# Filesystem block size used by ru_inblock / ru_oublock on Linux
+_BLOCK_BYTES = 512
+
+
+class ProcessSampler:
+    """Counts the descendants of a process by sampling its process tree in a background thread."""
+
+    def __init__(self, pid: int, interval: float = CELL_METRICS_SAMPLE_INTERVAL) -> None:
+        self.pid = pid
+        self.interval = interval
+        self.seen: set[int] = set()
+        self.max_concurrent = 0
+        self.available = sys.platform.startswith("linux") and Path(f"/proc/{pid}/task").is_dir()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"anyt-sampler-{pid}", daemon=True)
+
+    def _children(self, pid: int) -> list[int]:
+        found: list[int] = []
+        try:
+            for task in Path(f"/proc/{pid}/task").iterdir():
+                found.extend(int(c) for c in (task / "children").read_text().split())
+        except (OSError, ValueError):
+            pass
+        return found
+
+    def sample(self) -> None:
+        current: set[int] = set()
+        stack = [self.pid]
+        while stack:
+            for child in self._children(stack.pop()):
+                if child not in current:
+                    current.add(child)
+                    stack.append(child)
+        self.seen |= current
+        self.max_concurrent = max(self.max_concurrent, len(current))
+
+    def _run(self) -> None:
+        while True:
+            self.sample()
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self) -> "ProcessSampler":
+        if self.available:
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+def read_remote_calls(path: Path) -> dict[str, object] | None:
+    """Sum the remote calls reported to a cell's metrics file. None if nothing was reported."""
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return None
+    calls = 0
+    totals = {"queue_seconds": 0.0, "wait_seconds": 0.0}
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(entry, dict) or entry.get("kind", "remote") != "remote":
+            continue
+        calls += 1
+        for name in totals:
+            value = entry.get(name)
+            if isinstance(value, (int, float)):
+                totals[name] += value
+    if not calls:
+        return None
+    return {"calls": calls, **{name: round(total, 6) for name, total in totals.items()}}
+
+
+def shell_metrics(
+    wall_seconds: float,
+    usage: resource.struct_rusage | None,
+    sampler: ProcessSampler | None = None,
+    remote: dict[str, object] | None = None,
+) -> dict[str, object]:
+    """Metrics for a finished shell cell from its wall time, ``os.wait4`` resource usage and process sampler."""
+    metrics: dict[str, object] = {"wall_seconds": round(wall_seconds, 6)}
+    if usage is not None:
+        user, system = usage.ru_utime, usage.ru_stime
+        metrics.update(
+            cpu_seconds=round(user + system, 6),
+            user_seconds=round(user, 6),
+            system_seconds=round(system, 6),
+            # Bytes on macOS, KiB elsewhere
+            peak_rss_bytes=usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024,
+            bytes_read=usage.ru_inblock * _BLOCK_BYTES,
+            bytes_written=usage.ru_oublock * _BLOCK_BYTES,
+        )
+    if sampler is not None and sampler.available:
+        metrics.update(processes=len(sampler.seen), max_concurrent_processes=sampler.max_concurrent)
+    if remote:
+        metrics["remote"] = remote
+    return metrics
@@ -6,13 +6,88 @@ SKILL_DIR = Path(__file__).resolve().parent.parent
 DEFAULT_OUTPUT_DIR = SKILL_DIR / "output"
 
 SCHEMA_VERSION = "2.0"
+NOTEBOOK_GLOBS = ("*.anyt", "*.anyt.md")
 VALID_CELL_TYPES = {"task", "shell", "input", "note", "break"}
-VALID_CELL_ATTRIBUTES = {"id", "label", "agent", "skip"}
+VALID_CELL_ATTRIBUTES = {"id", "label", "agent", "skip", "after"}
 VALID_AGENT_TYPES = {"claude", "codex", "gemini"}
 ID_PATTERN = r"^[a-z0-9]+(?:[-_][a-z0-9]+)*$"
 
+VALID_FIELD_TYPES = {"text", "textarea", "number", "checkbox", "select", "radio", "multiselect", "file"}
+OPTION_FIELD_TYPES = {"select", "radio", "multiselect"}
+MAX_FORM_SCHEMA_CACHE = 256
+
 STATE_DIR_NAME = ".anyt"
 CELLS_DIR_NAME = "cells"
+PARSE_CACHE_DIR_NAME = "parse-cache"
+TRASH_DIR_NAME = "trash"  # reset cell state waiting to be deleted
+
+# Append-only journal of cell state transitions; marker files are kept as a projection of it
+STATE_JOURNAL_NAME = "state.jsonl"
+
+# Bump when the cached Notebook layout changes so stale entries are ignored
+PARSE_CACHE_FORMAT = 3
+MAX_PARSE_CACHE_ENTRIES = 64
+
+# Cell tag offsets kept in the parse cache for update_notebook.py's splicing editor
+NOTEBOOK_INDEX_FORMAT = 2
+
+# Notebook writers: lock directory (under .anyt/ beside the notebook), seconds to wait for
+# another writer's lock, and hex digits of the SHA-256 content version that edits can be
+# made conditional on
+NOTEBOOK_LOCKS_DIR_NAME = "locks"
+NOTEBOOK_LOCK_TIMEOUT = 10.0
+NOTEBOOK_VERSION_LENGTH = 16
+
+# Notebook daemon (notebook_daemon.py) socket and client switches
+DAEMON_SOCKET_ENV = "ANYT_NOTEBOOK_SOCKET"
+DAEMON_DISABLE_ENV = "ANYT_NOTEBOOK_NO_DAEMON"
+DAEMON_WATCH_INTERVAL = 1.0
+
+# Parallel runner (run_notebook.py): worker default, cell types nothing runs past,
+# and exit codes for a paused run (matching notebook-cli where it has one)
+DEFAULT_RUN_WORKERS = 4
+BARRIER_CELL_TYPES = ("break", "input")
+EXIT_WAITING_INPUT = 10
+EXIT_WAITING_BREAK = 11
+EXIT_WAITING_TASK = 12
+
+# Shell cell output logs (cell_log.py): active segment name, rotation size, compression of
+# rotated segments ("auto" = zstd if the zstandard package is installed, else gzip), and
+# the tail index kept beside the log
+LOG_FILE_NAME = "output.log"
+LOG_SEGMENT_BYTES = 8 << 20
+LOG_COMPRESSION = "auto"
+LOG_TAIL_LINES = 200
+LOG_TAIL_FLUSH_INTERVAL = 1.0
+LOG_INDEX_STRIDE = 256  # output.log.idx holds the offset of every 256th line
+LOG_FOLLOW_POLL_INTERVAL = 0.25  # follow mode without inotify
+
+# Content-addressed cell results (result_cache.py); bump the format to invalidate every key
+RESULT_CACHE_DIR_NAME = "result-cache"
+RESULT_CACHE_FORMAT = 1
+
+# Deduplicated blob store (blob_store.py): object directory, the environment variable that
+# points several workspaces at one store, how objects are linked into the workspace
+# ("auto" = reflink if the filesystem can clone, else copy only before the file is
+# overwritten; never a hardlink), and the smallest file worth storing
+OBJECTS_DIR_NAME = "objects"
+BLOB_STORE_ENV = "ANYT_OBJECT_STORE"
+BLOB_LINK_MODE = "auto"
+BLOB_MIN_BYTES = 64 << 10
+
+# Cell metrics (cell_metrics.py): how often a running shell cell's process tree is
+# sampled, and the environment variable naming the file tools report remote calls to
+CELL_METRICS_SAMPLE_INTERVAL = 0.1
+CELL_METRICS_ENV = "ANYT_CELL_METRICS"
+CELL_METRICS_FILE_NAME = "metrics.jsonl"
+
+# Run history (run_history.py): snapshots of each run's cell state under .anyt/runs, the
+# file naming the latest run, and the largest state file copied into a snapshot
+RUNS_DIR_NAME = "runs"
+RUN_OBJECTS_DIR_NAME = "objects"
+RUN_CURRENT_NAME = "current"
+RUN_HISTORY_FORMAT = 1
+RUN_SNAPSHOT_MAX_BYTES = 256 << 10
 
 # Completion marker filenames
 MARKER_DONE = ".done"
@@ -39,3 +114,11 @@ class ValidationError(NotebookError):
 
 class ExecutionError(NotebookError):
     """Errors during cell execution."""
+
+
+class DaemonError(NotebookError):
+    """Errors talking to or running the notebook daemon."""
+
+
+class ConflictError(NotebookError):
+    """A notebook edit raced another writer (stale version, or lock not acquired in time)."""
@@ -0,0 +1,141 @@
+"""
+Client side of the notebook daemon (see notebook_daemon.py).
+
+The CLIs call ``forward_cli`` first; when a daemon is listening, the invocation runs
+there against its in-memory state and the captured output is replayed locally. When
+no daemon is reachable it returns None and the CLI runs in-process as before; a
+request that fails after it was sent is reported, never re-run in-process.
+"""
+
+import itertools
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+from pathlib import Path
+
+from config import DAEMON_DISABLE_ENV, DAEMON_SOCKET_ENV, DaemonError
+
+_request_ids = itertools.count(1)
+
+
+def socket_path() -> Path:
+    """Daemon socket: $ANYT_NOTEBOOK_SOCKET, else a per-user socket in the runtime dir.
+
+    Without $XDG_RUNTIME_DIR the socket goes in a per-user 0700 directory under the
+    temp dir rather than directly in the world-writable temp dir.
+    """
+    explicit = os.environ.get(DAEMON_SOCKET_ENV)
+    if explicit:
+        return Path(explicit)
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / f"anyt-notebook-{os.getuid()}.sock"
+    return Path(tempfile.gettempdir()) / f"anyt-notebook-{os.getuid()}" / "anyt-notebook.sock"
+
+
+def _owned_privately(st: os.stat_result) -> bool:
+    return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def check_socket_dir(path: Path) -> None:
+    """Raise PermissionError unless other users cannot swap the socket at ``path``.
+
+    The directory must be ours and not group/world-writable, or sticky (like /tmp),
+    where other users cannot rename or remove our entries.
+    """
+    st = path.parent.stat()
+    if not _owned_privately(st) and not st.st_mode & stat.S_ISVTX:
+        raise PermissionError(f"Daemon socket directory {path.parent} is writable by other users")
+
+
+def prepare_socket_dir(path: Path) -> None:
+    """Create the socket's directory private to this user if missing; DaemonError if it is unsafe."""
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    try:
+        check_socket_dir(path)
+    except PermissionError as e:
+        raise DaemonError(str(e)) from e
+
+
+def _connect(path: Path, timeout: float) -> socket.socket:
+    """Open a connection to the daemon; raises OSError if it is unreachable.
+
+    A socket another user could have planted (wrong owner, group/world-writable, or in
+    a directory they can write to) is refused with PermissionError before connecting.
+    """
+    check_socket_dir(path)
+    st = path.lstat()
+    if not stat.S_ISSOCK(st.st_mode) or not _owned_privately(st):
+        raise PermissionError(f"Refusing untrusted daemon socket {path}")
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(str(path))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def _exchange(sock: socket.socket, method: str, params: dict[str, object] | None):
+    """Send one JSON-RPC 2.0 request over a connected socket and return its result."""
+    request = {"jsonrpc": "2.0", "id": next(_request_ids), "method": method, "params": params or {}}
+    sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+    with sock.makefile("rb") as reader:
+        line = reader.readline()
+
+    if not line:
+        raise DaemonError("Daemon closed the connection without a response")
+
+    response = json.loads(line)
+    if "error" in response:
+        raise DaemonError(response["error"].get("message", "Unknown daemon error"))
+    return response.get("result")
+
+
+def call(method: str, params: dict[str, object] | None = None, path: Path | None = None, timeout: float = 60.0):
+    """Send one JSON-RPC 2.0 request to the daemon and return its result.
+
+    Raises OSError if the daemon is unreachable and DaemonError if it reports an error.
+    """
+    with _connect(path or socket_path(), timeout) as sock:
+        return _exchange(sock, method, params)
+
+
+def forward_cli(tool: str, argv: list[str], stdin: str | None = None) -> int | None:
+    """Run a CLI invocation inside the daemon and replay its output.
+
+    Returns the exit code, or None when the caller should run in-process (no daemon,
+    daemon disabled via $ANYT_NOTEBOOK_NO_DAEMON, an untrusted socket, or the daemon
+    cannot be connected to).
+    Once the request has been sent the daemon may have acted on it, so later failures
+    (timeouts, dropped connections, daemon errors) are reported rather than re-run here.
+    """
+    if os.environ.get(DAEMON_DISABLE_ENV) or not hasattr(socket, "AF_UNIX"):
+        return None
+
+    path = socket_path()
+    if not path.exists():
+        return None
+
+    try:
+        sock = _connect(path, 60.0)
+    except OSError:
+        return None
+
+    try:
+        with sock:
+            result = _exchange(sock, "run", {"tool": tool, "argv": argv, "cwd": os.getcwd(), "stdin": stdin})
+        if not isinstance(result, dict):
+            raise DaemonError(f"Unexpected daemon response: {result!r}")
+    except (OSError, ValueError, DaemonError) as e:
+        print(f"Daemon error: {e}", file=sys.stderr)
+        return 1
+
+    sys.stdout.write(str(result.get("stdout", "")))
+    sys.stderr.write(str(result.get("stderr", "")))
+    return int(result.get("exit_code", 1))
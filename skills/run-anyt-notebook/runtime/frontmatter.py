@@ -0,0 +1,326 @@
+"""
+Typed frontmatter for AnyT Notebook files.
+
+Frontmatter is first read by a line parser that covers the subset of YAML notebooks
+use: scalars (plain multi-line, quoted), one-level mappings (``dependencies``), and
+lists of flat mappings (``agents``). Anything outside that subset (block scalars,
+anchors, flow mappings, deeper nesting) is handed to PyYAML, using the C loader when
+it is compiled in. Without PyYAML such frontmatter is a ParseError rather than being
+partly dropped.
+
+Both paths read plain scalars the same way: as the text written, so ``version: 1.10``
+stays "1.10" and ``default: yes`` is the string "yes"; only an empty value is null.
+They feed the same field tables, built once at import, which coerce values into a
+``Frontmatter`` object and reject fields of the wrong shape.
+"""
+
+import json
+import re
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from config import SCHEMA_VERSION, ParseError
+
+try:
+    import yaml  # pyright: ignore[reportMissingModuleSource]
+except ImportError:
+    yaml = None
+
+_YAML_LOADER: Any = None
+if yaml is not None:
+    _BaseLoader: Any = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+    class _TextLoader(_BaseLoader):
+        """Safe loader that keeps plain scalars as strings, like the line parser."""
+
+    # No int/float/bool/timestamp resolution; an empty plain value is still null
+    _TextLoader.yaml_implicit_resolvers = {}
+    _TextLoader.add_implicit_resolver("tag:yaml.org,2002:null", re.compile(r"^$"), [""])
+    _YAML_LOADER = _TextLoader
+
+
+@dataclass(slots=True)
+class AgentProfile:
+    id: str
+    name: str
+    type: str
+    default: bool = False
+    permission_mode: str | None = None
+    model: str | None = None
+    additional_args: list[str] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class Frontmatter:
+    schema: str = SCHEMA_VERSION
+    name: str = ""
+    description: str | None = None
+    version: str | None = None
+    workdir: str = "anyt_workspace"
+    env_file: str = ".env"
+    dependencies: dict[str, str] = field(default_factory=dict)
+    agents: list[AgentProfile] = field(default_factory=list)
+
+
+# ---------------------------------------------------------------------------
+# Schema
+# ---------------------------------------------------------------------------
+
+
+class _WrongShape(Exception):
+    """Raised by a converter; the caller turns it into a ParseError naming the field."""
+
+
+def _as_str(value: object) -> str:
+    if type(value) is str:
+        return value
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        raise _WrongShape("a string")
+    return str(value)
+
+
+def _as_bool(value: object) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ("true", "false", "yes", "no", "on", "off"):
+        return value.lower() in ("true", "yes", "on")
+    raise _WrongShape("true or false")
+
+
+def _as_str_list(value: object) -> list[str]:
+    if isinstance(value, str):
+        return [value] if value else []
+    if not isinstance(value, list):
+        raise _WrongShape("a list")
+    return [_as_str(v) for v in value]
+
+
+def _as_str_map(value: object) -> dict[str, str]:
+    if not isinstance(value, dict):
+        raise _WrongShape("a mapping")
+    if set(map(type, value)) | set(map(type, value.values())) <= {str}:
+        return value  # type: ignore[return-value]
+    return {str(k): _as_str(v) for k, v in value.items()}
+
+
+# Frontmatter key -> (attribute name, converter)
+_Converter = Callable[[object], Any]
+
+_AGENT_FIELDS: dict[str, tuple[str, _Converter]] = {
+    "id": ("id", _as_str),
+    "name": ("name", _as_str),
+    "type": ("type", _as_str),
+    "default": ("default", _as_bool),
+    "permissionMode": ("permission_mode", _as_str),
+    "model": ("model", _as_str),
+    "additionalArgs": ("additional_args", _as_str_list),
+}
+
+
+def _as_agent(value: object) -> AgentProfile:
+    if not isinstance(value, dict):
+        raise ParseError("Each agent profile in frontmatter must be a mapping")
+    kwargs = _convert(value, _AGENT_FIELDS, "agents[].")
+    try:
+        return AgentProfile(**kwargs)
+    except TypeError:
+        missing = ", ".join(f"'{k}'" for k in ("id", "name", "type") if k not in kwargs)
+        raise ParseError(f"Agent profile in frontmatter is missing {missing}") from None
+
+
+def _as_agents(value: object) -> list[AgentProfile]:
+    if not isinstance(value, list):
+        raise _WrongShape("a list of agent profiles")
+    return [_as_agent(v) for v in value]
+
+
+_FIELDS: dict[str, tuple[str, _Converter]] = {
+    "schema": ("schema", _as_str),
+    "name": ("name", _as_str),
+    "description": ("description", _as_str),
+    "version": ("version", _as_str),
+    "workdir": ("workdir", _as_str),
+    "env_file": ("env_file", _as_str),
+    "dependencies": ("dependencies", _as_str_map),
+    "agents": ("agents", _as_agents),
+}
+
+
+def _convert(data: dict[Any, Any], table: dict[str, tuple[str, _Converter]], prefix: str = "") -> dict[str, Any]:
+    """Apply a field table to a raw mapping, skipping unknown keys and nulls."""
+    kwargs: dict[str, Any] = {}
+    for key, value in data.items():
+        spec = table.get(key)
+        if spec is None or value is None:
+            continue
+        attr, convert = spec
+        if convert is _as_str and type(value) is str:
+            kwargs[attr] = value
+            continue
+        try:
+            kwargs[attr] = convert(value)
+        except _WrongShape as e:
+            raise ParseError(f"Frontmatter field '{prefix}{key}' must be {e}") from None
+    return kwargs
+
+
+def compile_frontmatter(data: dict[str, Any]) -> Frontmatter:
+    """Coerce a raw frontmatter mapping into a Frontmatter. Unknown keys are ignored."""
+    return Frontmatter(**_convert(data, _FIELDS))
+
+
+# ---------------------------------------------------------------------------
+# Line parser (fast path)
+# ---------------------------------------------------------------------------
+
+
+class _NeedsYaml(Exception):
+    """Raised by the line parser on YAML it does not handle."""
+
+
+# First characters that make a value more than a plain scalar (a leading space means extra padding)
+_SPECIAL = frozenset(" \"'|>&*!{[%@`")
+
+
+def _scalar(value: str) -> object:
+    """Parse an inline value: plain text, quoted string, or JSON-style list of strings."""
+    value = value.lstrip()
+    first = value[0]
+    if first in ('"', "'"):
+        inner = value[1:-1]
+        escaped = "\\" in inner if first == '"' else "''" in inner
+        if len(value) >= 2 and value[-1] == first and not escaped:
+            return inner
+    elif first == "[":
+        try:
+            items = json.loads(value)
+        except ValueError:
+            raise _NeedsYaml from None
+        # JSON would read [1.10] as 1.1; YAML keeps the text of unquoted items
+        if isinstance(items, list) and all(type(item) is str for item in items):
+            return items
+    elif first not in _SPECIAL:
+        return _strip_comment(value)
+    raise _NeedsYaml
+
+
+def _strip_comment(value: str) -> str:
+    comment = value.find(" #")
+    return value[:comment].rstrip() if comment != -1 else value
+
+
+def _parse_lines(lines: list[str]) -> dict[str, Any]:
+    """Parse frontmatter lines. Raises _NeedsYaml on YAML outside the supported subset.
+
+    This runs on every notebook load. Entries of the open mapping or agent profile make
+    up the bulk of large blocks, so they are matched first and plain values stored inline.
+    """
+    data: dict[str, Any] = {}
+    key = ""
+    kind = ""  # "scalar", "plain" (foldable scalar), "open" (no value yet), "map", "list"
+    block: Any = None  # the mapping or list being filled for ``key``
+    block_indent = -1
+    fields: dict[str, Any] = {}  # mapping that receives ``k: v`` lines at ``fields_indent``
+    fields_indent = -1
+    special = _SPECIAL
+
+    for line in lines:
+        body = line.strip()
+        if not body or body[0] == "#":
+            continue
+        c = body[0]
+        indent = line.find(c)
+
+        if indent == fields_indent:
+            k, sep, v = body.partition(": ")
+            if sep and c not in special:
+                if v[0] == '"' == v[-1] and v.count('"') == 2 and "\\" not in v:
+                    v = v[1:-1]
+                elif v[0] in special or " #" in v:
+                    v = _scalar(v)
+                fields[k.rstrip()] = v
+                continue
+
+        if c == "-" and (len(body) == 1 or body[1] == " "):
+            # List item, either indented or an indentless sequence at column 0
+            if kind == "open":
+                block = data[key] = []
+                kind = "list"
+                block_indent = indent
+            elif kind != "list" or indent != block_indent:
+                raise _NeedsYaml
+
+            rest = line[indent + 1 :]
+            body = rest.strip()
+            k, sep, v = body.partition(": ")
+            if not sep and body[-1:] == ":":
+                k, sep = body[:-1], ":"
+            if sep and body[0] not in special:
+                fields = {k.rstrip(): _scalar(v) if v and (v[0] in special or " #" in v) else v or None}
+                fields_indent = len(line) - len(rest.lstrip())
+                block.append(fields)
+            else:
+                fields_indent = -1
+                block.append(_scalar(body) if body else None)
+            continue
+
+        k, sep, v = body.partition(": ")
+        if not sep and body[-1] == ":":
+            k, sep = body[:-1], ":"
+        if sep and c not in special:
+            value = _scalar(v) if v and (v[0] in special or " #" in v) else v or None
+            if indent == 0:
+                key = k.rstrip()
+                data[key] = value
+                fields_indent = -1
+                if value is None:
+                    kind = "open"
+                elif value is v or (type(value) is str and v.lstrip()[0] not in ('"', "'")):
+                    kind = "plain"
+                else:
+                    kind = "scalar"
+                continue
+            if kind == "open" and value is not None:
+                block = fields = data[key] = {k.rstrip(): value}
+                kind = "map"
+                block_indent = fields_indent = indent
+                continue
+
+        if kind == "plain" and indent > 0:
+            # Plain scalars may continue on indented lines; YAML folds them with spaces
+            data[key] = f"{data[key]} {_strip_comment(body)}"
+            continue
+
+        raise _NeedsYaml
+
+    return data
+
+
+def _load_yaml(lines: list[str]) -> dict[str, Any]:
+    assert yaml is not None
+    try:
+        data = yaml.load("\n".join(lines), Loader=_YAML_LOADER)
+    except yaml.YAMLError as e:
+        raise ParseError(f"Invalid YAML frontmatter: {e}") from e
+    if data is None:
+        return {}
+    if not isinstance(data, dict):
+        raise ParseError("Frontmatter must be a YAML mapping")
+    return data
+
+
+def parse_frontmatter(lines: list[str]) -> Frontmatter:
+    """Parse the lines between the ``---`` delimiters into a Frontmatter."""
+    try:
+        data = _parse_lines(lines)
+    except _NeedsYaml:
+        if yaml is None:
+            raise ParseError(
+                "Frontmatter uses YAML the built-in parser does not handle (block scalars, anchors, "
+                "flow mappings or deeper nesting); install PyYAML to read it"
+            ) from None
+        data = _load_yaml(lines)
+    return compile_frontmatter(data)
@@ -6,34 +6,66 @@ Run with: uv run --project runtime runtime/manage_state.py <workdir> <command> [
 
 Commands:
   status              Show execution status of all cells
+  stats               Profile durations, CPU, memory, I/O and remote waits from the markers
+  rebuild-index       Rebuild the state journal from the marker files
+  benchmark           Measure state transitions per second in this workspace
+  batch               Apply a JSON list of operations in one transaction
   mark-done           Mark a cell as done
   mark-failed         Mark a cell as failed
   reset               Reset state for a cell or all cells
+  purge               Delete reset cell state still waiting in .anyt/trash
   read-input          Read input cell response
+  save-input          Validate and save an input cell response
+  tail                Print the last lines of a cell's output (--follow to stream new output)
+  head                Print lines of a cell's output from a given line
+  read-range          Print a byte range of a cell's output
 """
 
 import argparse
+import contextlib
 import json
+import os
 import shutil
+import subprocess
 import sys
+import tempfile
+import threading
+import time
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import cast
 
+from cell_log import CellLogWriter, LogReader, follow_log, read_log_tail
 from config import (
     CELLS_DIR_NAME,
+    DAEMON_DISABLE_ENV,
+    LOG_FILE_NAME,
     MARKER_DONE,
     MARKER_FAILED,
     MARKER_SKIPPED,
     STATE_DIR_NAME,
+    STATE_JOURNAL_NAME,
+    TRASH_DIR_NAME,
     ExecutionError,
     NotebookError,
+    ParseError,
+    ValidationError,
 )
+from daemon_client import forward_cli
+from notebook_cache import ResidentCache
+from parse_notebook import FormSchema, build_cell_index, compile_form, load_notebook, validate_form_response
 
 _ERROR_PREFIXES: dict[type[NotebookError], str] = {
     ExecutionError: "Execution error",
+    ParseError: "Parse error",
+    ValidationError: "Validation error",
 }
 
 
+# In-memory cell status index keyed by cell directory; enabled by the notebook daemon
+resident_status: ResidentCache | None = None
+
+
 def _cells_dir(workdir: Path) -> Path:
     return workdir / STATE_DIR_NAME / CELLS_DIR_NAME
 
@@ -42,13 +74,21 @@ def _cell_dir(workdir: Path, cell_id: str) -> Path:
     return _cells_dir(workdir) / cell_id
 
 
+def _journal_path(workdir: Path) -> Path:
+    return workdir / STATE_DIR_NAME / STATE_JOURNAL_NAME
+
+
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def get_cell_status(workdir: Path, cell_id: str) -> str:
-    """Get the status of a cell: 'done', 'failed', 'skipped', or 'pending'."""
-    cell_dir = _cell_dir(workdir, cell_id)
+def _forget_status(cell_dir: Path | None = None) -> None:
+    """Drop resident status entries after a state change (all entries if ``cell_dir`` is None)."""
+    if resident_status is not None:
+        resident_status.invalidate(cell_dir)
+
+
+def _probe_status(cell_dir: Path) -> str:
     if (cell_dir / MARKER_DONE).exists():
         return "done"
     if (cell_dir / MARKER_FAILED).exists():
@@ -58,56 +98,450 @@ def get_cell_status(workdir: Path, cell_id: str) -> str:
     return "pending"
 
 
-def get_all_status(workdir: Path, cell_ids: list[str]) -> list[dict[str, str]]:
-    """Get status for all cells."""
-    return [{"id": cid, "status": get_cell_status(workdir, cid)} for cid in cell_ids]
+def get_cell_status(workdir: Path, cell_id: str) -> str:
+    """Get the status of a cell: 'done', 'failed', 'skipped', or 'pending'.
 
+    The journal is authoritative when the workspace has one (markers are not fsynced and
+    can be stale after a crash), unless the cell's markers changed after it was written.
+    """
+    index = read_index(workdir)
+    if index is not None:
+        return _reconcile(workdir, index, [cell_id])[cell_id]
+    return _marker_status(workdir, cell_id)
 
-def mark_done(
-    workdir: Path, cell_id: str, duration: float | None = None, extra: dict[str, object] | None = None
-) -> None:
-    """Mark a cell as completed successfully."""
+
+def _marker_status(workdir: Path, cell_id: str) -> str:
+    """Status from the cell's marker files alone (workspaces without a journal)."""
     cell_dir = _cell_dir(workdir, cell_id)
-    cell_dir.mkdir(parents=True, exist_ok=True)
+    if resident_status is None:
+        return _probe_status(cell_dir)
 
-    # Remove any existing markers
-    for marker in [MARKER_DONE, MARKER_FAILED, MARKER_SKIPPED]:
-        (cell_dir / marker).unlink(missing_ok=True)
+    # Marker changes bump the cell directory's mtime, so one stat validates the entry
+    cached = resident_status.get(cell_dir)
+    if isinstance(cached, str):
+        return cached
+    signature = ResidentCache.signature(cell_dir)
+    status = _probe_status(cell_dir)
+    if signature is not None:
+        resident_status.put(cell_dir, status, signature)
+    return status
 
-    data: dict[str, object] = {"status": "done", "timestamp": _now_iso()}
-    if duration is not None:
-        data["duration"] = duration
-    if extra:
-        data.update(extra)
 
-    (cell_dir / MARKER_DONE).write_text(json.dumps(data, indent=2), encoding="utf-8")
+def get_all_status(workdir: Path, cell_ids: list[str]) -> list[dict[str, str]]:
+    """Get status for all cells, from one read of the state journal when the workspace has one."""
+    index = read_index(workdir)
+    if index is None:
+        return [{"id": cid, "status": _marker_status(workdir, cid)} for cid in cell_ids]
+    statuses = _reconcile(workdir, index, cell_ids)
+    return [{"id": cid, "status": statuses[cid]} for cid in cell_ids]
+
+
+# ---------------------------------------------------------------------------
+# State journal
+# ---------------------------------------------------------------------------
+#
+# Every transition appends one line, {"cell": id, "status": ..., "timestamp": ...}, to
+# .anyt/state.jsonl. Status "reset" removes the cell; cell "*" with "reset" removes all.
+# The journal is created from the marker files on the first transition in a workspace
+# (or by ``rebuild-index``), so folding it gives every cell's status without reading
+# the markers. Other tools (notebook-cli) still write and delete markers directly, so
+# after updating the markers a commit sets the journal's mtime, and cells whose
+# directory changed at or after that time are read from their markers instead
+# (see ``_reconcile``).
+
+
+def _fold_journal(text: str) -> dict[str, str]:
+    statuses: dict[str, str] = {}
+    for line in text.splitlines():
+        try:
+            entry = json.loads(line)
+            cell_id, status = entry["cell"], entry["status"]
+        except (ValueError, TypeError, KeyError):
+            # A crash mid-append leaves a torn line, and the next append continues it; keep the complete tail
+            start = line.rfind('{"cell"', 1)
+            if start == -1:
+                continue
+            try:
+                entry = json.loads(line[start:])
+                cell_id, status = entry["cell"], entry["status"]
+            except (ValueError, TypeError, KeyError):
+                continue
+        if status != "reset":
+            statuses[cell_id] = status
+        elif cell_id == "*":
+            statuses.clear()
+        else:
+            statuses.pop(cell_id, None)
+    return statuses
+
+
+def read_index(workdir: Path) -> dict[str, str] | None:
+    """Fold the state journal into {cell id: status}. Returns None if the workspace has no journal."""
+    path = _journal_path(workdir)
+    if resident_status is not None:
+        cached = resident_status.get(path)
+        if isinstance(cached, dict):
+            return cached  # type: ignore[return-value]
+
+    signature = ResidentCache.signature(path) if resident_status is not None else None
+    try:
+        text = path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    index = _fold_journal(text)
+    if resident_status is not None and signature is not None:
+        resident_status.put(path, index, signature)
+    return index
 
 
-def mark_failed(workdir: Path, cell_id: str, error: str, duration: float | None = None) -> None:
-    """Mark a cell as failed."""
-    cell_dir = _cell_dir(workdir, cell_id)
-    cell_dir.mkdir(parents=True, exist_ok=True)
+def _mtime_ns(path: Path) -> int | None:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
 
-    for marker in [MARKER_DONE, MARKER_FAILED, MARKER_SKIPPED]:
-        (cell_dir / marker).unlink(missing_ok=True)
 
-    data: dict[str, object] = {"status": "failed", "error": error, "timestamp": _now_iso()}
-    if duration is not None:
-        data["duration"] = duration
+def _reconcile(workdir: Path, index: dict[str, str], cell_ids: list[str] | None = None) -> dict[str, str]:
+    """Statuses of ``cell_ids`` (every known cell if None) from the folded journal, corrected for markers
+    changed outside ``StateWriter`` since the journal's mtime.
 
-    (cell_dir / MARKER_FAILED).write_text(json.dumps(data, indent=2), encoding="utf-8")
+    A cell directory modified at or after that time, or created or deleted since (the
+    cells directory itself changed), is read from its markers. Equal mtimes count as
+    changed, so a write in the same clock tick is never missed; rereading markers we
+    wrote ourselves gives the same answer.
+    """
+    seal = _mtime_ns(_journal_path(workdir))
+    if seal is None:
+        return {cid: index.get(cid, "pending") for cid in cell_ids or index}
+    cells_dir = _cells_dir(workdir)
+    listing = _mtime_ns(cells_dir)
+    if listing is None:
+        # No cell directories: all were removed after the journal was written, or none written yet
+        moved = (_mtime_ns(cells_dir.parent) or 0) >= seal
+        return {cid: "pending" if moved else index.get(cid, "pending") for cid in cell_ids or index}
+    listing_changed = listing >= seal
+    if cell_ids is None:
+        cell_ids = sorted(set(index) | set(_list_cell_dirs(workdir)))
+
+    statuses: dict[str, str] = {}
+    for cid in cell_ids:
+        mtime = _mtime_ns(cells_dir / cid)
+        if mtime is None:
+            statuses[cid] = "pending" if listing_changed else index.get(cid, "pending")
+        elif mtime >= seal:
+            statuses[cid] = _marker_status(workdir, cid)
+        else:
+            statuses[cid] = index.get(cid, "pending")
+    return statuses
+
+
+def list_status(workdir: Path) -> dict[str, str]:
+    """Status of every cell the workspace knows about, from the journal or, without one, the cell directories."""
+    index = read_index(workdir)
+    if index is None:
+        return {cid: _marker_status(workdir, cid) for cid in _list_cell_dirs(workdir)}
+    return {cid: status for cid, status in _reconcile(workdir, index).items() if status != "pending"}
+
+
+def _list_cell_dirs(workdir: Path) -> list[str]:
+    cells_dir = _cells_dir(workdir)
+    return sorted(d.name for d in cells_dir.iterdir() if d.is_dir()) if cells_dir.exists() else []
 
 
-def mark_skipped(workdir: Path, cell_id: str) -> None:
-    """Mark a cell as skipped."""
-    cell_dir = _cell_dir(workdir, cell_id)
-    cell_dir.mkdir(parents=True, exist_ok=True)
+def rebuild_index(workdir: Path) -> dict[str, str]:
+    """Rewrite the state journal from the marker files, one line per cell directory."""
+    index = {cid: _probe_status(_cell_dir(workdir, cid)) for cid in _list_cell_dirs(workdir)}
+    timestamp = _now_iso()
+    lines = [json.dumps({"cell": cid, "status": st, "timestamp": timestamp}) + "\n" for cid, st in index.items()]
+    _write_atomic(_journal_path(workdir), "".join(lines), durable=True)
+    return index
+
+
+def _write_atomic(path: Path, text: str, durable: bool = False) -> None:
+    """Replace ``path`` by writing a temporary file and renaming it, so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
 
-    for marker in [MARKER_DONE, MARKER_FAILED, MARKER_SKIPPED]:
-        (cell_dir / marker).unlink(missing_ok=True)
 
-    data = {"status": "skipped", "timestamp": _now_iso()}
-    (cell_dir / MARKER_SKIPPED).write_text(json.dumps(data, indent=2), encoding="utf-8")
+def _append_journal(workdir: Path, lines: list[str]) -> None:
+    """Append lines to the state journal with one write and one fsync, seeding the journal if it is missing."""
+    path = _journal_path(workdir)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+    except FileNotFoundError:
+        rebuild_index(workdir)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+    try:
+        os.write(fd, "".join(lines).encode("utf-8"))
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# ---------------------------------------------------------------------------
+# Trash
+# ---------------------------------------------------------------------------
+#
+# Resetting renames cell directories into .anyt/trash/, which takes the same time
+# however many logs and media files they hold, and deletes them afterwards: in a
+# background thread for long-lived processes (the daemon, the runner), and in a
+# detached ``purge`` process for the CLI, which exits right away.
+
+# Trash directory -> whether another pass was requested while its purge thread runs
+_purgers: dict[Path, bool] = {}
+_purge_lock = threading.Lock()
+
+
+def _trash_dir(workdir: Path) -> Path:
+    return workdir / STATE_DIR_NAME / TRASH_DIR_NAME
+
+
+def _move_to_trash(workdir: Path, path: Path) -> bool:
+    """Rename a directory into the trash. Returns False if it did not exist."""
+    trash = _trash_dir(workdir)
+    target = trash / f"{path.name}.{time.time_ns()}.{os.getpid()}.{threading.get_ident()}"
+    try:
+        os.rename(path, target)
+    except FileNotFoundError:
+        if not path.exists():
+            return False
+        trash.mkdir(parents=True, exist_ok=True)
+        os.rename(path, target)
+    return True
+
+
+def purge_trash(workdir: Path) -> int:
+    """Delete everything in the trash now. Returns how many entries were removed."""
+    try:
+        entries = list(_trash_dir(workdir).iterdir())
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if entry.is_dir() and not entry.is_symlink():
+            shutil.rmtree(entry, ignore_errors=True)
+        else:
+            entry.unlink(missing_ok=True)
+    return len(entries)
+
+
+def _purge_loop(workdir: Path) -> None:
+    trash = _trash_dir(workdir)
+    while True:
+        purge_trash(workdir)
+        with _purge_lock:
+            if not _purgers[trash]:
+                del _purgers[trash]
+                return
+            _purgers[trash] = False
+
+
+def purge_in_background(workdir: Path) -> None:
+    """Empty the trash in a daemon thread, one per workspace; entries added meanwhile are picked up too."""
+    trash = _trash_dir(workdir)
+    with _purge_lock:
+        if trash in _purgers:
+            _purgers[trash] = True
+            return
+        _purgers[trash] = False
+    threading.Thread(target=_purge_loop, args=(workdir,), name="anyt-purge", daemon=True).start()
+
+
+def spawn_purge(workdir: Path) -> None:
+    """Empty the trash in a detached process that outlives this one."""
+    env = {**os.environ, DAEMON_DISABLE_ENV: "1"}
+    with contextlib.suppress(OSError):
+        subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve()), str(workdir), "purge"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env=env,
+            start_new_session=True,
+        )
+
+
+# ---------------------------------------------------------------------------
+# State transitions
+# ---------------------------------------------------------------------------
+
+_MARKERS = {"done": MARKER_DONE, "failed": MARKER_FAILED, "skipped": MARKER_SKIPPED}
+
+
+class StateWriter:
+    """Buffers cell transitions and commits them as one transaction.
+
+    ``commit()`` appends every buffered transition to the journal with a single write
+    and fsync; that is the commit point. The marker files are then updated by writing a
+    temporary file and renaming it over the marker, so a cell always has a whole marker
+    and a crash leaves at worst a stale marker, which ``get_cell_status`` and
+    ``read_marker`` ignore in favour of the journal.
+
+    File writes buffered with ``save_file`` are applied in order with the transitions,
+    so a batch that resets a cell and then saves its output keeps the output. They are
+    not journaled; pass ``durable=True`` for files that must survive a crash once
+    ``commit()`` returns.
+
+    Thread-safe: the parallel runner shares one writer between workers and commits
+    whatever has finished with one fsync. As a context manager it commits on exit
+    unless the block raised.
+    """
+
+    def __init__(self, workdir: Path) -> None:
+        self.workdir = workdir
+        # (cell id, status or "file", marker data or (file name, text, durable)); status "reset" has no payload
+        self._pending: list[tuple[str, str, object]] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "StateWriter":
+        return self
+
+    def __exit__(self, exc_type: object, exc: object, tb: object) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+    def _add(self, cell_id: str, status: str, payload: object = None) -> None:
+        with self._lock:
+            self._pending.append((cell_id, status, payload))
+
+    def mark_done(
+        self, cell_id: str, duration: float | None = None, extra: dict[str, object] | None = None
+    ) -> dict[str, object]:
+        """Buffer a transition to done. Returns the marker data that will be written."""
+        data: dict[str, object] = {"status": "done", "timestamp": _now_iso()}
+        if duration is not None:
+            data["duration"] = duration
+        if extra:
+            data.update(extra)
+        self._add(cell_id, "done", data)
+        return data
+
+    def mark_failed(
+        self, cell_id: str, error: str, duration: float | None = None, extra: dict[str, object] | None = None
+    ) -> dict[str, object]:
+        """Buffer a transition to failed. Returns the marker data that will be written."""
+        data: dict[str, object] = {"status": "failed", "error": error, "timestamp": _now_iso()}
+        if duration is not None:
+            data["duration"] = duration
+        if extra:
+            data.update(extra)
+        self._add(cell_id, "failed", data)
+        return data
+
+    def mark_skipped(self, cell_id: str) -> dict[str, object]:
+        """Buffer a transition to skipped. Returns the marker data that will be written."""
+        data: dict[str, object] = {"status": "skipped", "timestamp": _now_iso()}
+        self._add(cell_id, "skipped", data)
+        return data
+
+    def save_file(self, cell_id: str, name: str, text: str, durable: bool = False) -> None:
+        """Buffer a write of a file in the cell's state directory (not journaled; fsynced if ``durable``)."""
+        self._add(cell_id, "file", (name, text, durable))
+
+    def reset(self, cell_id: str) -> None:
+        self._add(cell_id, "reset")
+
+    def reset_all(self) -> None:
+        self._add("*", "reset")
+
+    def discard(self) -> None:
+        with self._lock:
+            self._pending = []
+
+    def commit(self) -> int:
+        """Make the buffered transitions durable and update the marker files. Returns how many were committed."""
+        with self._lock:
+            ops, self._pending = self._pending, []
+        if not ops:
+            return 0
+
+        timestamp = _now_iso()
+        lines = [
+            json.dumps({"cell": cid, "status": status, "timestamp": timestamp}) + "\n"
+            for cid, status, _ in ops
+            if status != "file"
+        ]
+        if lines:
+            _append_journal(self.workdir, lines)
+
+        trashed = False
+        for cell_id, status, payload in ops:
+            if cell_id == "*":
+                trashed |= _move_to_trash(self.workdir, _cells_dir(self.workdir))
+                _forget_status()
+                continue
+            cell_dir = _cell_dir(self.workdir, cell_id)
+            if status == "reset":
+                trashed |= _move_to_trash(self.workdir, cell_dir)
+            elif status == "file":
+                name, text, durable = cast(tuple[str, str, bool], payload)
+                if name == LOG_FILE_NAME:
+                    # Same layout as streamed output: segments, tail and line index
+                    with CellLogWriter(self.workdir, cell_id) as log:
+                        log.write(text)
+                else:
+                    _write_atomic(cell_dir / name, text, durable=durable)
+            else:
+                name = _MARKERS[status]
+                _write_atomic(cell_dir / name, json.dumps(payload, indent=2))
+                for other in _MARKERS.values():
+                    if other != name:
+                        (cell_dir / other).unlink(missing_ok=True)
+            _forget_status(cell_dir)
+        if lines:
+            # The markers now match the journal; later marker changes are someone else's
+            with contextlib.suppress(OSError):
+                os.utime(_journal_path(self.workdir))
+        if trashed:
+            purge_in_background(self.workdir)
+        return len(ops)
+
+
+def read_marker(workdir: Path, cell_id: str, status: str | None = None) -> dict[str, object] | None:
+    """Read a cell's completion marker (.done, .failed or .skipped). Returns None if the cell is pending.
+
+    The status comes from ``get_cell_status`` (or ``status``, when the caller already has
+    it from ``get_all_status``), so a marker the journal has overridden is ignored; if the
+    journal's marker was lost in a crash only ``{"status": ...}`` is returned.
+    """
+    if status is None:
+        status = get_cell_status(workdir, cell_id)
+    if status == "pending":
+        return None
+    try:
+        data = json.loads((_cell_dir(workdir, cell_id) / _MARKERS[status]).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"status": status}  # missing or emptied by a crash before the rename reached disk
+    return data if isinstance(data, dict) and data.get("status") == status else {"status": status}
+
+
+def mark_done(
+    workdir: Path, cell_id: str, duration: float | None = None, extra: dict[str, object] | None = None
+) -> None:
+    """Mark a cell as completed successfully."""
+    with StateWriter(workdir) as state:
+        state.mark_done(cell_id, duration, extra)
+
+
+def mark_failed(
+    workdir: Path, cell_id: str, error: str, duration: float | None = None, extra: dict[str, object] | None = None
+) -> None:
+    """Mark a cell as failed."""
+    with StateWriter(workdir) as state:
+        state.mark_failed(cell_id, error, duration, extra)
+
+
+def mark_skipped(workdir: Path, cell_id: str) -> None:
+    """Mark a cell as skipped."""
+    with StateWriter(workdir) as state:
+        state.mark_skipped(cell_id)
 
 
 def save_shell_script(workdir: Path, cell_id: str, script: str) -> None:
@@ -118,10 +552,9 @@ def save_shell_script(workdir: Path, cell_id: str, script: str) -> None:
 
 
 def save_shell_output(workdir: Path, cell_id: str, output: str) -> None:
-    """Save shell cell output."""
-    cell_dir = _cell_dir(workdir, cell_id)
-    cell_dir.mkdir(parents=True, exist_ok=True)
-    (cell_dir / "output.log").write_text(output, encoding="utf-8")
+    """Save shell cell output, rotated and compressed like a streamed log if it is large."""
+    with CellLogWriter(workdir, cell_id) as log:
+        log.write(output)
 
 
 def save_task_description(workdir: Path, cell_id: str, description: str) -> None:
@@ -138,12 +571,19 @@ def save_task_summary(workdir: Path, cell_id: str, summary: str) -> None:
     (cell_dir / "summary.md").write_text(summary, encoding="utf-8")
 
 
-def save_input_response(workdir: Path, cell_id: str, response: dict[str, object]) -> None:
-    """Save input cell response."""
+def save_input_response(
+    workdir: Path, cell_id: str, response: dict[str, object], schema: FormSchema | None = None
+) -> None:
+    """Save input cell response. With a compiled form schema, invalid responses are rejected before writing."""
+    if schema is not None:
+        errors = validate_form_response(schema, response)
+        if errors:
+            raise ValidationError(f"Invalid response for input cell '{cell_id}': {'; '.join(errors)}")
+
     cell_dir = _cell_dir(workdir, cell_id)
     cell_dir.mkdir(parents=True, exist_ok=True)
     data = {"values": response, "timestamp": _now_iso()}
-    (cell_dir / "response.json").write_text(json.dumps(data, indent=2), encoding="utf-8")
+    _write_atomic(cell_dir / "response.json", json.dumps(data, indent=2), durable=True)
 
 
 def read_input_response(workdir: Path, cell_id: str) -> dict[str, object] | None:
@@ -157,19 +597,291 @@ def read_input_response(workdir: Path, cell_id: str) -> dict[str, object] | None
 
 def reset_cell(workdir: Path, cell_id: str) -> None:
     """Reset state for a single cell."""
-    cell_dir = _cell_dir(workdir, cell_id)
-    if cell_dir.exists():
-        shutil.rmtree(cell_dir)
+    with StateWriter(workdir) as state:
+        state.reset(cell_id)
 
 
 def reset_all(workdir: Path) -> None:
     """Reset state for all cells."""
-    cells_dir = _cells_dir(workdir)
-    if cells_dir.exists():
-        shutil.rmtree(cells_dir)
+    with StateWriter(workdir) as state:
+        state.reset_all()
+
+
+# ---------------------------------------------------------------------------
+# Batch operations
+# ---------------------------------------------------------------------------
+
+# Batch op -> (required fields, optional fields); field name -> accepted JSON types
+_BATCH_FIELD_TYPES: dict[str, tuple[type, ...]] = {
+    "cell": (str,),
+    "duration": (int, float),
+    "error": (str,),
+    "output": (str,),
+    "values": (dict,),
+    "cells": (list,),
+    "metrics": (dict,),
+}
+STATE_BATCH_OPS: dict[str, tuple[tuple[str, ...], tuple[str, ...]]] = {
+    "mark-done": (("cell",), ("duration", "metrics")),
+    "mark-failed": (("cell", "error"), ("duration", "metrics")),
+    "mark-skipped": (("cell",), ()),
+    "reset": ((), ("cell",)),
+    "save-output": (("cell", "output"), ()),
+    "save-input": (("cell", "values"), ()),
+    "status": ((), ("cells",)),
+    "read-marker": (("cell",), ()),
+    "read-input": (("cell",), ()),
+}
+
+
+def _check_batch_op(position: int, op: object) -> dict[str, object]:
+    if not isinstance(op, dict):
+        raise ValidationError(f"Batch op {position} must be a JSON object")
+    name = op.get("op")
+    if not isinstance(name, str) or name not in STATE_BATCH_OPS:
+        raise ValidationError(f"Batch op {position}: unknown op {name!r} (valid: {', '.join(STATE_BATCH_OPS)})")
+    required, optional = STATE_BATCH_OPS[name]
+    for key in required:
+        if key not in op:
+            raise ValidationError(f"Batch op {position} ({name}) is missing '{key}'")
+    for key, value in op.items():
+        if key == "op":
+            continue
+        if key not in required and key not in optional:
+            raise ValidationError(f"Batch op {position} ({name}) does not take '{key}'")
+        if isinstance(value, bool) or not isinstance(value, _BATCH_FIELD_TYPES[key]):
+            raise ValidationError(f"Batch op {position} ({name}): '{key}' has the wrong type")
+    if name == "status" and not all(isinstance(c, str) for c in op.get("cells", [])):  # type: ignore[union-attr]
+        raise ValidationError(f"Batch op {position} (status): 'cells' must be a list of cell IDs")
+    return op
+
+
+def _batch_status(
+    workdir: Path, cell_ids: list[str] | None, markers: dict[str, dict[str, object] | None], cleared: bool
+) -> list[dict[str, str]]:
+    """Cell statuses as committed, overlaid with the transitions buffered so far in a batch."""
+    if cleared:
+        statuses: dict[str, str] = {}
+    elif cell_ids is not None:
+        statuses = {entry["id"]: entry["status"] for entry in get_all_status(workdir, cell_ids)}
+    else:
+        statuses = list_status(workdir)
+    for cid, marker in markers.items():
+        if marker is None:
+            statuses.pop(cid, None)
+        else:
+            statuses[cid] = str(marker["status"])
+    ids = cell_ids if cell_ids is not None else sorted(statuses)
+    return [{"id": cid, "status": statuses.get(cid, "pending")} for cid in ids]
+
+
+def run_state_batch(
+    workdir: Path, ops: list[object], schemas: dict[str, FormSchema] | None = None
+) -> list[dict[str, object]]:
+    """Apply many state operations in one transaction and return one result per op, in order.
+
+    Every op is checked first (and save-input values against ``schemas``, keyed by cell
+    ID), so a bad op rejects the whole batch before anything is written. Transitions and
+    file writes then share one StateWriter commit. Reads see the effect of earlier ops
+    in the same batch.
+    """
+    checked = [_check_batch_op(i, op) for i, op in enumerate(ops)]
+    for i, op in enumerate(checked):
+        schema = (schemas or {}).get(str(op.get("cell"))) if op["op"] == "save-input" else None
+        if schema is not None:
+            errors = validate_form_response(schema, cast(dict[str, object], op["values"]))
+            if errors:
+                raise ValidationError(f"Batch op {i} (save-input): invalid response: {'; '.join(errors)}")
+
+    # What earlier ops in this batch changed: marker per cell (None after a reset) and saved inputs
+    markers: dict[str, dict[str, object] | None] = {}
+    inputs: dict[str, dict[str, object] | None] = {}
+    cleared = False
+
+    results: list[dict[str, object]] = []
+    with StateWriter(workdir) as state:
+        for op in checked:
+            name = str(op["op"])
+            cell_id = str(op.get("cell", ""))
+            duration = cast(float | None, op.get("duration"))
+            extra: dict[str, object] | None = {"metrics": op["metrics"]} if "metrics" in op else None
+            result: object = None
+
+            if name == "mark-done":
+                markers[cell_id] = result = state.mark_done(cell_id, duration, extra)
+            elif name == "mark-failed":
+                markers[cell_id] = result = state.mark_failed(cell_id, str(op["error"]), duration, extra)
+            elif name == "mark-skipped":
+                markers[cell_id] = result = state.mark_skipped(cell_id)
+            elif name == "reset" and "cell" in op:
+                state.reset(cell_id)
+                markers[cell_id] = inputs[cell_id] = None
+            elif name == "reset":
+                state.reset_all()
+                markers.clear()
+                inputs.clear()
+                cleared = True
+            elif name == "save-output":
+                state.save_file(cell_id, LOG_FILE_NAME, str(op["output"]))
+            elif name == "save-input":
+                values = cast(dict[str, object], op["values"])
+                data = {"values": values, "timestamp": _now_iso()}
+                # As durable as save_input_response: a user's answer cannot be recomputed
+                state.save_file(cell_id, "response.json", json.dumps(data, indent=2), durable=True)
+                inputs[cell_id] = values
+            elif name == "status":
+                result = _batch_status(workdir, cast(list[str] | None, op.get("cells")), markers, cleared)
+            elif name == "read-marker":
+                if cell_id in markers:
+                    result = markers[cell_id]
+                elif not cleared:
+                    result = read_marker(workdir, cell_id)
+            elif name == "read-input":
+                if cell_id in inputs:
+                    result = inputs[cell_id]
+                elif not cleared:
+                    result = read_input_response(workdir, cell_id)
+
+            entry: dict[str, object] = {"op": name}
+            if "cell" in op:
+                entry["cell"] = cell_id
+            entry["result"] = result
+            results.append(entry)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Run profile
+# ---------------------------------------------------------------------------
+
+# Metrics summed over cells in the profile; peak RSS is a maximum instead
+_SUMMED_METRICS = ("cpu_seconds", "bytes_read", "bytes_written", "processes")
+
+
+def _parse_time(value: object) -> datetime | None:
+    try:
+        return datetime.fromisoformat(str(value)) if value else None
+    except ValueError:
+        return None
 
 
-def main() -> int:
+def notebook_stats(workdir: Path, cell_ids: list[str] | None = None) -> dict[str, object]:
+    """Aggregate the durations and metrics in the cells' markers into a profile of where run time went.
+
+    Cells are listed longest first with their share of the summed duration. ``span_seconds``
+    runs from the first start to the last finish, so ``parallelism`` (summed duration over
+    span) shows how much cells overlapped.
+    """
+    ids = cell_ids if cell_ids is not None else sorted(list_status(workdir))
+    rows: list[dict[str, object]] = []
+    totals: dict[str, float] = dict.fromkeys(("duration_seconds", *_SUMMED_METRICS), 0.0)
+    remote = {"calls": 0.0, "queue_seconds": 0.0, "wait_seconds": 0.0}
+    peak_rss = 0
+    starts: list[datetime] = []
+    finishes: list[datetime] = []
+    for entry in get_all_status(workdir, ids):
+        cid = entry["id"]
+        marker = read_marker(workdir, cid, entry["status"]) or {"status": "pending"}
+        duration = marker.get("duration")
+        metrics = marker.get("metrics")
+        metrics = metrics if isinstance(metrics, dict) else {}
+        row: dict[str, object] = {"id": cid, "status": marker.get("status"), "duration": duration}
+        if marker.get("cached"):
+            row["cached"] = True
+        row.update(metrics)
+        rows.append(row)
+
+        if isinstance(duration, (int, float)) and not marker.get("cached"):
+            totals["duration_seconds"] += duration
+        for name in _SUMMED_METRICS:
+            value = metrics.get(name)
+            if isinstance(value, (int, float)):
+                totals[name] += value
+        rss = metrics.get("peak_rss_bytes")
+        if isinstance(rss, int):
+            peak_rss = max(peak_rss, rss)
+        calls = metrics.get("remote")
+        if isinstance(calls, dict):
+            for name in remote:
+                value = calls.get(name)
+                if isinstance(value, (int, float)):
+                    remote[name] += value
+        started, finished = _parse_time(marker.get("started_at")), _parse_time(marker.get("finished_at"))
+        if started and finished:
+            starts.append(started)
+            finishes.append(finished)
+
+    # Cached cells keep the duration of the run that produced them but took no time in this one
+    def _spent(row: dict[str, object]) -> float:
+        duration = row["duration"]
+        if row.get("cached") or not isinstance(duration, (int, float)):
+            return 0.0 if isinstance(duration, (int, float)) else -1.0
+        return float(duration)
+
+    total = totals["duration_seconds"]
+    for row in rows:
+        row["share"] = round(max(_spent(row), 0.0) / total, 4) if total else 0.0
+    rows.sort(key=_spent, reverse=True)
+
+    span = (max(finishes) - min(starts)).total_seconds() if starts else 0.0
+    summary: dict[str, object] = {
+        name: round(value, 6) if name.endswith("_seconds") else int(value) for name, value in totals.items()
+    }
+    summary.update(
+        cells=len(rows),
+        span_seconds=round(span, 6),
+        parallelism=round(total / span, 3) if span > 0 else None,
+        cpu_utilization=round(totals["cpu_seconds"] / total, 3) if total else None,
+        peak_rss_bytes=peak_rss,
+        remote={"calls": int(remote["calls"]), **{k: round(v, 6) for k, v in remote.items() if k != "calls"}},
+    )
+    return {"totals": summary, "cells": rows}
+
+
+def benchmark_transitions(workdir: Path, cells: int, group: int) -> dict[str, object]:
+    """Time ``cells`` transitions committed one at a time, then in groups, in a scratch workspace under ``workdir``."""
+    workdir.mkdir(parents=True, exist_ok=True)
+    result: dict[str, object] = {"cells": cells, "group": group}
+    with tempfile.TemporaryDirectory(prefix=".state-bench-", dir=workdir) as scratch:
+        for mode in ("single", "grouped"):
+            bench_dir = Path(scratch) / mode
+            state = StateWriter(bench_dir)
+            start = time.perf_counter()
+            for i in range(cells):
+                state.mark_done(f"cell-{i}", 0.0)
+                if mode == "single" or (i + 1) % group == 0:
+                    state.commit()
+            state.commit()
+            seconds = time.perf_counter() - start
+            result[mode] = {"seconds": round(seconds, 6), "per_second": round(cells / seconds, 1)}
+    return result
+
+
+def _write_bytes(data: bytes) -> None:
+    """Write raw output bytes to stdout (decoded if stdout is captured as text)."""
+    buffer = getattr(sys.stdout, "buffer", None)
+    if buffer is not None:
+        sys.stdout.flush()
+        buffer.write(data)
+        buffer.flush()
+    else:
+        sys.stdout.write(data.decode("utf-8", errors="replace"))
+
+
+def _metrics_arg(text: str | None) -> dict[str, object] | None:
+    """Marker fields for a --metrics option: None when not given."""
+    if text is None:
+        return None
+    try:
+        metrics = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValidationError(f"--metrics is not valid JSON: {e}") from e
+    if not isinstance(metrics, dict):
+        raise ValidationError("--metrics must be a JSON object")
+    return {"metrics": metrics}
+
+
+def main(argv: list[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description="Manage AnyT Notebook execution state")
     parser.add_argument("workdir", help="Notebook working directory")
 
@@ -179,26 +891,90 @@ def main() -> int:
     status_parser = subparsers.add_parser("status", help="Show execution status")
     status_parser.add_argument("--cells", nargs="+", help="Cell IDs to check (all if omitted)")
 
+    # stats command
+    stats_parser = subparsers.add_parser("stats", help="Profile where run time went, from the cells' markers")
+    stats_parser.add_argument("--notebook", help="Notebook file; profile its cells (all cells with state if omitted)")
+
+    # rebuild-index command
+    subparsers.add_parser("rebuild-index", help="Rebuild the state journal from marker files")
+
+    # batch command
+    batch_parser = subparsers.add_parser("batch", help="Apply many operations in one transaction")
+    batch_parser.add_argument(
+        "ops",
+        nargs="?",
+        help='JSON list of operations, e.g. [{"op": "reset", "cell": "a"}, {"op": "status"}] '
+        f"(ops: {', '.join(STATE_BATCH_OPS)}). Read from stdin if omitted.",
+    )
+    batch_parser.add_argument("--notebook", help="Notebook file; validates save-input values against the cells' forms")
+
+    # benchmark command
+    bench_parser = subparsers.add_parser("benchmark", help="Measure state transitions per second")
+    bench_parser.add_argument("--cells", type=int, default=500, help="Transitions to time per mode (default: 500)")
+    bench_parser.add_argument("--group", type=int, default=50, help="Transitions per grouped commit (default: 50)")
+
     # mark-done command
     done_parser = subparsers.add_parser("mark-done", help="Mark a cell as done")
     done_parser.add_argument("--cell", required=True, help="Cell ID")
     done_parser.add_argument("--duration", type=float, help="Duration in seconds")
+    done_parser.add_argument("--metrics", help="Metrics as a JSON object, stored in the marker")
 
     # mark-failed command
     failed_parser = subparsers.add_parser("mark-failed", help="Mark a cell as failed")
     failed_parser.add_argument("--cell", required=True, help="Cell ID")
     failed_parser.add_argument("--error", required=True, help="Error message")
     failed_parser.add_argument("--duration", type=float, help="Duration in seconds")
+    failed_parser.add_argument("--metrics", help="Metrics as a JSON object, stored in the marker")
 
     # read-input command
     input_parser = subparsers.add_parser("read-input", help="Read input cell response")
     input_parser.add_argument("--cell", required=True, help="Input cell ID")
 
+    # save-input command
+    save_input_parser = subparsers.add_parser("save-input", help="Save an input cell response")
+    save_input_parser.add_argument("--cell", required=True, help="Input cell ID")
+    save_input_parser.add_argument("--values", required=True, help="Response values as a JSON object")
+    save_input_parser.add_argument("--notebook", help="Notebook file; validates the values against the cell's form")
+
+    # tail command
+    tail_parser = subparsers.add_parser("tail", help="Print the last lines of a cell's output")
+    tail_parser.add_argument("--cell", required=True, help="Cell ID")
+    tail_parser.add_argument("-n", "--lines", type=int, default=20, help="Number of lines (default: 20)")
+    tail_parser.add_argument(
+        "--follow", "-f", action="store_true", help="Keep printing new output until the cell finishes"
+    )
+    tail_parser.add_argument("--timeout", type=float, help="Stop following after this many seconds")
+
+    # head command
+    head_parser = subparsers.add_parser("head", help="Print lines of a cell's output")
+    head_parser.add_argument("--cell", required=True, help="Cell ID")
+    head_parser.add_argument("-n", "--lines", type=int, default=20, help="Number of lines (default: 20)")
+    head_parser.add_argument("--skip", type=int, default=0, help="Lines to skip first (default: 0)")
+
+    # read-range command
+    range_parser = subparsers.add_parser("read-range", help="Print a byte range of a cell's output")
+    range_parser.add_argument("--cell", required=True, help="Cell ID")
+    range_parser.add_argument("--start", type=int, default=0, help="First byte (default: 0)")
+    range_parser.add_argument("--end", type=int, help="End byte, exclusive (default: end of output)")
+
     # reset command
     reset_parser = subparsers.add_parser("reset", help="Reset cell state")
     reset_parser.add_argument("--cell", help="Cell ID (omit to reset all)")
 
-    args = parser.parse_args()
+    # purge command
+    subparsers.add_parser("purge", help="Delete reset cell state waiting in the trash")
+
+    args = parser.parse_args(argv)
+
+    stdin_text: str | None = None
+    if args.command == "batch" and args.ops is None:
+        stdin_text = args.ops = sys.stdin.read()
+
+    # Output reads stream bytes or block while following, so they always run in this process
+    if argv is None and args.command not in ("tail", "head", "read-range"):
+        forwarded = forward_cli("manage_state", sys.argv[1:], stdin=stdin_text)
+        if forwarded is not None:
+            return forwarded
 
     try:
         workdir = Path(args.workdir)
@@ -207,18 +983,51 @@ def main() -> int:
             if args.cells:
                 result = get_all_status(workdir, args.cells)
             else:
-                # List all cell dirs
-                cells_dir = _cells_dir(workdir)
-                cell_ids = sorted(d.name for d in cells_dir.iterdir() if d.is_dir()) if cells_dir.exists() else []
-                result = get_all_status(workdir, cell_ids)
+                result = [{"id": cid, "status": status} for cid, status in sorted(list_status(workdir).items())]
             print(json.dumps(result, indent=2))
 
+        elif args.command == "batch":
+            try:
+                ops = json.loads(args.ops)
+            except json.JSONDecodeError as e:
+                raise ValidationError(f"Batch operations are not valid JSON: {e}") from e
+            if not isinstance(ops, list):
+                raise ValidationError("Batch operations must be a JSON list")
+            schemas: dict[str, FormSchema] = {}
+            if args.notebook:
+                notebook, _ = load_notebook(Path(args.notebook))
+                index = build_cell_index(notebook)
+                for op in ops:
+                    if isinstance(op, dict) and op.get("op") == "save-input" and isinstance(op.get("cell"), str):
+                        if op["cell"] not in index:
+                            raise ParseError(f"Cell not found: {op['cell']}")
+                        schema = compile_form(notebook.cells[index[op["cell"]]])
+                        if schema is not None:
+                            schemas[op["cell"]] = schema
+            print(json.dumps(run_state_batch(workdir, ops, schemas), indent=2))
+
+        elif args.command == "benchmark":
+            if args.cells < 1 or args.group < 1:
+                parser.error("--cells and --group must be at least 1")
+            print(json.dumps(benchmark_transitions(workdir, args.cells, args.group), indent=2))
+
+        elif args.command == "stats":
+            cell_ids = None
+            if args.notebook:
+                notebook, _ = load_notebook(Path(args.notebook))
+                cell_ids = [cell.id for cell in notebook.cells]
+            print(json.dumps(notebook_stats(workdir, cell_ids), indent=2))
+
+        elif args.command == "rebuild-index":
+            index = rebuild_index(workdir)
+            print(f"Indexed {len(index)} cell(s)")
+
         elif args.command == "mark-done":
-            mark_done(workdir, args.cell, args.duration)
+            mark_done(workdir, args.cell, args.duration, _metrics_arg(args.metrics))
             print(f"Marked '{args.cell}' as done")
 
         elif args.command == "mark-failed":
-            mark_failed(workdir, args.cell, args.error, args.duration)
+            mark_failed(workdir, args.cell, args.error, args.duration, _metrics_arg(args.metrics))
             print(f"Marked '{args.cell}' as failed")
 
         elif args.command == "read-input":
@@ -228,6 +1037,45 @@ def main() -> int:
                 return 1
             print(json.dumps(response, indent=2))
 
+        elif args.command == "save-input":
+            try:
+                values = json.loads(args.values)
+            except json.JSONDecodeError as e:
+                raise ValidationError(f"--values is not valid JSON: {e}") from e
+            if not isinstance(values, dict):
+                raise ValidationError("--values must be a JSON object")
+            schema = None
+            if args.notebook:
+                notebook, _ = load_notebook(Path(args.notebook))
+                index = build_cell_index(notebook)
+                if args.cell not in index:
+                    raise ParseError(f"Cell not found: {args.cell}")
+                schema = compile_form(notebook.cells[index[args.cell]])
+            save_input_response(workdir, args.cell, values, schema)
+            print(f"Saved response for '{args.cell}'")
+
+        elif args.command == "tail":
+            if not args.follow:
+                lines = read_log_tail(workdir, args.cell, args.lines)
+                if lines:
+                    print("\n".join(lines))
+            else:
+                # Tail and follow from the same snapshot so no output is repeated or skipped
+                reader = LogReader(workdir, args.cell)
+                lines = reader.tail(args.lines)
+                if lines:
+                    print("\n".join(lines), flush=True)
+                for chunk in follow_log(workdir, args.cell, reader.size, args.timeout):
+                    _write_bytes(chunk)
+
+        elif args.command == "head":
+            lines = LogReader(workdir, args.cell).head(args.lines, args.skip)
+            if lines:
+                print("\n".join(lines))
+
+        elif args.command == "read-range":
+            _write_bytes(LogReader(workdir, args.cell).read_range(args.start, args.end))
+
         elif args.command == "reset":
             if args.cell:
                 reset_cell(workdir, args.cell)
@@ -235,6 +1083,13 @@ def main() -> int:
             else:
                 reset_all(workdir)
                 print("Reset all cell state")
+            if argv is None:
+                # This process exits now; finish deleting in one that is not tied to it
+                spawn_purge(workdir)
+
+        elif args.command == "purge":
+            removed = purge_trash(workdir)
+            print(f"Purged {removed} trash entr{'y' if removed == 1 else 'ies'}")
 
         return 0
 
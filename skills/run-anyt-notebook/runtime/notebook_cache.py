@@ -0,0 +1,182 @@
+"""
+On-disk cache of parsed notebooks.
+
+Entries live in ``{workdir}/.anyt/parse-cache/`` as one JSON file per notebook path.
+An entry is reused when the notebook's mtime and size are unchanged; if only the
+mtime moved (touch, checkout), a content hash decides. The directory is capped at
+``MAX_PARSE_CACHE_ENTRIES`` files, evicting the least recently used.
+
+``ResidentCache`` is the in-memory counterpart used by the notebook daemon.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from config import (
+    MAX_PARSE_CACHE_ENTRIES,
+    NOTEBOOK_VERSION_LENGTH,
+    PARSE_CACHE_DIR_NAME,
+    PARSE_CACHE_FORMAT,
+    STATE_DIR_NAME,
+)
+
+
+def cache_dir(workdir: Path) -> Path:
+    return workdir / STATE_DIR_NAME / PARSE_CACHE_DIR_NAME
+
+
+def _entry_path(directory: Path, source: Path) -> Path:
+    key = hashlib.sha256(str(source).encode("utf-8")).hexdigest()[:24]
+    return directory / f"{key}.json"
+
+
+def file_hash(path: Path) -> str:
+    """SHA-256 of a file's bytes, read in 1 MiB chunks."""
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def notebook_version(path: Path) -> str:
+    """Content version of a notebook, as checked by ``update_notebook.py --expect-version``."""
+    return file_hash(path)[:NOTEBOOK_VERSION_LENGTH]
+
+
+def read_entry(directory: Path, source: Path) -> dict[str, object] | None:
+    """Return the cached payload for ``source``, or None if missing or stale."""
+    entry_path = _entry_path(directory, source)
+    try:
+        entry = json.loads(entry_path.read_text(encoding="utf-8"))
+        stat = source.stat()
+    except (OSError, ValueError):
+        return None
+
+    if entry.get("format") != PARSE_CACHE_FORMAT or entry.get("path") != str(source):
+        return None
+
+    if entry.get("mtime_ns") != stat.st_mtime_ns or entry.get("size") != stat.st_size:
+        # Same size but a new mtime: fall back to comparing content
+        if entry.get("size") != stat.st_size or entry.get("sha256") != file_hash(source):
+            return None
+        entry["mtime_ns"] = stat.st_mtime_ns
+        _write_atomic(entry_path, entry)
+    else:
+        # Refresh the entry's mtime so eviction sees it as recently used
+        with contextlib.suppress(OSError):
+            os.utime(entry_path)
+
+    payload = entry.get("payload")
+    return payload if isinstance(payload, dict) else None
+
+
+def write_entry(directory: Path, source: Path, payload: dict[str, object], before: os.stat_result, sha256: str) -> None:
+    """Store ``payload`` for ``source``. Failures (read-only workdir, etc.) are ignored.
+
+    ``before`` and ``sha256`` describe the bytes the payload was parsed from and must be
+    taken before reading them. Nothing is written if the file has changed since, so an
+    entry never pairs a new signature with a stale parse.
+    """
+    try:
+        if _stat_key(source.stat()) != _stat_key(before):
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "format": PARSE_CACHE_FORMAT,
+            "path": str(source),
+            "mtime_ns": before.st_mtime_ns,
+            "size": before.st_size,
+            "sha256": sha256,
+            "payload": payload,
+        }
+        _write_atomic(_entry_path(directory, source), entry)
+        _evict(directory)
+    except OSError:
+        pass
+
+
+def _stat_key(stat: os.stat_result) -> tuple[int, int, int]:
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _write_atomic(path: Path, entry: dict[str, object]) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def _evict(directory: Path) -> None:
+    """Drop the least recently used entries beyond ``MAX_PARSE_CACHE_ENTRIES``."""
+    entries = list(directory.glob("*.json"))
+    if len(entries) <= MAX_PARSE_CACHE_ENTRIES:
+        return
+
+    def _mtime(p: Path) -> float:
+        try:
+            return p.stat().st_mtime
+        except OSError:
+            return 0.0
+
+    entries.sort(key=_mtime)
+    for stale in entries[: len(entries) - MAX_PARSE_CACHE_ENTRIES]:
+        stale.unlink(missing_ok=True)
+
+
+class ResidentCache:
+    """In-memory values keyed by file path, dropped when the file's stat signature changes.
+
+    Used by long-running processes (the notebook daemon) to keep parsed notebooks and
+    cell states in memory between requests. Thread-safe.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[Path, tuple[tuple[int, int, int] | None, object]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def signature(path: Path) -> tuple[int, int, int] | None:
+        """Identity of a file's current version: (inode, mtime_ns, size), or None if missing."""
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def get(self, path: Path) -> object | None:
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None or entry[0] != self.signature(path):
+            return None
+        return entry[1]
+
+    def put(self, path: Path, value: object, signature: tuple[int, int, int] | None = None) -> None:
+        """Cache ``value`` for ``path``. Pass the signature taken *before* reading the file."""
+        if signature is None:
+            signature = self.signature(path)
+        with self._lock:
+            self._entries[path] = (signature, value)
+
+    def invalidate(self, path: Path | None = None) -> None:
+        """Drop one entry, or everything when ``path`` is None."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    def stale_paths(self) -> list[Path]:
+        """Paths whose file changed (or disappeared) since they were cached."""
+        with self._lock:
+            snapshot = list(self._entries.items())
+        return [path for path, (signature, _) in snapshot if signature != self.signature(path)]
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Resident notebook daemon serving parse, state and update operations over a Unix socket.
+
+Run with: uv run --project runtime runtime/notebook_daemon.py start|stop|status [--socket PATH]
+
+The daemon keeps parsed notebooks, cell statuses and the editor's cell tag offsets in
+memory, re-validating them against file stat signatures and re-warming changed
+notebooks from a watcher thread.
+parse_notebook.py, manage_state.py and update_notebook.py forward their invocations
+here automatically when the socket exists (set ANYT_NOTEBOOK_NO_DAEMON=1 to opt out).
+
+Protocol: newline-delimited JSON-RPC 2.0. Methods:
+  ping                          Liveness check
+  run       {tool, argv, cwd, stdin}   Run a CLI invocation, returns {exit_code, stdout, stderr}
+  query     {notebook, queries}  Batch queries (same ops as parse_notebook --batch)
+  status    {workdir, cells}     Cell statuses
+  shutdown                      Stop the daemon
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import manage_state
+import parse_notebook
+import update_notebook
+from config import DAEMON_WATCH_INTERVAL, DaemonError, NotebookError
+from daemon_client import call, prepare_socket_dir, socket_path
+from notebook_cache import ResidentCache
+
+_ERROR_PREFIXES: dict[type[NotebookError], str] = {
+    DaemonError: "Daemon error",
+}
+
+_TOOLS: dict[str, Callable[[list[str]], int]] = {
+    "parse_notebook": parse_notebook.main,
+    "manage_state": manage_state.main,
+    "update_notebook": update_notebook.main,
+}
+
+# JSON-RPC 2.0 error codes
+_PARSE_ERROR = -32700
+_METHOD_NOT_FOUND = -32601
+_INVALID_PARAMS = -32602
+_SERVER_ERROR = -32000
+
+
+# ---------------------------------------------------------------------------
+# Request handling
+# ---------------------------------------------------------------------------
+
+
+def _run_tool(tool: str, argv: list[str], cwd: str | None, stdin: str | None) -> dict[str, object]:
+    """Run a CLI main() in-process with captured stdio. Requests are served one at a time."""
+    if tool not in _TOOLS:
+        raise DaemonError(f"Unknown tool '{tool}' (valid: {', '.join(_TOOLS)})")
+
+    stdout, stderr = io.StringIO(), io.StringIO()
+    previous_cwd = os.getcwd()
+    previous_stdin = sys.stdin
+    try:
+        if cwd:
+            os.chdir(cwd)
+        sys.stdin = io.StringIO(stdin or "")
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                exit_code = _TOOLS[tool](argv)
+            except SystemExit as e:  # argparse errors and --help
+                exit_code = e.code if isinstance(e.code, int) else 1
+        if tool == "update_notebook" and argv:
+            # Edits may land within the same mtime tick; never trust the old parse
+            _notebooks().invalidate(Path(argv[0]).resolve())
+    finally:
+        sys.stdin = previous_stdin
+        os.chdir(previous_cwd)
+
+    return {"exit_code": exit_code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+def _notebooks() -> ResidentCache:
+    assert parse_notebook.resident_notebooks is not None
+    return parse_notebook.resident_notebooks
+
+
+def _dispatch(method: str, params: dict[str, object], server: "NotebookDaemon") -> object:
+    if method == "ping":
+        return {"pid": os.getpid()}
+
+    if method == "run":
+        argv = params.get("argv", [])
+        if not isinstance(argv, list):
+            raise TypeError("'argv' must be a list")
+        return _run_tool(
+            str(params.get("tool", "")),
+            [str(a) for a in argv],
+            str(params["cwd"]) if params.get("cwd") else None,
+            str(params["stdin"]) if params.get("stdin") is not None else None,
+        )
+
+    if method == "query":
+        queries = params.get("queries", [])
+        if not isinstance(queries, list):
+            raise TypeError("'queries' must be a list")
+        parsed = [{str(k): str(v) for k, v in q.items()} for q in queries if isinstance(q, dict)]
+        notebook, errors = parse_notebook.load_notebook(Path(str(params["notebook"])))
+        return list(parse_notebook.run_batch(notebook, errors, parsed))
+
+    if method == "status":
+        cells = params.get("cells", [])
+        if not isinstance(cells, list):
+            raise TypeError("'cells' must be a list")
+        return manage_state.get_all_status(Path(str(params["workdir"])), [str(c) for c in cells])
+
+    if method == "shutdown":
+        threading.Thread(target=server.shutdown, daemon=True).start()
+        return {"stopping": True}
+
+    raise LookupError(method)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            self.wfile.write(json.dumps(self._respond(line)).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+    def _respond(self, line: bytes) -> dict[str, object]:
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": _PARSE_ERROR, "message": str(e)}}
+
+        request_id = request.get("id") if isinstance(request, dict) else None
+        if not isinstance(request, dict) or not isinstance(request.get("params", {}), dict):
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": _INVALID_PARAMS, "message": "Bad request"}}
+
+        method = str(request.get("method", ""))
+        try:
+            assert isinstance(self.server, NotebookDaemon)
+            result = _dispatch(method, request.get("params", {}), self.server)
+        except LookupError:
+            error = {"code": _METHOD_NOT_FOUND, "message": f"Unknown method: {method}"}
+            return {"jsonrpc": "2.0", "id": request_id, "error": error}
+        except (TypeError, ValueError) as e:
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": _INVALID_PARAMS, "message": str(e)}}
+        except (NotebookError, OSError) as e:
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": _SERVER_ERROR, "message": str(e)}}
+        except Exception as e:  # a tool bug must not drop the connection and leave the client guessing
+            message = f"{type(e).__name__}: {e}"
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": _SERVER_ERROR, "message": message}}
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+
+class NotebookDaemon(socketserver.UnixStreamServer):
+    """Single-threaded server: requests touch process-wide state (cwd, stdio) and run serially."""
+
+    def __init__(self, path: Path, watch_interval: float = DAEMON_WATCH_INTERVAL) -> None:
+        self.socket_file = path
+        self.watch_interval = watch_interval
+        self._stop_watching = threading.Event()
+        prepare_socket_dir(path)
+        _claim_socket(path)
+        super().__init__(str(path), _Handler)
+        path.chmod(0o600)
+
+        parse_notebook.resident_notebooks = ResidentCache()
+        manage_state.resident_status = ResidentCache()
+        update_notebook.resident_index = ResidentCache()
+
+    def serve_forever(self, poll_interval: float = 0.5) -> None:
+        watcher = threading.Thread(target=self._watch, daemon=True)
+        watcher.start()
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self._stop_watching.set()
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.socket_file.unlink(missing_ok=True)
+        parse_notebook.resident_notebooks = None
+        manage_state.resident_status = None
+        update_notebook.resident_index = None
+
+    def _watch(self) -> None:
+        """Re-parse resident notebooks that changed on disk so the next query is warm."""
+        while not self._stop_watching.wait(self.watch_interval):
+            cache = parse_notebook.resident_notebooks
+            if cache is None:
+                return
+            for path in cache.stale_paths():
+                cache.invalidate(path)
+                if path.exists():
+                    with contextlib.suppress(NotebookError, OSError, UnicodeDecodeError):
+                        parse_notebook.load_notebook(path)
+
+
+def _claim_socket(path: Path) -> None:
+    """Remove a stale socket file left by a crashed daemon; refuse if one is live."""
+    if not path.exists():
+        return
+    try:
+        call("ping", path=path, timeout=1.0)
+    except OSError:
+        path.unlink(missing_ok=True)
+        return
+    raise DaemonError(f"A daemon is already listening on {path}")
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def _start_detached(path: Path, timeout: float = 10.0) -> None:
+    subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve()), "start", "--foreground", "--socket", str(path)],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            call("ping", path=path, timeout=1.0)
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise DaemonError(f"Daemon did not come up on {path} within {timeout:.0f}s")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Resident AnyT Notebook daemon")
+    parser.add_argument("command", choices=["start", "stop", "status"], help="Daemon command")
+    parser.add_argument("--socket", help="Socket path (default: $ANYT_NOTEBOOK_SOCKET or per-user runtime dir)")
+    parser.add_argument("--foreground", action="store_true", help="Serve in the foreground instead of detaching")
+    args = parser.parse_args()
+
+    path = Path(args.socket) if args.socket else socket_path()
+
+    try:
+        if args.command == "start":
+            if args.foreground:
+                with NotebookDaemon(path) as daemon:
+                    print(f"Listening on {path}", flush=True)
+                    daemon.serve_forever()
+            else:
+                prepare_socket_dir(path)
+                _claim_socket(path)
+                _start_detached(path)
+                print(f"Daemon started on {path}")
+
+        elif args.command == "stop":
+            try:
+                call("shutdown", path=path, timeout=5.0)
+            except OSError:
+                print(f"No daemon running on {path}")
+                return 0
+            print("Daemon stopped")
+
+        elif args.command == "status":
+            try:
+                info = call("ping", path=path, timeout=2.0)
+            except OSError:
+                print(f"No daemon running on {path}")
+                return 1
+            print(json.dumps({"socket": str(path), **info}, indent=2))
+
+        return 0
+
+    except NotebookError as e:
+        prefix = _ERROR_PREFIXES.get(type(e), "Error")
+        print(f"\n{prefix}: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
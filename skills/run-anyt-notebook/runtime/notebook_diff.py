@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Cell-aware diff and three-way merge of AnyT Notebooks (.anyt.md).
+
+Run with: uv run --project runtime runtime/notebook_diff.py <command> [options]
+
+Commands:
+  diff      Compare two versions of a notebook cell by cell
+  merge     Merge two versions of a notebook that started from a common base
+
+A notebook is split into units: the head (the frontmatter), one unit per cell (the
+cell's lines and the prose between it and the cell before it), and the tail after the
+last cell. Units are matched by cell ID and compared by SHA-256 of their bytes, so an
+unchanged cell costs one hash; only cells whose hashes differ are decoded and diffed
+line by line. A cell counts as moved when it is outside the longest run of cells that
+kept their relative order.
+
+``merge`` takes each unit from the side that changed it. When both sides changed a
+unit, their line edits are combined if they touch different lines of the base, and
+the unit gets git-style conflict markers where they do not. Cell order follows the
+side that reordered cells, and cells added on one side are placed after the cell they
+followed there. The exit status is 1 when there were conflicts, so the command can
+serve as a git merge driver::
+
+    # .gitattributes: *.anyt.md merge=anyt
+    [merge "anyt"]
+        driver = uv run --project runtime runtime/notebook_diff.py merge %O %A %B --output %A
+"""
+
+import argparse
+import bisect
+import difflib
+import hashlib
+import json
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+from config import NotebookError, ParseError, ValidationError
+from parse_notebook import Cell, parse_notebook_bytes
+
+_ERROR_PREFIXES: dict[type[NotebookError], str] = {
+    ParseError: "Parse error",
+    ValidationError: "Validation error",
+}
+
+# Keys of the units around the cells; cell IDs are slugs, so these cannot collide
+HEAD_KEY = "@head"
+TAIL_KEY = "@tail"
+
+# Cell attributes compared field by field when a cell changed
+_CELL_FIELDS = ("cell_type", "label", "agent", "skip", "after")
+
+
+# ---------------------------------------------------------------------------
+# Splitting
+# ---------------------------------------------------------------------------
+
+
+@dataclass(slots=True)
+class _Unit:
+    start: int
+    stop: int
+    digest: bytes
+    cell: Cell | None = None
+
+
+@dataclass(slots=True)
+class _Split:
+    """A notebook's units in file order, keyed by cell ID (or HEAD_KEY / TAIL_KEY)."""
+
+    source: bytes
+    units: dict[str, _Unit]
+    order: list[str]  # cell IDs only
+
+    def raw(self, key: str) -> bytes:
+        unit = self.units[key]
+        return self.source[unit.start : unit.stop]
+
+
+def _frontmatter_end(source: bytes) -> int:
+    """Offset just past the closing ``---`` line. The frontmatter has already been parsed."""
+    pos = source.index(b"\n") + 1
+    while True:
+        newline = source.find(b"\n", pos)
+        stop = len(source) if newline < 0 else newline + 1
+        if source[pos:stop].strip() == b"---":
+            return stop
+        pos = stop
+
+
+def _split(source: bytes, name: str) -> _Split:
+    if not source.endswith(b"\n"):
+        # Whichever unit is last must not differ from its copy elsewhere by the final newline
+        source += b"\n"
+    notebook = parse_notebook_bytes(source, name)
+    view = memoryview(source)
+
+    def unit(start: int, stop: int, cell: Cell | None = None) -> _Unit:
+        return _Unit(start, stop, hashlib.sha256(view[start:stop]).digest(), cell)
+
+    pos = _frontmatter_end(source)
+    units = {HEAD_KEY: unit(0, pos)}
+    order: list[str] = []
+    for cell in notebook.cells:
+        span = cell.span
+        assert span is not None
+        if cell.id in units:
+            raise ValidationError(f"Duplicate cell ID '{cell.id}' in {name}")
+        units[cell.id] = unit(pos, span.end_offset, cell)
+        order.append(cell.id)
+        pos = span.end_offset
+    units[TAIL_KEY] = unit(pos, len(source))
+    return _Split(source, units, order)
+
+
+def _read(path: Path) -> bytes:
+    if not path.exists():
+        raise ParseError(f"File not found: {path}")
+    return path.read_bytes()
+
+
+# ---------------------------------------------------------------------------
+# Diff
+# ---------------------------------------------------------------------------
+
+
+def _moved(old: list[str], new: list[str]) -> set[str]:
+    """Cells present in both orders that are not part of their longest common subsequence.
+
+    With unique IDs this is a longest increasing subsequence of old positions taken in
+    new order: O(n log n).
+    """
+    position = {cell_id: i for i, cell_id in enumerate(old)}
+    common = [cell_id for cell_id in new if cell_id in position]
+    tails: list[int] = []  # old position ending the best run of each length
+    tail_index: list[int] = []  # index into ``common`` of that position
+    previous = [-1] * len(common)
+    for i, cell_id in enumerate(common):
+        p = position[cell_id]
+        length = bisect.bisect_left(tails, p)
+        if length == len(tails):
+            tails.append(p)
+            tail_index.append(i)
+        else:
+            tails[length] = p
+            tail_index[length] = i
+        previous[i] = tail_index[length - 1] if length else -1
+    kept: set[str] = set()
+    i = tail_index[-1] if tail_index else -1
+    while i >= 0:
+        kept.add(common[i])
+        i = previous[i]
+    return set(common) - kept
+
+
+def _line_diff(old: str, new: str, context: int) -> list[str]:
+    """Unified diff hunks (without the file header lines) between two texts."""
+    return list(difflib.unified_diff(old.splitlines(), new.splitlines(), lineterm="", n=context))[2:]
+
+
+def _describe(old: _Split, new: _Split, key: str, context: int) -> dict[str, object]:
+    """What changed in a unit present on both sides with different bytes."""
+    before, after = old.units[key], new.units[key]
+    if before.cell is None or after.cell is None:
+        return {"text_diff": _line_diff(old.raw(key).decode("utf-8"), new.raw(key).decode("utf-8"), context)}
+
+    entry: dict[str, object] = {}
+    fields = {
+        name: [getattr(before.cell, name), getattr(after.cell, name)]
+        for name in _CELL_FIELDS
+        if getattr(before.cell, name) != getattr(after.cell, name)
+    }
+    if fields:
+        entry["fields"] = fields
+    if before.cell.content != after.cell.content:
+        entry["content_diff"] = _line_diff(before.cell.content, after.cell.content, context)
+    old_span, new_span = before.cell.span, after.cell.span
+    assert old_span is not None and new_span is not None
+    old_prose = old.source[before.start : old_span.start_offset]
+    new_prose = new.source[after.start : new_span.start_offset]
+    if old_prose != new_prose:
+        entry["text_diff"] = _line_diff(old_prose.decode("utf-8"), new_prose.decode("utf-8"), context)
+    return entry
+
+
+def diff_notebooks(old_source: bytes, new_source: bytes, context: int = 3) -> dict[str, object]:
+    """Compare two versions of a notebook.
+
+    Returns a summary count per kind of change and one entry per changed unit, in the
+    new notebook's order with removed cells last. Modified entries carry the changed
+    cell attributes (``fields``), a unified diff of the cell content (``content_diff``)
+    and of the prose before the cell (``text_diff``), each only when it changed; a change
+    none of these show (another attribute, say) is given as a diff of the whole unit.
+    A missing final newline is not a change.
+    """
+    old, new = _split(old_source, "old"), _split(new_source, "new")
+    moved = _moved(old.order, new.order)
+    summary = dict.fromkeys(("unchanged", "modified", "added", "removed", "moved"), 0)
+    changes: list[dict[str, object]] = []
+
+    for key in (HEAD_KEY, *new.order, TAIL_KEY):
+        unit = new.units[key]
+        cell_type = unit.cell.cell_type if unit.cell is not None else None
+        previous = old.units.get(key)
+        if previous is None:
+            summary["added"] += 1
+            changes.append({"id": key, "change": "added", "type": cell_type})
+            continue
+        if key in moved:
+            summary["moved"] += 1
+        description: dict[str, object] = {}
+        if previous.digest != unit.digest:
+            description = _describe(old, new, key, context)
+            if not description:
+                raw_diff = _line_diff(old.raw(key).decode("utf-8"), new.raw(key).decode("utf-8"), context)
+                if raw_diff:
+                    description["text_diff"] = raw_diff
+        if not description:
+            if key in moved:
+                changes.append({"id": key, "change": "moved", "type": cell_type})
+            else:
+                summary["unchanged"] += 1
+            continue
+        summary["modified"] += 1
+        entry: dict[str, object] = {"id": key, "change": "modified", "type": cell_type, "moved": key in moved}
+        entry.update(description)
+        changes.append(entry)
+
+    for key in old.order:
+        if key not in new.units:
+            cell = old.units[key].cell
+            summary["removed"] += 1
+            changes.append({"id": key, "change": "removed", "type": cell.cell_type if cell is not None else None})
+
+    return {"summary": summary, "changes": changes}
+
+
+# ---------------------------------------------------------------------------
+# Merge
+# ---------------------------------------------------------------------------
+
+
+def _hunks(base: list[bytes], side: list[bytes], name: str) -> list[tuple[int, int, int, int, str]]:
+    matcher = difflib.SequenceMatcher(None, base, side, autojunk=False)
+    return [(i1, i2, j1, j2, name) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+
+def _conflict(ours: list[bytes], theirs: list[bytes]) -> list[bytes]:
+    def closed(lines: list[bytes]) -> list[bytes]:
+        return [*lines[:-1], lines[-1] + b"\n"] if lines and not lines[-1].endswith(b"\n") else lines
+
+    return [b"<<<<<<< ours\n", *closed(ours), b"=======\n", *closed(theirs), b">>>>>>> theirs\n"]
+
+
+def _merge_lines(base: bytes, ours: bytes, theirs: bytes) -> tuple[bytes, int]:
+    """Three-way merge of one unit's lines. Returns the merged bytes and the number of conflicts.
+
+    Edits from both sides are applied when they change separate regions of the base;
+    regions changed by both (or touching) must end up identical or become a conflict.
+    """
+    base_lines = base.splitlines(keepends=True)
+    sides = {"ours": ours.splitlines(keepends=True), "theirs": theirs.splitlines(keepends=True)}
+    hunks = sorted(
+        _hunks(base_lines, sides["ours"], "ours") + _hunks(base_lines, sides["theirs"], "theirs"),
+        key=lambda h: (h[0], h[1]),
+    )
+    out: list[bytes] = []
+    conflicts = 0
+    pos = k = 0
+    while k < len(hunks):
+        group = [hunks[k]]
+        lo, hi = hunks[k][0], hunks[k][1]
+        k += 1
+        while k < len(hunks) and hunks[k][0] <= hi:
+            group.append(hunks[k])
+            hi = max(hi, hunks[k][1])
+            k += 1
+        out += base_lines[pos:lo]
+        versions: dict[str, list[bytes]] = {}
+        for name, lines in sides.items():
+            version: list[bytes] = []
+            cursor = lo
+            for i1, i2, j1, j2, side in group:
+                if side == name:
+                    version += base_lines[cursor:i1] + lines[j1:j2]
+                    cursor = i2
+            versions[name] = version + base_lines[cursor:hi]
+        if len({h[4] for h in group}) == 1:
+            out += versions[group[0][4]]
+        elif versions["ours"] == versions["theirs"]:
+            out += versions["ours"]
+        else:
+            out += _conflict(versions["ours"], versions["theirs"])
+            conflicts += 1
+        pos = hi
+    out += base_lines[pos:]
+    return b"".join(out), conflicts
+
+
+def _reordered(base: list[str], side: list[str]) -> bool:
+    """Whether the cells ``side`` kept from ``base`` are in a different relative order."""
+    in_base, in_side = set(base), set(side)
+    return [c for c in side if c in in_base] != [c for c in base if c in in_side]
+
+
+def _merge_order(base: list[str], ours: list[str], theirs: list[str], keep: set[str]) -> tuple[list[str], bool]:
+    """Order of the merged cells, and whether both sides reordered cells differently.
+
+    The order comes from the side that reordered cells (ours if both or neither did).
+    Cells missing from it are placed after the cell they follow on the other side.
+    """
+    primary, secondary = ours, theirs
+    conflict = False
+    if _reordered(base, theirs):
+        if not _reordered(base, ours):
+            primary, secondary = theirs, ours
+        else:
+            conflict = _reordered(ours, theirs)
+    order = [c for c in primary if c in keep]
+    placed = set(order)
+    inserts: dict[str | None, list[str]] = {}
+    anchor: str | None = None
+    for cell_id in secondary:
+        if cell_id in placed:
+            anchor = cell_id
+        elif cell_id in keep:
+            inserts.setdefault(anchor, []).append(cell_id)
+    merged = list(inserts.get(None, []))
+    for cell_id in order:
+        merged.append(cell_id)
+        merged += inserts.get(cell_id, [])
+    return merged, conflict
+
+
+def merge_notebooks(base_source: bytes, ours_source: bytes, theirs_source: bytes) -> tuple[bytes, dict[str, object]]:
+    """Three-way merge of two notebook versions with a common base.
+
+    Returns the merged notebook and a report: how many units were unchanged, changed
+    the same way on both sides, taken from one side or merged line by line, and one
+    entry per conflict (``content`` for
+    overlapping line edits, ``add/add`` or ``delete/modify`` for whole cells, and
+    ``order`` when both sides reordered cells differently). The merged notebook ends
+    without a newline only when both sides did.
+    """
+    base, ours, theirs = (
+        _split(base_source, "base"),
+        _split(ours_source, "ours"),
+        _split(theirs_source, "theirs"),
+    )
+    resolved: dict[str, bytes] = {}
+    summary = dict.fromkeys(("unchanged", "both", "ours", "theirs", "merged", "conflicts"), 0)
+    conflicts: list[dict[str, object]] = []
+
+    for key in {**base.units, **ours.units, **theirs.units}:
+        b, o, t = (side.units.get(key) for side in (base, ours, theirs))
+        bd, od, td = (None if u is None else u.digest for u in (b, o, t))
+        if od == td:
+            summary["unchanged" if od == bd else "both"] += 1
+            chosen = None if o is None else ours.raw(key)
+        elif od == bd:
+            summary["theirs"] += 1
+            chosen = None if t is None else theirs.raw(key)
+        elif td == bd:
+            summary["ours"] += 1
+            chosen = None if o is None else ours.raw(key)
+        elif b is not None and o is not None and t is not None:
+            chosen, count = _merge_lines(base.raw(key), ours.raw(key), theirs.raw(key))
+            if count:
+                summary["conflicts"] += 1
+                conflicts.append({"id": key, "kind": "content", "hunks": count})
+            else:
+                summary["merged"] += 1
+        else:
+            summary["conflicts"] += 1
+            conflicts.append({"id": key, "kind": "add/add" if b is None else "delete/modify"})
+            ours_lines = [] if o is None else ours.raw(key).splitlines(keepends=True)
+            theirs_lines = [] if t is None else theirs.raw(key).splitlines(keepends=True)
+            chosen = b"".join(_conflict(ours_lines, theirs_lines))
+        if chosen is not None:
+            resolved[key] = chosen
+
+    order, order_conflict = _merge_order(base.order, ours.order, theirs.order, set(resolved) - {HEAD_KEY, TAIL_KEY})
+    if order_conflict:
+        summary["conflicts"] += 1
+        conflicts.append({"id": None, "kind": "order"})
+    merged = b"".join(resolved.get(key, b"") for key in (HEAD_KEY, *order, TAIL_KEY))
+    if not ours_source.endswith(b"\n") and not theirs_source.endswith(b"\n"):
+        merged = merged.removesuffix(b"\n")
+    return merged, {"clean": not conflicts, "summary": summary, "conflicts": conflicts}
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Cell-aware diff and merge of AnyT Notebook (.anyt.md) files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # diff command
+    diff_parser = subparsers.add_parser("diff", help="Compare two versions of a notebook cell by cell")
+    diff_parser.add_argument("old", help="Old version of the notebook")
+    diff_parser.add_argument("new", help="New version of the notebook")
+    diff_parser.add_argument("--context", type=int, default=3, help="Context lines in content diffs (default: 3)")
+
+    # merge command
+    merge_parser = subparsers.add_parser("merge", help="Three-way merge (exit status 1 on conflicts)")
+    merge_parser.add_argument("base", help="Common ancestor")
+    merge_parser.add_argument("ours", help="Our version")
+    merge_parser.add_argument("theirs", help="Their version")
+    merge_parser.add_argument("--output", help="Write the merged notebook here (default: include it in the report)")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "diff":
+            print(json.dumps(diff_notebooks(_read(Path(args.old)), _read(Path(args.new)), args.context), indent=2))
+            return 0
+
+        merged, report = merge_notebooks(_read(Path(args.base)), _read(Path(args.ours)), _read(Path(args.theirs)))
+        if args.output:
+            Path(args.output).write_bytes(merged)
+        else:
+            report["notebook"] = merged.decode("utf-8")
+        print(json.dumps(report, indent=2))
+        return 0 if report["clean"] else 1
+
+    except NotebookError as e:
+        prefix = _ERROR_PREFIXES.get(type(e), "Error")
+        print(f"\n{prefix}: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,24 +4,36 @@ Parse an AnyT Notebook (.anyt.md) file into structured JSON.
 
 Run with: uv run --project runtime runtime/parse_notebook.py <notebook.anyt.md>
 
-Outputs JSON with frontmatter metadata and an ordered list of cells.
+Outputs JSON with frontmatter metadata, an ordered list of cells, and the notebook's
+``content_version`` to pass to ``update_notebook.py --expect-version``.
 """
 
 import argparse
+import hashlib
+import io
 import json
 import re
 import sys
+from collections.abc import Iterable, Iterator
 from dataclasses import asdict, dataclass, field
+from dataclasses import fields as dataclass_fields
 from pathlib import Path
+from typing import Any
 
 from config import (
+    MAX_FORM_SCHEMA_CACHE,
+    OPTION_FIELD_TYPES,
     SCHEMA_VERSION,
     VALID_AGENT_TYPES,
     VALID_CELL_TYPES,
+    VALID_FIELD_TYPES,
     NotebookError,
     ParseError,
     ValidationError,
 )
+from daemon_client import forward_cli
+from frontmatter import AgentProfile, Frontmatter, parse_frontmatter
+from notebook_cache import ResidentCache, cache_dir, notebook_version, read_entry, write_entry
 
 _ERROR_PREFIXES: dict[type[NotebookError], str] = {
     ParseError: "Parse error",
@@ -50,14 +62,75 @@ class FormField:
     validation: dict[str, object] | None = None
 
 
-@dataclass
+@dataclass(slots=True)
+class CellSpan:
+    """Location of a cell in the source file: 1-based line numbers and byte offsets.
+
+    ``start_offset``/``end_offset`` cover the whole cell including both tag lines;
+    ``content_start``/``content_end`` cover only the raw lines between the tags.
+    """
+
+    start_line: int
+    end_line: int
+    start_offset: int
+    end_offset: int
+    content_start: int
+    content_end: int
+
+
+@dataclass(slots=True)
 class Cell:
     cell_type: str
     id: str
     label: str | None = None
     agent: str | None = None
     skip: bool = False
+    after: list[str] | None = None
     content: str = ""
+    span: CellSpan | None = None
+
+
+class LazyCell(Cell):
+    """Cell that keeps only its span into the shared notebook buffer.
+
+    ``content`` is decoded from the buffer on first access and then kept, so callers
+    that only need metadata (status, validation) never pay for it.
+    """
+
+    __slots__ = ("_content", "_source")
+
+    def __init__(
+        self,
+        source: bytes,
+        cell_type: str,
+        id: str,
+        label: str | None = None,
+        agent: str | None = None,
+        skip: bool = False,
+        after: list[str] | None = None,
+        span: CellSpan | None = None,
+    ) -> None:
+        super().__init__(cell_type=cell_type, id=id, label=label, agent=agent, skip=skip, after=after, span=span)
+        self._source = source
+        self._content: str | None = None
+
+    @property
+    def content(self) -> str:  # pyright: ignore[reportIncompatibleVariableOverride]
+        if self._content is None:
+            span = self.span
+            raw = b"" if span is None else self._source[span.content_start : span.content_end]
+            self._content = raw.decode("utf-8").strip()
+        return self._content
+
+    @content.setter
+    def content(self, value: str) -> None:  # pyright: ignore[reportIncompatibleVariableOverride]
+        self._content = value
+
+    def __eq__(self, other: object) -> bool:
+        # Compare by field values so a LazyCell equals the eager Cell it stands for
+        if not isinstance(other, Cell):
+            return NotImplemented
+        return all(getattr(self, f.name) == getattr(other, f.name) for f in dataclass_fields(Cell))
 
 
 @dataclass
@@ -69,6 +142,7 @@ class Notebook:
     workdir: str = "anyt_workspace"
     env_file: str = ".env"
     dependencies: dict[str, str] = field(default_factory=dict)
+    agents: list[AgentProfile] = field(default_factory=list)
     cells: list[Cell] = field(default_factory=list)
     source_path: str | None = None
 
@@ -89,165 +163,258 @@ _CLOSE_TAG_RE = re.compile(r"^</(task|shell|input|note|break)>\s*$", re.IGNORECA
 # Extract individual attributes: key="value"
 _ATTR_RE = re.compile(r'([a-z]+)=["\']([^"\']*)["\']')
 
+# Separator between cell ids in an after="..." attribute
+_AFTER_SPLIT_RE = re.compile(r"[\s,]+")
+
 # YAML frontmatter boundaries
-_FRONTMATTER_DELIM = "---"
+_FRONTMATTER_DELIM_BYTES = b"---"
 
 
-def _parse_frontmatter(lines: list[str]) -> tuple[dict[str, object], int]:
-    """Parse YAML frontmatter from lines. Returns (metadata dict, end line index)."""
-    if not lines or lines[0].strip() != _FRONTMATTER_DELIM:
-        raise ParseError("File must start with YAML frontmatter (---)")
+def _iter_lines(source: Iterable[bytes]) -> Iterator[tuple[int, int, bytes]]:
+    """Number raw lines from a binary source. Yields (1-based line number, byte offset, raw line)."""
+    offset = 0
+    for line_no, raw in enumerate(source, start=1):
+        yield line_no, offset, raw
+        offset += len(raw)
 
-    end_idx = -1
-    for i in range(1, len(lines)):
-        if lines[i].strip() == _FRONTMATTER_DELIM:
-            end_idx = i
-            break
 
-    if end_idx == -1:
-        raise ParseError("Unclosed YAML frontmatter (missing closing ---)")
+def _read_frontmatter(lines: Iterator[tuple[int, int, bytes]]) -> Frontmatter:
+    """Consume the frontmatter block from a line stream, leaving it positioned at the body."""
+    first = next(lines, None)
+    if first is None or first[2].strip() != _FRONTMATTER_DELIM_BYTES:
+        raise ParseError("File must start with YAML frontmatter (---)")
 
-    # Simple YAML key-value parser for flat frontmatter
-    metadata: dict[str, object] = {}
-    current_key: str | None = None
-    current_indent: int = 0
-    nested: dict[str, str] = {}
+    block: list[bytes] = []
+    for _, _, raw in lines:
+        if raw.strip() == _FRONTMATTER_DELIM_BYTES:
+            # Decode the block once rather than line by line
+            return parse_frontmatter(b"".join(block).decode("utf-8").split("\n"))
+        block.append(raw)
 
-    for line in lines[1:end_idx]:
-        stripped = line.strip()
-        if not stripped or stripped.startswith("#"):
-            continue
+    raise ParseError("Unclosed YAML frontmatter (missing closing ---)")
 
-        indent = len(line) - len(line.lstrip())
 
-        # Check if this is a nested value under a mapping key
-        if current_key and indent > current_indent and ":" in stripped:
-            k, _, v = stripped.partition(":")
-            nested[k.strip()] = v.strip().strip('"').strip("'")
-            continue
+def _scan_cells(lines: Iterator[tuple[int, int, bytes]], source: bytes | None = None) -> Iterator[Cell]:
+    """Tokenize cell tags from a body line stream, yielding each cell as soon as it closes.
 
-        # Save any accumulated nested mapping
-        if current_key and nested:
-            metadata[current_key] = dict(nested)
-            nested = {}
-
-        if ":" in stripped:
-            k, _, v = stripped.partition(":")
-            k = k.strip()
-            v = v.strip()
-            current_key = k
-            current_indent = indent
-
-            if not v:
-                # Could be a mapping key — accumulate nested values
-                nested = {}
-                continue
+    Only the lines of the cell currently being read are buffered. Lines that do not
+    start with ``<`` cannot be tags, so they skip both regexes entirely. When the whole
+    file is available as ``source``, nothing is buffered and LazyCells are yielded.
+    """
+    current_cell: Cell | None = None
+    content_chunks: list[bytes] = []
+    start_offset = 0
+    content_start = 0
+    start_line = 0
+
+    for line_no, offset, raw in lines:
+        stripped = raw.strip()
+
+        if stripped[:1] == b"<":
+            text = stripped.decode("utf-8")
+
+            if current_cell is not None:
+                # Try to match a closing tag
+                close_match = _CLOSE_TAG_RE.match(text)
+                if close_match:
+                    close_type = close_match.group(1).lower()
+                    if close_type != current_cell.cell_type:
+                        raise ParseError(
+                            f"Mismatched closing tag: expected </{current_cell.cell_type}>, "
+                            f"got </{close_type}> (line {line_no})"
+                        )
+                    if source is None:
+                        current_cell.content = b"".join(content_chunks).decode("utf-8").strip()
+                    current_cell.span = CellSpan(
+                        start_line=start_line,
+                        end_line=line_no,
+                        start_offset=start_offset,
+                        end_offset=offset + len(raw),
+                        content_start=content_start,
+                        content_end=offset,
+                    )
+                    yield current_cell
+                    current_cell = None
+                    content_chunks = []
+                    continue
+            else:
+                # Try to match an opening tag
+                open_match = _OPEN_TAG_RE.match(text)
+                if open_match:
+                    attrs = dict(_ATTR_RE.findall(open_match.group(2)))
+                    if "id" not in attrs:
+                        raise ParseError(f"Cell tag missing required 'id' attribute (line {line_no})")
+
+                    cell_type = open_match.group(1).lower()
+                    label = attrs.get("label")
+                    agent = attrs.get("agent")
+                    skip = attrs.get("skip", "").lower() == "true"
+                    after = _AFTER_SPLIT_RE.split(attrs["after"].strip()) if "after" in attrs else None
+                    if after == [""]:
+                        after = []
+                    if source is None:
+                        current_cell = Cell(
+                            cell_type=cell_type, id=attrs["id"], label=label, agent=agent, skip=skip, after=after
+                        )
+                    else:
+                        current_cell = LazyCell(
+                            source, cell_type, attrs["id"], label=label, agent=agent, skip=skip, after=after
+                        )
+                    start_line = line_no
+                    start_offset = offset
+                    content_start = offset + len(raw)
+                    continue
 
-            # Strip quotes
-            if (v.startswith('"') and v.endswith('"')) or (v.startswith("'") and v.endswith("'")):
-                v = v[1:-1]
+        # Accumulate content inside a cell
+        if current_cell is not None and source is None:
+            content_chunks.append(raw)
 
-            metadata[k] = v
+    if current_cell is not None:
+        raise ParseError(f'Unclosed cell tag: <{current_cell.cell_type} id="{current_cell.id}"> has no closing tag')
 
-    # Handle final nested mapping
-    if current_key and nested:
-        metadata[current_key] = dict(nested)
 
-    return metadata, end_idx
+def scan_notebook(source: Iterable[bytes]) -> tuple[Frontmatter, Iterator[Cell]]:
+    """Tokenize a notebook in a single pass over a binary line source.
 
+    ``source`` may be a file opened in binary mode or ``iter(mm.readline, b"")`` over an
+    mmap'd buffer. The frontmatter is read eagerly; cells are yielded lazily, each with
+    a ``span`` giving its line numbers and byte offsets in the source.
+    """
+    lines = _iter_lines(source)
+    frontmatter = _read_frontmatter(lines)
+    return frontmatter, _scan_cells(lines)
 
-def _parse_cells(lines: list[str], start_idx: int) -> list[Cell]:
-    """Parse cell tags from body lines."""
-    cells: list[Cell] = []
-    i = start_idx
-    current_cell: Cell | None = None
-    content_lines: list[str] = []
-
-    while i < len(lines):
-        line = lines[i]
-        stripped = line.strip()
-
-        # Try to match a closing tag
-        close_match = _CLOSE_TAG_RE.match(stripped)
-        if close_match and current_cell:
-            close_type = close_match.group(1).lower()
-            if close_type != current_cell.cell_type:
-                raise ParseError(
-                    f"Mismatched closing tag: expected </{current_cell.cell_type}>, got </{close_type}> (line {i + 1})"
-                )
-            current_cell.content = "\n".join(content_lines).strip()
-            cells.append(current_cell)
-            current_cell = None
-            content_lines = []
-            i += 1
-            continue
 
-        # Try to match an opening tag
-        open_match = _OPEN_TAG_RE.match(stripped)
-        if open_match and current_cell is None:
-            cell_type = open_match.group(1).lower()
-            attrs_str = open_match.group(2)
-            attrs = dict(_ATTR_RE.findall(attrs_str))
-
-            if "id" not in attrs:
-                raise ParseError(f"Cell tag missing required 'id' attribute (line {i + 1})")
-
-            current_cell = Cell(
-                cell_type=cell_type,
-                id=attrs["id"],
-                label=attrs.get("label"),
-                agent=attrs.get("agent"),
-                skip=attrs.get("skip", "").lower() == "true",
-            )
-            i += 1
-            continue
+def iter_cells(file_path: Path) -> Iterator[Cell]:
+    """Stream the cells of an .anyt.md file without loading the whole file into memory."""
+    if not file_path.exists():
+        raise ParseError(f"File not found: {file_path}")
 
-        # Accumulate content inside a cell
-        if current_cell is not None:
-            content_lines.append(line)
-        i += 1
+    with file_path.open("rb") as f:
+        _, cells = scan_notebook(f)
+        yield from cells
 
-    if current_cell is not None:
-        raise ParseError(f'Unclosed cell tag: <{current_cell.cell_type} id="{current_cell.id}"> has no closing tag')
 
-    return cells
+def _notebook_from_frontmatter(frontmatter: Frontmatter, source_path: str) -> Notebook:
+    """Build a Notebook (without cells) from parsed frontmatter."""
+    return Notebook(
+        schema=frontmatter.schema,
+        name=frontmatter.name,
+        description=frontmatter.description,
+        version=frontmatter.version,
+        workdir=frontmatter.workdir,
+        env_file=frontmatter.env_file,
+        dependencies=frontmatter.dependencies,
+        agents=frontmatter.agents,
+        source_path=source_path,
+    )
 
 
-def parse_notebook(file_path: Path) -> Notebook:
-    """Parse an .anyt.md file into a Notebook object."""
+def parse_notebook(file_path: Path, lazy: bool = False) -> Notebook:
+    """Parse an .anyt.md file into a Notebook object.
+
+    With ``lazy=True`` the file is read once into a shared buffer and cells are
+    LazyCells whose content is only decoded when accessed.
+    """
     if not file_path.exists():
         raise ParseError(f"File not found: {file_path}")
 
-    text = file_path.read_text(encoding="utf-8")
-    lines = text.split("\n")
-
-    # Parse frontmatter
-    metadata, fm_end = _parse_frontmatter(lines)
-
-    # Build notebook from frontmatter
-    notebook = Notebook(source_path=str(file_path.resolve()))
-
-    if "schema" in metadata:
-        notebook.schema = str(metadata["schema"])
-    if "name" in metadata:
-        notebook.name = str(metadata["name"])
-    if "description" in metadata:
-        notebook.description = str(metadata["description"])
-    if "version" in metadata:
-        notebook.version = str(metadata["version"])
-    if "workdir" in metadata:
-        notebook.workdir = str(metadata["workdir"])
-    if "env_file" in metadata:
-        notebook.env_file = str(metadata["env_file"])
-    if "dependencies" in metadata and isinstance(metadata["dependencies"], dict):
-        notebook.dependencies = {str(k): str(v) for k, v in metadata["dependencies"].items()}
-
-    # Parse cells from body
-    notebook.cells = _parse_cells(lines, fm_end + 1)
+    if lazy:
+        return parse_notebook_bytes(file_path.read_bytes(), str(file_path.resolve()))
+
+    with file_path.open("rb") as f:
+        frontmatter, cells = scan_notebook(f)
+        notebook = _notebook_from_frontmatter(frontmatter, str(file_path.resolve()))
+        notebook.cells = list(cells)
 
     return notebook
 
 
+def parse_notebook_bytes(source: bytes, source_path: str = "") -> Notebook:
+    """Parse a notebook held in memory. Cells are LazyCells whose spans index into ``source``."""
+    lines = _iter_lines(io.BytesIO(source))
+    frontmatter = _read_frontmatter(lines)
+    notebook = _notebook_from_frontmatter(frontmatter, source_path)
+    notebook.cells = list(_scan_cells(lines, source))
+    return notebook
+
+
+def notebook_from_dict(data: dict[str, object]) -> Notebook:
+    """Rebuild a Notebook from its ``asdict`` form (the inverse of ``dataclasses.asdict``)."""
+    fields = dict(data)
+    raw_cells = fields.pop("cells", [])
+    raw_agents = fields.pop("agents", [])
+    notebook = Notebook(**fields)  # type: ignore[arg-type]
+    notebook.agents = [AgentProfile(**a) for a in raw_agents] if isinstance(raw_agents, list) else []
+    for raw in raw_cells if isinstance(raw_cells, list) else []:
+        cell_fields = dict(raw)
+        span = cell_fields.pop("span", None)
+        notebook.cells.append(Cell(**cell_fields, span=CellSpan(**span) if span else None))
+    return notebook
+
+
+# ---------------------------------------------------------------------------
+# Cached loading
+# ---------------------------------------------------------------------------
+
+
+# In-memory layer in front of the disk cache; enabled by the notebook daemon
+resident_notebooks: ResidentCache | None = None
+
+
+def resolve_workdir(file_path: Path) -> Path:
+    """Locate the notebook's workdir by reading only its frontmatter."""
+    with file_path.open("rb") as f:
+        frontmatter = _read_frontmatter(_iter_lines(f))
+    return file_path.parent / frontmatter.workdir
+
+
+def load_notebook(file_path: Path, use_cache: bool = True) -> tuple[Notebook, list[str]]:
+    """Parse and validate a notebook, reusing the on-disk parse cache when possible.
+
+    Returns (notebook, validation errors). On a cache hit neither the cell tokenizer
+    nor ``validate_notebook`` runs. Inside the daemon, results are also kept in memory.
+    """
+    if not file_path.exists():
+        raise ParseError(f"File not found: {file_path}")
+
+    source = file_path.resolve()
+    signature = ResidentCache.signature(source)
+
+    if use_cache and resident_notebooks is not None:
+        resident = resident_notebooks.get(source)
+        if isinstance(resident, tuple):
+            return resident
+
+    directory = cache_dir(resolve_workdir(source)) if use_cache else None
+
+    if directory is not None:
+        payload = read_entry(directory, source)
+        if payload is not None:
+            errors = payload.get("errors", [])
+            notebook_data = payload.get("notebook")
+            if isinstance(notebook_data, dict) and isinstance(errors, list):
+                result = notebook_from_dict(notebook_data), [str(e) for e in errors]
+                if resident_notebooks is not None:
+                    resident_notebooks.put(source, result, signature)
+                return result
+
+    # Stat and hash exactly the bytes that get parsed, so a concurrent edit can't be cached
+    # under the new file's signature
+    before = source.stat()
+    data = source.read_bytes()
+    notebook = parse_notebook_bytes(data, str(source))
+    errors = validate_notebook(notebook)
+
+    if directory is not None:
+        payload = {"notebook": asdict(notebook), "errors": errors}
+        write_entry(directory, source, payload, before, hashlib.sha256(data).hexdigest())
+    if use_cache and resident_notebooks is not None:
+        resident_notebooks.put(source, (notebook, errors), signature)
+
+    return notebook, errors
+
+
 # ---------------------------------------------------------------------------
 # Validation
 # ---------------------------------------------------------------------------
@@ -263,6 +430,16 @@ def validate_notebook(notebook: Notebook) -> list[str]:
     if not notebook.name:
         errors.append("Missing required 'name' field in frontmatter")
 
+    profile_ids: set[str] = set()
+    for profile in notebook.agents:
+        if profile.id in profile_ids:
+            errors.append(f"Duplicate agent profile id: '{profile.id}'")
+        profile_ids.add(profile.id)
+        if profile.type not in VALID_AGENT_TYPES:
+            errors.append(f"Invalid type '{profile.type}' on agent profile '{profile.id}' (valid: {VALID_AGENT_TYPES})")
+    if sum(profile.default for profile in notebook.agents) > 1:
+        errors.append("Only one agent profile may set 'default: true'")
+
     seen_ids: set[str] = set()
     id_pattern = re.compile(r"^[a-z0-9]+(?:[-_][a-z0-9]+)*$")
 
@@ -277,12 +454,19 @@ def validate_notebook(notebook: Notebook) -> list[str]:
             errors.append(f"Duplicate cell ID: '{cell.id}'")
         seen_ids.add(cell.id)
 
-        if cell.agent and cell.agent not in VALID_AGENT_TYPES:
-            errors.append(f"Invalid agent type '{cell.agent}' on cell '{cell.id}' (valid: {VALID_AGENT_TYPES})")
+        if cell.agent and cell.agent not in VALID_AGENT_TYPES and cell.agent not in profile_ids:
+            errors.append(
+                f"Invalid agent '{cell.agent}' on cell '{cell.id}' "
+                f"(valid: {VALID_AGENT_TYPES} or a profile id from 'agents')"
+            )
 
         if cell.skip and cell.cell_type != "break":
             errors.append(f"'skip' attribute only valid on break cells, found on '{cell.cell_type}' cell '{cell.id}'")
 
+        for dep in cell.after or []:
+            if dep not in seen_ids or dep == cell.id:
+                errors.append(f"'after' on cell '{cell.id}' must list earlier cell IDs, got '{dep}'")
+
     return errors
 
 
@@ -293,45 +477,183 @@ def validate_notebook(notebook: Notebook) -> list[str]:
 _FORM_RE = re.compile(r"<form\s+type=[\"']json[\"']>\s*(.*?)\s*</form>", re.DOTALL)
 
 
-def extract_form_fields(cell: Cell) -> list[FormField] | None:
-    """Extract form field definitions from an input cell's content.
+@dataclass
+class FormSchema:
+    """A validated <form> block, compiled once per distinct cell content."""
 
-    Returns a list of FormField objects, or None if the cell has no <form> block.
+    fields: list[FormField]
+    description: str | None = None
+    option_values: dict[str, frozenset[str]] = field(default_factory=dict)
+    patterns: dict[str, re.Pattern[str]] = field(default_factory=dict)
+
+
+# Compiled schemas keyed by SHA-256 of the cell content (None = input cell without a form)
+_form_schemas: dict[str, FormSchema | None] = {}
+
+_NUMERIC_RULES = ("minLength", "maxLength", "min", "max", "step", "minItems", "maxItems", "minFiles", "maxFiles")
+
+
+def _compile_field(cell_id: str, index: int, raw: object) -> FormField:
+    """Validate one raw field definition and build its FormField."""
+    where = f"field {index} of input cell '{cell_id}'"
+    if not isinstance(raw, dict):
+        raise ValidationError(f"Form {where} must be an object")
+    for key in ("name", "type", "label"):
+        if not isinstance(raw.get(key), str) or not raw[key]:
+            raise ValidationError(f"Form {where} is missing '{key}'")
+
+    field_type = raw["type"]
+    if field_type not in VALID_FIELD_TYPES:
+        raise ValidationError(f"Invalid field type '{field_type}' in form {where} (valid: {sorted(VALID_FIELD_TYPES)})")
+
+    options = raw.get("options")
+    if field_type in OPTION_FIELD_TYPES:
+        if not isinstance(options, list) or not options:
+            raise ValidationError(f"Form {where} ('{raw['name']}') needs a non-empty 'options' list")
+        for opt in options:
+            if not isinstance(opt, dict) or not isinstance(opt.get("value"), str) or "label" not in opt:
+                raise ValidationError(f"Options of form {where} must be objects with string 'value' and 'label'")
+
+    validation = raw.get("validation")
+    if validation is not None:
+        if not isinstance(validation, dict):
+            raise ValidationError(f"'validation' of form {where} must be an object")
+        for rule in _NUMERIC_RULES:
+            value = validation.get(rule)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValidationError(f"Validation rule '{rule}' of form {where} must be a number")
+
+    return FormField(
+        name=raw["name"],
+        field_type=field_type,
+        label=raw["label"],
+        description=raw.get("description"),
+        required=raw.get("required", False),
+        default=raw.get("default"),
+        placeholder=raw.get("placeholder"),
+        options=options,
+        rows=raw.get("rows"),
+        accept=raw.get("accept"),
+        multiple=raw.get("multiple", False),
+        validation=validation,
+    )
+
+
+def compile_form(cell: Cell) -> FormSchema | None:
+    """Parse and validate an input cell's <form> block, caching the result by content hash.
+
+    Returns None if the cell is not an input cell or has no <form> block. Raises
+    ParseError for invalid JSON and ValidationError for invalid field definitions.
     """
     if cell.cell_type != "input":
         return None
 
+    key = hashlib.sha256(cell.content.encode("utf-8")).hexdigest()
+    if key in _form_schemas:
+        return _form_schemas[key]
+
+    schema: FormSchema | None = None
     match = _FORM_RE.search(cell.content)
-    if not match:
-        return None
+    if match:
+        try:
+            form_data = json.loads(match.group(1))
+        except json.JSONDecodeError as e:
+            raise ParseError(f"Invalid JSON in form block of input cell '{cell.id}': {e}") from e
+
+        raw_fields = form_data.get("fields", []) if isinstance(form_data, dict) else None
+        if not isinstance(raw_fields, list):
+            raise ValidationError(f"Form block of input cell '{cell.id}' must be an object with a 'fields' list")
+
+        schema = FormSchema(fields=[_compile_field(cell.id, i, raw) for i, raw in enumerate(raw_fields)])
+        seen: set[str] = set()
+        for f in schema.fields:
+            if f.name in seen:
+                raise ValidationError(f"Duplicate form field name '{f.name}' in input cell '{cell.id}'")
+            seen.add(f.name)
+            if f.options:
+                schema.option_values[f.name] = frozenset(str(o["value"]) for o in f.options)
+            pattern = (f.validation or {}).get("pattern")
+            if isinstance(pattern, str):
+                try:
+                    schema.patterns[f.name] = re.compile(pattern)
+                except re.error as e:
+                    raise ValidationError(f"Invalid pattern for field '{f.name}' in input cell '{cell.id}': {e}") from e
+
+        schema.description = cell.content[: match.start()].strip() or None
+
+    if len(_form_schemas) >= MAX_FORM_SCHEMA_CACHE:
+        _form_schemas.pop(next(iter(_form_schemas)))
+    _form_schemas[key] = schema
+    return schema
+
+
+def _check_bounds(errors: list[str], name: str, size: float, rules: dict[str, object], low: str, high: str) -> None:
+    # Rule values were checked to be numbers when the schema was compiled
+    lower, upper = rules.get(low), rules.get(high)
+    if isinstance(lower, (int, float)) and size < lower:
+        errors.append(f"Field '{name}' is below {low} {lower}")
+    if isinstance(upper, (int, float)) and size > upper:
+        errors.append(f"Field '{name}' is above {high} {upper}")
+
+
+def validate_form_response(schema: FormSchema, values: dict[str, object]) -> list[str]:
+    """Check submitted form values against a compiled schema. Returns error messages (empty = valid)."""
+    errors: list[str] = []
+    known = {f.name for f in schema.fields}
+    errors.extend(f"Unknown field '{name}'" for name in values if name not in known)
+
+    for f in schema.fields:
+        value = values.get(f.name)
+        if value is None or value == "" or value == []:
+            if f.required:
+                errors.append(f"Field '{f.name}' is required")
+            continue
 
-    try:
-        form_data = json.loads(match.group(1))
-    except json.JSONDecodeError as e:
-        raise ParseError(f"Invalid JSON in form block of input cell '{cell.id}': {e}") from e
-
-    raw_fields = form_data.get("fields", [])
-    fields: list[FormField] = []
-
-    for f in raw_fields:
-        fields.append(
-            FormField(
-                name=f["name"],
-                field_type=f["type"],
-                label=f["label"],
-                description=f.get("description"),
-                required=f.get("required", False),
-                default=f.get("default"),
-                placeholder=f.get("placeholder"),
-                options=f.get("options"),
-                rows=f.get("rows"),
-                accept=f.get("accept"),
-                multiple=f.get("multiple", False),
-                validation=f.get("validation"),
-            )
-        )
+        rules = f.validation or {}
+        if f.field_type in ("text", "textarea"):
+            if not isinstance(value, str):
+                errors.append(f"Field '{f.name}' must be a string")
+                continue
+            _check_bounds(errors, f.name, len(value), rules, "minLength", "maxLength")
+            pattern = schema.patterns.get(f.name)
+            if pattern is not None and not pattern.fullmatch(value):
+                errors.append(f"Field '{f.name}' does not match pattern {pattern.pattern}")
+        elif f.field_type == "number":
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                errors.append(f"Field '{f.name}' must be a number")
+                continue
+            _check_bounds(errors, f.name, value, rules, "min", "max")
+        elif f.field_type == "checkbox":
+            if not isinstance(value, bool):
+                errors.append(f"Field '{f.name}' must be true or false")
+        elif f.field_type in ("select", "radio"):
+            if str(value) not in schema.option_values.get(f.name, frozenset()):
+                errors.append(f"Field '{f.name}' must be one of {sorted(schema.option_values.get(f.name, ()))}")
+        elif f.field_type == "multiselect":
+            if not isinstance(value, list):
+                errors.append(f"Field '{f.name}' must be a list")
+                continue
+            allowed = schema.option_values.get(f.name, frozenset())
+            errors.extend(f"Field '{f.name}' has unknown option '{v}'" for v in value if str(v) not in allowed)
+            _check_bounds(errors, f.name, len(value), rules, "minItems", "maxItems")
+        elif f.field_type == "file":
+            files = value if isinstance(value, list) else [value]
+            if isinstance(value, list) and not f.multiple:
+                errors.append(f"Field '{f.name}' accepts a single file")
+            if not all(isinstance(v, dict) and isinstance(v.get("path"), str) for v in files):
+                errors.append(f"Field '{f.name}' must be a file value with a 'path'")
+            _check_bounds(errors, f.name, len(files), rules, "minFiles", "maxFiles")
 
-    return fields
+    return errors
+
+
+def extract_form_fields(cell: Cell) -> list[FormField] | None:
+    """Extract form field definitions from an input cell's content.
+
+    Returns a list of FormField objects, or None if the cell has no <form> block.
+    """
+    schema = compile_form(cell)
+    return None if schema is None else list(schema.fields)
 
 
 def extract_form_description(cell: Cell) -> str | None:
@@ -357,18 +679,17 @@ def format_form_prompt(cell: Cell) -> str | None:
 
     Returns a formatted string the agent can present to the user, or None if no form.
     """
-    fields = extract_form_fields(cell)
-    if fields is None:
+    schema = compile_form(cell)
+    if schema is None:
         return None
 
-    desc = extract_form_description(cell)
     parts: list[str] = []
 
-    if desc:
-        parts.append(desc)
+    if schema.description:
+        parts.append(schema.description)
         parts.append("")
 
-    for f in fields:
+    for f in schema.fields:
         req = " (required)" if f.required else ""
         line = f"- **{f.label}**{req}"
 
@@ -415,12 +736,100 @@ def format_form_prompt(cell: Cell) -> str | None:
     return "\n".join(parts)
 
 
+# ---------------------------------------------------------------------------
+# Batch queries
+# ---------------------------------------------------------------------------
+
+BATCH_OPS = ("cell", "form", "form-prompt", "validate", "cells", "notebook", "version")
+
+
+def build_cell_index(notebook: Notebook) -> dict[str, int]:
+    """Map cell IDs to their position in ``notebook.cells``. The first occurrence wins."""
+    index: dict[str, int] = {}
+    for i, cell in enumerate(notebook.cells):
+        index.setdefault(cell.id, i)
+    return index
+
+
+def parse_batch_queries(raw: list[str]) -> list[dict[str, str]]:
+    """Parse batch queries given as one JSON list or as ``op`` / ``op:id`` arguments."""
+    if len(raw) == 1 and raw[0].lstrip().startswith("["):
+        try:
+            data = json.loads(raw[0])
+        except json.JSONDecodeError as e:
+            raise ParseError(f"Invalid JSON batch query list: {e}") from e
+        if not isinstance(data, list) or not all(isinstance(q, dict) for q in data):
+            raise ParseError("Batch queries must be a JSON list of objects")
+        return [{str(k): str(v) for k, v in q.items()} for q in data]
+
+    queries: list[dict[str, str]] = []
+    for arg in raw:
+        op, _, cell_id = arg.partition(":")
+        queries.append({"op": op, "id": cell_id} if cell_id else {"op": op})
+    return queries
+
+
+def answer_query(
+    notebook: Notebook, index: dict[str, int], errors: list[str], query: dict[str, str], version: str | None = None
+) -> object:
+    """Answer one batch query. Raises NotebookError for unknown ops or cells.
+
+    ``version`` is the content version the notebook was read at, for the ``version`` op.
+    """
+    op = query.get("op", "")
+    if op not in BATCH_OPS:
+        raise ValidationError(f"Unknown batch op '{op}' (valid: {', '.join(BATCH_OPS)})")
+
+    if op == "version":
+        if version is None:
+            raise ValidationError("Notebook version is not known")
+        return version
+
+    if op == "validate":
+        return {"valid": not errors, "errors": errors}
+    if op == "cells":
+        return [asdict(c) for c in notebook.cells]
+    if op == "notebook":
+        return asdict(notebook)
+
+    cell_id = query.get("id", "")
+    if cell_id not in index:
+        raise ParseError(f"Cell not found: {cell_id}")
+    cell = notebook.cells[index[cell_id]]
+
+    if op == "cell":
+        return asdict(cell)
+
+    if op == "form":
+        fields = extract_form_fields(cell)
+        if fields is None:
+            raise ParseError(f"No form found in cell '{cell_id}'")
+        return [asdict(f) for f in fields]
+
+    prompt = format_form_prompt(cell)
+    if prompt is None:
+        raise ParseError(f"No form found in cell '{cell_id}'")
+    return prompt
+
+
+def run_batch(
+    notebook: Notebook, errors: list[str], queries: list[dict[str, str]], version: str | None = None
+) -> Iterator[dict[str, Any]]:
+    """Answer queries against a single parse, yielding one result record per query."""
+    index = build_cell_index(notebook)
+    for query in queries:
+        try:
+            yield {**query, "ok": True, "result": answer_query(notebook, index, errors, query, version)}
+        except NotebookError as e:
+            yield {**query, "ok": False, "error": str(e)}
+
+
 # ---------------------------------------------------------------------------
 # CLI
 # ---------------------------------------------------------------------------
 
 
-def main() -> int:
+def main(argv: list[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description="Parse an AnyT Notebook (.anyt.md) file into JSON")
     parser.add_argument("notebook", help="Path to .anyt.md file")
     parser.add_argument("--validate", action="store_true", help="Validate the notebook and report errors")
@@ -428,16 +837,48 @@ def main() -> int:
     parser.add_argument("--cell", help="Output a single cell by ID")
     parser.add_argument("--form", help="Extract form fields from an input cell by ID (outputs JSON)")
     parser.add_argument("--form-prompt", help="Generate a human-readable prompt for an input cell by ID")
+    parser.add_argument(
+        "--batch",
+        nargs="*",
+        metavar="QUERY",
+        help="Answer many queries from one parse, one JSON line per query. "
+        "QUERY is 'op' or 'op:id' (ops: cell, form, form-prompt, validate, cells, notebook, version), "
+        'or a single JSON list of {"op", "id"} objects. Reads the JSON list from stdin if omitted.',
+    )
     parser.add_argument("--pretty", action="store_true", default=True, help="Pretty-print JSON output (default: true)")
     parser.add_argument("--compact", action="store_true", help="Compact JSON output")
-    args = parser.parse_args()
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the parse cache under {workdir}/.anyt/")
+    args = parser.parse_args(argv)
+
+    stdin_text: str | None = None
+    if args.batch == []:
+        stdin_text = sys.stdin.read()
+        args.batch.append(stdin_text)
+
+    if argv is None:
+        forwarded = forward_cli("parse_notebook", sys.argv[1:], stdin=stdin_text)
+        if forwarded is not None:
+            return forwarded
 
     try:
         notebook_path = Path(args.notebook)
-        notebook = parse_notebook(notebook_path)
+        queries = parse_batch_queries(args.batch) if args.batch is not None else []
+        version: str | None = None
+        selected = args.validate or args.form or args.form_prompt or args.cell or args.cells_only
+        whole = args.batch is None and not selected  # the full dump reports the content version
+        if (whole or any(q.get("op") == "version" for q in queries)) and notebook_path.exists():
+            # Hashed before parsing, so an edit racing this read makes the version stale, never too new
+            version = notebook_version(notebook_path)
+        notebook, errors = load_notebook(notebook_path, use_cache=not args.no_cache)
+
+        if args.batch is not None:
+            failed = False
+            for result in run_batch(notebook, errors, queries, version):
+                failed = failed or not result["ok"]
+                print(json.dumps(result), flush=True)
+            return 1 if failed else 0
 
         if args.validate:
-            errors = validate_notebook(notebook)
             if errors:
                 print("Validation errors:", file=sys.stderr)
                 for err in errors:
@@ -447,43 +888,42 @@ def main() -> int:
             return 0
 
         indent = None if args.compact else 2
+        index = build_cell_index(notebook)
 
         if args.form:
-            for cell in notebook.cells:
-                if cell.id == args.form:
-                    fields = extract_form_fields(cell)
-                    if fields is None:
-                        print(f"No form found in cell '{args.form}'", file=sys.stderr)
-                        return 1
-                    print(json.dumps([asdict(f) for f in fields], indent=indent))
-                    return 0
-            print(f"Cell not found: {args.form}", file=sys.stderr)
-            return 1
+            if args.form not in index:
+                print(f"Cell not found: {args.form}", file=sys.stderr)
+                return 1
+            fields = extract_form_fields(notebook.cells[index[args.form]])
+            if fields is None:
+                print(f"No form found in cell '{args.form}'", file=sys.stderr)
+                return 1
+            print(json.dumps([asdict(f) for f in fields], indent=indent))
+            return 0
 
         if args.form_prompt:
-            for cell in notebook.cells:
-                if cell.id == args.form_prompt:
-                    prompt = format_form_prompt(cell)
-                    if prompt is None:
-                        print(f"No form found in cell '{args.form_prompt}'", file=sys.stderr)
-                        return 1
-                    print(prompt)
-                    return 0
-            print(f"Cell not found: {args.form_prompt}", file=sys.stderr)
-            return 1
+            if args.form_prompt not in index:
+                print(f"Cell not found: {args.form_prompt}", file=sys.stderr)
+                return 1
+            prompt = format_form_prompt(notebook.cells[index[args.form_prompt]])
+            if prompt is None:
+                print(f"No form found in cell '{args.form_prompt}'", file=sys.stderr)
+                return 1
+            print(prompt)
+            return 0
 
         if args.cell:
-            for cell in notebook.cells:
-                if cell.id == args.cell:
-                    print(json.dumps(asdict(cell), indent=indent))
-                    return 0
-            print(f"Cell not found: {args.cell}", file=sys.stderr)
-            return 1
+            if args.cell not in index:
+                print(f"Cell not found: {args.cell}", file=sys.stderr)
+                return 1
+            print(json.dumps(asdict(notebook.cells[index[args.cell]]), indent=indent))
+            return 0
 
         if args.cells_only:
             print(json.dumps([asdict(c) for c in notebook.cells], indent=indent))
         else:
-            print(json.dumps(asdict(notebook), indent=indent))
+            # ``version`` is the frontmatter field; edits take ``content_version`` as --expect-version
+            print(json.dumps({**asdict(notebook), "content_version": version}, indent=indent))
 
         return 0
 
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of cell results.
+
+Run with: uv run --project runtime runtime/result_cache.py <notebook.anyt.md> [--record CELL] [--compact]
+
+A cell's cache key is a SHA-256 over what decides its result:
+  - its type and content
+  - the agent it runs with (the profile's type, model and arguments), for task cells
+  - the saved response, for input cells
+  - the content of the files it reads that no cell in the notebook writes
+  - the keys of the cells it depends on, so a change upstream changes every key below it
+
+When the runner completes a shell cell, the key and the hashes of the files the cell
+declares as outputs are recorded in its ``.done`` marker and in an entry under
+``.anyt/result-cache/``, and its large outputs are kept in the blob store (blob_store.py).
+A done cell whose recorded key no longer matches is stale and runs again; a pending cell
+whose key has an entry is marked done from the entry without running, once its recorded
+outputs are on disk unchanged (stored outputs that were deleted or changed are restored).
+Cells with pattern or opaque reads or writes (a script that runs anything but plain file
+utilities, or names its files through variables or globs; a task that mentions no
+paths) are never reused, since their key does not cover what they read and there is
+nothing to check, and neither are the cells that depend on them. Task cells finished
+by an agent are recorded with ``--record``.
+
+Without --record, prints each cell's key and cache state: fresh, stale, unkeyed (done
+before keys were recorded), hit (pending with a usable entry) or miss.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import threading
+from dataclasses import asdict
+from pathlib import Path
+
+from blob_store import detach, materialize, preserve, store_files
+from cell_graph import CellGraph, build_graph, literal_paths
+from config import (
+    BARRIER_CELL_TYPES,
+    RESULT_CACHE_DIR_NAME,
+    RESULT_CACHE_FORMAT,
+    STATE_DIR_NAME,
+    NotebookError,
+    ParseError,
+    ValidationError,
+)
+from manage_state import StateWriter, get_all_status, read_input_response, read_marker
+from notebook_cache import ResidentCache, file_hash
+from parse_notebook import Cell, Notebook, load_notebook
+
+_ERROR_PREFIXES: dict[type[NotebookError], str] = {
+    ParseError: "Parse error",
+    ValidationError: "Validation error",
+}
+
+# Cell types whose results are worth caching; the others complete without doing any work
+CACHED_CELL_TYPES = ("shell", "task")
+
+# Marker fields carried over when a result is reused from the cache
+_REUSED_FIELDS = ("duration", "exit_code")
+
+
+def cache_dir(workdir: Path) -> Path:
+    return workdir / STATE_DIR_NAME / RESULT_CACHE_DIR_NAME
+
+
+def _entry_path(workdir: Path, key: str) -> Path:
+    return cache_dir(workdir) / key[:2] / f"{key}.json"
+
+
+def _write_atomic(path: Path, data: object) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _digest(data: object) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Path hashing
+# ---------------------------------------------------------------------------
+
+
+class PathHasher:
+    """SHA-256 of workspace files and directories, remembered by stat signature.
+
+    A file is hashed again only when its inode, mtime or size changes, so large media
+    inputs and outputs are read once rather than on every run. The memo is kept in
+    ``.anyt/result-cache/hashes.json`` between runs. Thread-safe.
+    """
+
+    def __init__(self, workdir: Path) -> None:
+        self.workdir = workdir
+        self._memo_path = cache_dir(workdir) / "hashes.json"
+        self._lock = threading.Lock()
+        self._changed = False
+        try:
+            self._memo: dict[str, list[object]] = json.loads(self._memo_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._memo = {}
+
+    def _file(self, path: Path) -> str:
+        signature = ResidentCache.signature(path)
+        key = str(path)
+        with self._lock:
+            known = self._memo.get(key)
+        if signature is not None and known is not None and known[:3] == list(signature):
+            return str(known[3])
+        digest = file_hash(path)
+        if signature is not None:
+            with self._lock:
+                self._memo[key] = [*signature, digest]
+                self._changed = True
+        return digest
+
+    def files(self, relative: str) -> dict[str, str]:
+        """Hashes of the files at a workspace path (the file itself, or a directory's files), by workspace path."""
+        path = self.workdir / relative
+        if path.is_file():
+            return {relative: self._file(path)}
+        found = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else []
+        return {f"{relative}/{p.relative_to(path).as_posix()}": self._file(p) for p in found}
+
+    def hash(self, relative: str) -> str | None:
+        """Hash of a workspace path: file content, or the names and content of a directory's files. None if missing."""
+        path = self.workdir / relative
+        try:
+            if path.is_file():
+                return self._file(path)
+            if path.is_dir():
+                return _digest([[name[len(relative) + 1 :], digest] for name, digest in self.files(relative).items()])
+        except OSError:
+            pass
+        return None
+
+    def remember(self, relative: str, digest: str) -> None:
+        """Record the hash of a file whose content is known, such as one just replaced by a link to its object."""
+        path = self.workdir / relative
+        signature = ResidentCache.signature(path)
+        if signature is not None:
+            with self._lock:
+                self._memo[str(path)] = [*signature, digest]
+                self._changed = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._changed:
+                return
+            memo, self._changed = dict(self._memo), False
+        with contextlib.suppress(OSError):
+            _write_atomic(self._memo_path, memo)
+
+
+# ---------------------------------------------------------------------------
+# Cache keys
+# ---------------------------------------------------------------------------
+
+
+def _agent(notebook: Notebook, cell: Cell) -> dict[str, object] | None:
+    """The agent a task cell runs with: its profile, a bare agent type, or the default profile."""
+    profiles = {profile.id: profile for profile in notebook.agents}
+    profile = profiles.get(cell.agent) if cell.agent else None
+    if profile is None and cell.agent:
+        return {"type": cell.agent}
+    if profile is None:
+        profile = next((p for p in notebook.agents if p.default), None)
+    if profile is None:
+        return None
+    fields = asdict(profile)
+    return {name: fields[name] for name in ("type", "model", "permission_mode", "additional_args")}
+
+
+def cell_keys(notebook: Notebook, graph: CellGraph, workdir: Path, hasher: PathHasher) -> dict[str, str]:
+    """Cache key of every cell, from its content, agent, input files and the keys of its dependencies."""
+    cells = {cell.id: cell for cell in notebook.cells}
+    keys: dict[str, str] = {}
+    for node in graph.nodes:
+        cell = cells[node.id]
+        parts: dict[str, object] = {
+            "format": RESULT_CACHE_FORMAT,
+            "type": cell.cell_type,
+            "content": cell.content,
+            "depends_on": {dep: keys[dep] for dep in node.depends_on},
+        }
+        if cell.cell_type == "task":
+            parts["agent"] = _agent(notebook, cell)
+        if cell.cell_type == "input":
+            parts["response"] = read_input_response(workdir, cell.id)
+        if cell.cell_type in CACHED_CELL_TYPES:
+            parts["files"] = {path: hasher.hash(path) for path in graph.external_reads(node)}
+        keys[node.id] = _digest(parts)
+    return keys
+
+
+class ResultCache:
+    """Cache keys and stored results for the cells of one notebook in one workspace."""
+
+    def __init__(self, notebook: Notebook, workdir: Path, graph: CellGraph | None = None) -> None:
+        self.workdir = workdir
+        self.graph = graph or build_graph(notebook, BARRIER_CELL_TYPES)
+        self.hasher = PathHasher(workdir)
+        self.keys = cell_keys(notebook, self.graph, workdir, self.hasher)
+        self._outputs = {node.id: literal_paths(node.writes) for node in self.graph.nodes}
+        # Results are reused only when the key covers every input and every output can be
+        # checked: no pattern or opaque reads or writes, here or in any dependency
+        self._checkable: set[str] = set()
+        for node in self.graph.nodes:
+            analysed = not any("*" in path for path in (*node.reads, *node.writes))
+            if analysed and all(dep in self._checkable for dep in node.depends_on):
+                self._checkable.add(node.id)
+
+    def output_hashes(self, cell_id: str) -> dict[str, str | None]:
+        """Current hashes of the files a cell declares as outputs (None for a missing one)."""
+        return {path: self.hasher.hash(path) for path in self._outputs[cell_id]}
+
+    def is_stale(self, cell_id: str, marker: dict[str, object] | None) -> bool:
+        """Whether a done cell was completed under a different key. Cells done without a key are trusted."""
+        recorded = (marker or {}).get("cache_key")
+        return recorded is not None and recorded != self.keys[cell_id]
+
+    def record_fields(self, cell_id: str) -> dict[str, object]:
+        """Marker fields that tie a result to its key: the key and the output hashes."""
+        return {"cache_key": self.keys[cell_id], "outputs": self.output_hashes(cell_id)}
+
+    def store(self, cell_id: str, marker: dict[str, object]) -> None:
+        """Keep a completed cell's result under its key. ``marker`` must carry ``record_fields``."""
+        key = str(marker["cache_key"])
+        digests = {name: d for path in self._outputs[cell_id] for name, d in self.hasher.files(path).items()}
+        objects = store_files(self.workdir, cell_id, self._outputs[cell_id], digests)
+        for name, digest in objects.items():
+            self.hasher.remember(name, digest)  # now a link to the object: a new inode, same content
+        entry: dict[str, object] = {
+            "format": RESULT_CACHE_FORMAT,
+            "key": key,
+            "cell": cell_id,
+            "marker": marker,
+            "objects": objects,
+        }
+        with contextlib.suppress(OSError):
+            _write_atomic(_entry_path(self.workdir, key), entry)
+
+    def prepare(self, cell_id: str) -> None:
+        """Before a cell runs: keep the outputs it is about to overwrite in the blob store.
+
+        Copies outputs whose object was deferred (see blob_store.py), so an earlier result
+        can still be restored, and gives private copies to outputs hardlinked to the store by
+        older versions.
+        """
+        digests = {name: d for path in self._outputs[cell_id] for name, d in self.hasher.files(path).items()}
+        preserve(self.workdir, self._outputs[cell_id], digests)
+        detach(self.workdir, self._outputs[cell_id])
+
+    def lookup(self, cell_id: str) -> dict[str, object] | None:
+        """Marker fields to complete a cell from the cache, or None if there is no entry or its outputs changed."""
+        if cell_id not in self._checkable:
+            return None
+        try:
+            entry = json.loads(_entry_path(self.workdir, self.keys[cell_id]).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        marker = entry.get("marker") if entry.get("format") == RESULT_CACHE_FORMAT else None
+        if not isinstance(marker, dict):
+            return None
+        objects = entry.get("objects")
+        if isinstance(objects, dict):
+            # Outputs deleted or changed since are restored from the blob store
+            for name, digest in objects.items():
+                if self.hasher.hash(name) != digest and materialize(self.workdir, digest, name):
+                    self.hasher.remember(name, digest)
+        outputs = marker.get("outputs")
+        if not isinstance(outputs, dict) or outputs != self.output_hashes(cell_id):
+            return None
+        reused: dict[str, object] = {name: marker[name] for name in _REUSED_FIELDS if name in marker}
+        reused.update(cache_key=self.keys[cell_id], outputs=outputs, cached=True)
+        return reused
+
+    def save(self) -> None:
+        self.hasher.save()
+
+
+def record_cell(cache: ResultCache, cell_id: str) -> dict[str, object]:
+    """Record the key and outputs of a cell that is already done (a task finished by an agent)."""
+    marker = read_marker(cache.workdir, cell_id)
+    if marker is None or marker.get("status") != "done":
+        raise ValidationError(f"Cell '{cell_id}' is not done")
+    extra = {name: value for name, value in marker.items() if name not in ("status", "timestamp", "cached")}
+    extra.update(cache.record_fields(cell_id))
+    with StateWriter(cache.workdir) as state:
+        data = state.mark_done(cell_id, extra=extra)
+    cache.store(cell_id, data)
+    cache.save()
+    return data
+
+
+def cache_report(notebook: Notebook, cache: ResultCache) -> list[dict[str, str]]:
+    """Each cell's key and cache state: fresh, stale, unkeyed, hit or miss."""
+    ids = [cell.id for cell in notebook.cells]
+    report: list[dict[str, str]] = []
+    for entry in get_all_status(cache.workdir, ids):
+        cid, status = entry["id"], entry["status"]
+        marker = read_marker(cache.workdir, cid, status) if status == "done" else None
+        if marker is not None:
+            state = "stale" if cache.is_stale(cid, marker) else "fresh" if "cache_key" in marker else "unkeyed"
+        elif status == "skipped":
+            state = "fresh"
+        else:
+            state = "hit" if cache.lookup(cid) is not None else "miss"
+        report.append({"id": cid, "status": status, "key": cache.keys[cid], "cache": state})
+    cache.save()
+    return report
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Show or record cached cell results of an AnyT Notebook")
+    parser.add_argument("notebook", help="Path to .anyt.md file")
+    parser.add_argument("--record", action="append", metavar="CELL", help="Record the result of a done cell")
+    parser.add_argument("--workspace-dir", help="Override the notebook's workdir")
+    parser.add_argument("--compact", action="store_true", help="Print compact JSON")
+    args = parser.parse_args()
+
+    file_path = Path(args.notebook)
+    try:
+        notebook, errors = load_notebook(file_path)
+        if errors:
+            raise ValidationError("; ".join(errors))
+
+        workdir = Path(args.workspace_dir) if args.workspace_dir else file_path.resolve().parent / notebook.workdir
+        cache = ResultCache(notebook, workdir)
+        if args.record:
+            unknown = [cid for cid in args.record if cid not in cache.keys]
+            if unknown:
+                raise ValidationError(f"Unknown cell: {', '.join(unknown)}")
+            result: object = [{"id": cid, **record_cell(cache, cid)} for cid in args.record]
+        else:
+            result = cache_report(notebook, cache)
+        print(json.dumps(result, indent=None if args.compact else 2))
+        return 0
+
+    except NotebookError as e:
+        prefix = _ERROR_PREFIXES.get(type(e), "Error")
+        print(f"\n{prefix}: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
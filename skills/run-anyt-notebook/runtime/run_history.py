@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+History of notebook runs, kept as snapshots of the cell state directories.
+
+Run with: uv run --project runtime runtime/run_history.py <workdir> <command> [options]
+
+Commands:
+  list      List recorded runs, oldest first
+  show      Show one run's cells and state files
+  trend     Show how a cell's duration and metrics changed over the runs that ran it
+  diff      Compare the cell state of two runs
+  prune     Delete all but the newest runs and the snapshots only they used
+
+The runner records a run each time it stops (complete, failed or paused) in
+``{workdir}/.anyt/runs/<run-id>/run.json`` and points ``.anyt/runs/current`` at it.
+The live state in ``.anyt/cells`` stays where every tool reads and writes it; a run
+is a manifest of the files in each cell directory at that point, by SHA-256.
+
+File contents live once in ``.anyt/runs/objects/<sha[:2]>/<sha>``, so a run only adds
+the markers and artifacts that changed since the one before. Files are hashed only
+when their (inode, mtime, size) differ from the previous run's, and files larger than
+``RUN_SNAPSHOT_MAX_BYTES`` (long logs; large outputs are in the blob store already)
+are listed with their size but not copied.
+
+Runs are named by their start time, and can be referred to as ``current``,
+``current~N`` (N runs before it) or by any unique prefix of their id.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import sys
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+from config import (
+    CELLS_DIR_NAME,
+    MARKER_DONE,
+    MARKER_FAILED,
+    MARKER_SKIPPED,
+    RUN_CURRENT_NAME,
+    RUN_HISTORY_FORMAT,
+    RUN_OBJECTS_DIR_NAME,
+    RUN_SNAPSHOT_MAX_BYTES,
+    RUNS_DIR_NAME,
+    STATE_DIR_NAME,
+    NotebookError,
+    ValidationError,
+)
+from manage_state import list_status
+from notebook_cache import ResidentCache
+
+_ERROR_PREFIXES: dict[type[NotebookError], str] = {
+    ValidationError: "Validation error",
+}
+
+_MARKERS = (MARKER_DONE, MARKER_FAILED, MARKER_SKIPPED)
+
+# Marker metrics shown in trends
+_TREND_METRICS = ("cpu_seconds", "peak_rss_bytes", "bytes_read", "bytes_written")
+
+
+def runs_dir(workdir: Path) -> Path:
+    return workdir / STATE_DIR_NAME / RUNS_DIR_NAME
+
+
+def _objects_dir(workdir: Path) -> Path:
+    return runs_dir(workdir) / RUN_OBJECTS_DIR_NAME
+
+
+def _object_path(workdir: Path, digest: str) -> Path:
+    return _objects_dir(workdir) / digest[:2] / digest
+
+
+def _run_path(workdir: Path, run_id: str) -> Path:
+    return runs_dir(workdir) / run_id / "run.json"
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _new_run_id() -> str:
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%fZ}-{secrets.token_hex(2)}"
+
+
+# ---------------------------------------------------------------------------
+# Reading runs
+# ---------------------------------------------------------------------------
+
+
+def current_run(workdir: Path) -> str | None:
+    """Id of the most recently recorded run, or None if no run was recorded."""
+    try:
+        run_id = (runs_dir(workdir) / RUN_CURRENT_NAME).read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    return run_id if _run_path(workdir, run_id).is_file() else None
+
+
+def read_run(workdir: Path, run_id: str) -> dict[str, object]:
+    try:
+        data = json.loads(_run_path(workdir, run_id).read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        raise ValidationError(f"Run '{run_id}' not found") from e
+    if not isinstance(data, dict):
+        raise ValidationError(f"Run '{run_id}' is not a valid run record")
+    return data
+
+
+def list_runs(workdir: Path) -> list[str]:
+    """Ids of the recorded runs, oldest first."""
+    root = runs_dir(workdir)
+    with contextlib.suppress(FileNotFoundError):
+        return sorted(p.name for p in root.iterdir() if (p / "run.json").is_file())
+    return []
+
+
+def resolve_run(workdir: Path, ref: str) -> str:
+    """Run id for ``current``, ``current~N`` or a unique prefix of an id."""
+    runs = list_runs(workdir)
+    if ref == RUN_CURRENT_NAME or ref.startswith(f"{RUN_CURRENT_NAME}~"):
+        current = current_run(workdir)
+        if current is None:
+            raise ValidationError("No run has been recorded")
+        back = ref.partition("~")[2]
+        if not back:
+            return current
+        if not back.isdigit():
+            raise ValidationError(f"Invalid run reference '{ref}'")
+        position = runs.index(current) - int(back)
+        if position < 0:
+            raise ValidationError(f"Only {runs.index(current)} runs before the current one")
+        return runs[position]
+    matches = [run_id for run_id in runs if run_id.startswith(ref)]
+    if len(matches) != 1:
+        raise ValidationError(f"{'Ambiguous' if matches else 'Unknown'} run '{ref}'")
+    return matches[0]
+
+
+def _cells(run: dict[str, object]) -> dict[str, dict[str, object]]:
+    cells = run.get("cells")
+    return cells if isinstance(cells, dict) else {}
+
+
+def _files(entry: dict[str, object] | None) -> dict[str, dict[str, object]]:
+    files = entry.get("files") if entry else None
+    return files if isinstance(files, dict) else {}
+
+
+def read_snapshot(workdir: Path, run: dict[str, object], cell_id: str, name: str) -> bytes | None:
+    """Contents of a cell state file as a run recorded it. None if it was not recorded or not copied."""
+    digest = _files(_cells(run).get(cell_id)).get(name, {}).get("sha")
+    if not isinstance(digest, str):
+        return None
+    try:
+        return _object_path(workdir, digest).read_bytes()
+    except OSError:
+        return None
+
+
+def _marker(workdir: Path, run: dict[str, object], cell_id: str) -> tuple[str | None, dict[str, object]]:
+    """The digest and contents of a cell's marker in a run; (None, {}) if the cell had none."""
+    files = _files(_cells(run).get(cell_id))
+    for name in _MARKERS:
+        if name in files:
+            data = read_snapshot(workdir, run, cell_id, name)
+            try:
+                marker = json.loads(data) if data else {}
+            except ValueError:
+                marker = {}
+            return str(files[name].get("sha")), marker if isinstance(marker, dict) else {}
+    return None, {}
+
+
+# ---------------------------------------------------------------------------
+# Recording runs
+# ---------------------------------------------------------------------------
+
+
+def _state_files(cell_dir: Path) -> list[Path]:
+    files = []
+    for path in cell_dir.rglob("*"):
+        # Skip temporary files of writes in progress
+        if path.is_file() and not path.is_symlink() and not (path.name.startswith(".") and path.suffix == ".tmp"):
+            files.append(path)
+    return sorted(files)
+
+
+def _store(workdir: Path, data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    target = _object_path(workdir, digest)
+    if not target.exists():
+        _write_atomic(target, data)
+    return digest
+
+
+def record_run(
+    workdir: Path,
+    notebook: str | None = None,
+    status: str | None = None,
+    started_at: str | None = None,
+    wall_seconds: float | None = None,
+) -> str:
+    """Snapshot every cell's state directory as a new run and make it current. Returns the run id."""
+    parent = current_run(workdir)
+    previous = _cells(read_run(workdir, parent)) if parent else {}
+    statuses = list_status(workdir)
+    cells_root = workdir / STATE_DIR_NAME / CELLS_DIR_NAME
+
+    cells: dict[str, object] = {}
+    for cid in sorted(statuses):
+        cell_dir = cells_root / cid
+        known = _files(previous.get(cid))
+        files: dict[str, object] = {}
+        for path in _state_files(cell_dir):
+            name = path.relative_to(cell_dir).as_posix()
+            signature = ResidentCache.signature(path)
+            if signature is None:
+                continue  # removed while we were looking
+            entry: dict[str, object] = {"size": signature[2], "sig": list(signature)}
+            before = known.get(name, {})
+            if before.get("sig") == list(signature) and "sha" in before:
+                entry["sha"] = before["sha"]  # unchanged since the last run
+            elif signature[2] <= RUN_SNAPSHOT_MAX_BYTES:
+                with contextlib.suppress(OSError):
+                    entry["sha"] = _store(workdir, path.read_bytes())
+            files[name] = entry
+        cells[cid] = {"status": statuses[cid], "files": files}
+
+    run_id = _new_run_id()
+    record: dict[str, object] = {
+        "format": RUN_HISTORY_FORMAT,
+        "id": run_id,
+        "parent": parent,
+        "notebook": notebook,
+        "status": status,
+        "started_at": started_at,
+        "finished_at": _now_iso(),
+        "wall_seconds": wall_seconds,
+        "cells": cells,
+    }
+    _write_atomic(_run_path(workdir, run_id), json.dumps(record, indent=1).encode("utf-8"))
+    _write_atomic(runs_dir(workdir) / RUN_CURRENT_NAME, f"{run_id}\n".encode())
+    return run_id
+
+
+# ---------------------------------------------------------------------------
+# Comparing runs
+# ---------------------------------------------------------------------------
+
+
+def cell_trend(workdir: Path, cell_id: str) -> list[dict[str, object]]:
+    """One row per run that produced a new marker for the cell, with its duration and change since the last one.
+
+    Runs that carried the cell's marker over unchanged (it was not run again) are left out.
+    """
+    rows: list[dict[str, object]] = []
+    last_digest: str | None = None
+    last_duration: float | None = None
+    for run_id in list_runs(workdir):
+        run = read_run(workdir, run_id)
+        digest, marker = _marker(workdir, run, cell_id)
+        if digest is None or digest == last_digest:
+            continue
+        last_digest = digest
+        duration = marker.get("duration")
+        row: dict[str, object] = {"run": run_id, "status": marker.get("status"), "duration": duration}
+        if marker.get("cached"):
+            row["cached"] = True
+        metrics = marker.get("metrics")
+        if isinstance(metrics, dict):
+            row.update({name: metrics[name] for name in _TREND_METRICS if name in metrics})
+        if isinstance(duration, (int, float)) and not marker.get("cached"):
+            if last_duration is not None:
+                row["change_seconds"] = round(duration - last_duration, 6)
+                row["change_ratio"] = round(duration / last_duration, 3) if last_duration else None
+            last_duration = float(duration)
+        rows.append(row)
+    return rows
+
+
+def _version(entry: dict[str, object]) -> object:
+    # Files too large to copy have no hash; their signature tells whether they changed
+    return entry.get("sha") or entry.get("sig")
+
+
+def diff_runs(workdir: Path, old_id: str, new_id: str) -> dict[str, object]:
+    """Cells whose state differs between two runs: status, duration and the state files added, removed or changed."""
+    old, new = read_run(workdir, old_id), read_run(workdir, new_id)
+    old_cells, new_cells = _cells(old), _cells(new)
+    changed: list[dict[str, object]] = []
+    for cid in sorted(old_cells.keys() | new_cells.keys()):
+        before, after = _files(old_cells.get(cid)), _files(new_cells.get(cid))
+        files = {
+            "added": sorted(after.keys() - before.keys()),
+            "removed": sorted(before.keys() - after.keys()),
+            "changed": sorted(
+                name for name in before.keys() & after.keys() if _version(before[name]) != _version(after[name])
+            ),
+        }
+        if not any(files.values()):
+            continue
+        row: dict[str, object] = {
+            "id": cid,
+            "status": [(old_cells.get(cid) or {}).get("status"), (new_cells.get(cid) or {}).get("status")],
+        }
+        (_, old_marker), (_, new_marker) = _marker(workdir, old, cid), _marker(workdir, new, cid)
+        old_duration, new_duration = old_marker.get("duration"), new_marker.get("duration")
+        row["duration"] = [old_duration, new_duration]
+        if isinstance(old_duration, (int, float)) and isinstance(new_duration, (int, float)):
+            row["change_seconds"] = round(new_duration - old_duration, 6)
+        # Outputs whose content hash changed, from the result cache fields in the markers
+        old_outputs, new_outputs = old_marker.get("outputs"), new_marker.get("outputs")
+        if isinstance(old_outputs, dict) and isinstance(new_outputs, dict):
+            row["outputs_changed"] = sorted(
+                p for p in old_outputs.keys() | new_outputs.keys() if old_outputs.get(p) != new_outputs.get(p)
+            )
+        row["files"] = files
+        changed.append(row)
+    return {
+        "old": old_id,
+        "new": new_id,
+        "unchanged": len(old_cells.keys() | new_cells.keys()) - len(changed),
+        "cells": changed,
+    }
+
+
+def prune_runs(workdir: Path, keep: int) -> dict[str, int]:
+    """Delete all but the newest ``keep`` runs (never the current one) and the objects no remaining run uses."""
+    if keep < 1:
+        raise ValidationError("--keep must be at least 1")
+    runs = list_runs(workdir)
+    current = current_run(workdir)
+    doomed = [run_id for run_id in runs[:-keep] if run_id != current]
+    for run_id in doomed:
+        shutil.rmtree(runs_dir(workdir) / run_id, ignore_errors=True)
+
+    used = {
+        str(entry["sha"])
+        for run_id in list_runs(workdir)
+        for cell in _cells(read_run(workdir, run_id)).values()
+        for entry in _files(cell).values()
+        if "sha" in entry
+    }
+    removed, freed = 0, 0
+    root = _objects_dir(workdir)
+    for obj in root.glob("??/*") if root.is_dir() else []:
+        if obj.name in used or obj.name.startswith("."):
+            continue
+        freed += obj.stat().st_size
+        obj.unlink()
+        removed += 1
+    return {"runs_removed": len(doomed), "objects_removed": removed, "freed_bytes": freed}
+
+
+def _summary(run: dict[str, object]) -> dict[str, object]:
+    cells = _cells(run)
+    statuses = [str(c.get("status")) for c in cells.values()]
+    return {
+        **{k: run.get(k) for k in ("id", "notebook", "status", "started_at", "finished_at", "wall_seconds")},
+        "cells": {status: statuses.count(status) for status in sorted(set(statuses))},
+    }
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Recorded runs of an AnyT Notebook workspace")
+    parser.add_argument("workdir", help="Notebook working directory")
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # list command
+    subparsers.add_parser("list", help="List recorded runs")
+
+    # show command
+    show_parser = subparsers.add_parser("show", help="Show a run's cells and state files")
+    show_parser.add_argument("run", nargs="?", default=RUN_CURRENT_NAME, help="Run (default: current)")
+
+    # trend command
+    trend_parser = subparsers.add_parser("trend", help="Show a cell's duration across runs")
+    trend_parser.add_argument("--cell", required=True, help="Cell ID")
+
+    # diff command
+    diff_parser = subparsers.add_parser("diff", help="Compare two runs")
+    diff_parser.add_argument("old", help="Earlier run")
+    diff_parser.add_argument("new", nargs="?", default=RUN_CURRENT_NAME, help="Later run (default: current)")
+
+    # prune command
+    prune_parser = subparsers.add_parser("prune", help="Delete old runs")
+    prune_parser.add_argument("--keep", type=int, required=True, help="Number of newest runs to keep")
+
+    args = parser.parse_args(argv)
+
+    try:
+        workdir = Path(args.workdir)
+        if args.command == "list":
+            result: object = [_summary(read_run(workdir, run_id)) for run_id in list_runs(workdir)]
+        elif args.command == "show":
+            result = read_run(workdir, resolve_run(workdir, args.run))
+        elif args.command == "trend":
+            result = cell_trend(workdir, args.cell)
+        elif args.command == "diff":
+            result = diff_runs(workdir, resolve_run(workdir, args.old), resolve_run(workdir, args.new))
+        else:
+            result = prune_runs(workdir, args.keep)
+        print(json.dumps(result, indent=2))
+        return 0
+
+    except NotebookError as e:
+        prefix = _ERROR_PREFIXES.get(type(e), "Error")
+        print(f"\n{prefix}: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Run the shell cells of an AnyT Notebook in parallel, following the cell dependency graph.
+
+Run with: uv run --project runtime runtime/run_notebook.py <notebook.anyt.md> [--workers N] [--skip-breaks] [--rerun]
+
+Cells are scheduled from cell_graph.py, with input and break cells as barriers: a
+shell cell starts as soon as the cells it depends on are done, up to --workers at a
+time. Note cells complete immediately, input cells complete once a response has been
+saved, and break cells complete when skipped. Task cells are left to the agent that
+runs them (notebook-cli, or an agent calling ``manage_state.py mark-done``); shell
+cells that do not depend on a pending task still run.
+
+Each shell cell's ``.done`` or ``.failed`` marker records its duration, exit code,
+start and finish times, and resource metrics (see cell_metrics.py). Cells already
+done or skipped are not run again, so calling this again after answering an input,
+reviewing a break or finishing a task resumes the notebook. After a failure no new
+cells are started; a cell whose runner itself fails (e.g. its state directory is not
+writable) is marked failed like one whose command failed.
+
+Results are cached by content (see result_cache.py): a done cell whose content or
+inputs changed since it ran is run again, and a cell whose cache key matches an
+earlier result with unchanged outputs is completed from the cache. --rerun resets
+every cell but keeps the cache, so only cells that changed actually run.
+
+Each call records a run in ``.anyt/runs`` (see run_history.py), a snapshot of every
+cell's markers and small state files, so runs can be compared afterwards.
+
+Prints a JSON summary. Exit codes: 0 complete, 1 a cell failed, 10 waiting for input,
+11 waiting at a break, 12 waiting for a task.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+from cell_graph import build_graph
+from cell_log import CellLogWriter
+from cell_metrics import ProcessSampler, read_remote_calls, shell_metrics
+from config import (
+    BARRIER_CELL_TYPES,
+    CELL_METRICS_ENV,
+    CELL_METRICS_FILE_NAME,
+    CELLS_DIR_NAME,
+    DEFAULT_RUN_WORKERS,
+    EXIT_WAITING_BREAK,
+    EXIT_WAITING_INPUT,
+    EXIT_WAITING_TASK,
+    STATE_DIR_NAME,
+    ExecutionError,
+    NotebookError,
+    ParseError,
+    ValidationError,
+)
+from manage_state import (
+    StateWriter,
+    get_all_status,
+    read_input_response,
+    read_marker,
+    save_shell_script,
+)
+from parse_notebook import Cell, Notebook, load_notebook
+from result_cache import CACHED_CELL_TYPES, ResultCache
+from run_history import record_run
+
+_ERROR_PREFIXES: dict[type[NotebookError], str] = {
+    ExecutionError: "Execution error",
+    ParseError: "Parse error",
+    ValidationError: "Validation error",
+}
+
+# Largest read from a running cell's output pipe
+_READ_CHUNK_BYTES = 1 << 16
+
+# Run status -> exit code, for runs that stop early
+_EXIT_CODES = {
+    "complete": 0,
+    "failed": 1,
+    "waiting-input": EXIT_WAITING_INPUT,
+    "waiting-break": EXIT_WAITING_BREAK,
+    "waiting-task": EXIT_WAITING_TASK,
+}
+
+
+@dataclass(slots=True)
+class CellResult:
+    id: str
+    cell_type: str
+    status: str  # "done", "failed", "skipped", "waiting" or "blocked"
+    started_at: str | None = None
+    finished_at: str | None = None
+    duration: float | None = None
+    exit_code: int | None = None
+    error: str | None = None
+    cached: bool = False
+    metrics: dict[str, object] | None = None
+
+
+@dataclass(slots=True)
+class RunResult:
+    status: str  # "complete", "failed", "waiting-input", "waiting-break" or "waiting-task"
+    workers: int
+    wall_seconds: float
+    busy_seconds: float
+    cells: list[CellResult]
+    run_id: str | None = None  # the run recorded in .anyt/runs (see run_history.py)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# ---------------------------------------------------------------------------
+# Environment
+# ---------------------------------------------------------------------------
+
+
+def load_env_file(path: Path) -> dict[str, str]:
+    """Read ``KEY=VALUE`` lines from a .env file. Missing files give an empty mapping."""
+    env: dict[str, str] = {}
+    try:
+        text = path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return env
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("export "):
+            line = line[len("export ") :].lstrip()
+        key, sep, value = line.partition("=")
+        if not sep:
+            continue
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in ('"', "'"):
+            value = value[1:-1]
+        env[key.strip()] = value
+    return env
+
+
+def notebook_env(notebook: Notebook, notebook_dir: Path) -> dict[str, str]:
+    """The environment shell cells run with: this process's, overridden by the notebook's env_file."""
+    env_path = Path(notebook.env_file)
+    if not env_path.is_absolute():
+        env_path = notebook_dir / env_path
+    return {**os.environ, **load_env_file(env_path)}
+
+
+# ---------------------------------------------------------------------------
+# Cell execution
+# ---------------------------------------------------------------------------
+
+
+def run_shell_cell(
+    workdir: Path,
+    cell: Cell,
+    env: dict[str, str] | None = None,
+    login: bool = True,
+    state: StateWriter | None = None,
+    cache: ResultCache | None = None,
+) -> CellResult:
+    """Run one shell cell in ``workdir`` (as a login shell by default) and write its output and marker.
+
+    With ``state``, the transition is buffered there for the caller to commit; otherwise it is committed here.
+    With ``cache``, a successful result is recorded under the cell's cache key.
+    """
+    save_shell_script(workdir, cell.id, cell.content)
+    if cache is not None:
+        cache.prepare(cell.id)
+    # Tools the cell runs may append remote call timings here (see cell_metrics.py)
+    metrics_file = workdir / STATE_DIR_NAME / CELLS_DIR_NAME / cell.id / CELL_METRICS_FILE_NAME
+    metrics_file.unlink(missing_ok=True)
+    started_at = _now_iso()
+    start = time.perf_counter()
+    exit_code: int | None = None
+    error: str | None = None
+    usage: resource.struct_rusage | None = None
+    sampler: ProcessSampler | None = None
+    # Output is streamed into the rotating log as it arrives rather than held in memory
+    with CellLogWriter(workdir, cell.id) as log:
+        try:
+            proc = subprocess.Popen(
+                ["bash", "-l", "-c", cell.content] if login else ["bash", "-c", cell.content],
+                cwd=workdir,
+                env={**(os.environ if env is None else env), CELL_METRICS_ENV: str(metrics_file.resolve())},
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            )
+        except OSError as e:
+            error = f"Could not start shell: {e}"
+        else:
+            sampler = ProcessSampler(proc.pid).start()
+            stdout = proc.stdout
+            assert stdout is not None
+            with stdout:
+                fd = stdout.fileno()
+                for chunk in iter(lambda: os.read(fd, _READ_CHUNK_BYTES), b""):
+                    log.write(chunk)
+            # Reap the shell ourselves: wait4 also gives the resources it and its children used
+            _, wait_status, usage = os.wait4(proc.pid, 0)
+            exit_code = proc.returncode = os.waitstatus_to_exitcode(wait_status)
+            sampler.stop()
+            if exit_code != 0:
+                error = f"Exit code {exit_code}"
+    duration = round(time.perf_counter() - start, 6)
+    finished_at = _now_iso()
+    metrics = shell_metrics(duration, usage, sampler, read_remote_calls(metrics_file))
+    times: dict[str, object] = {
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "exit_code": exit_code,
+        "metrics": metrics,
+    }
+    writer = state or StateWriter(workdir)
+    if error is None:
+        if cache is not None:
+            times.update(cache.record_fields(cell.id))
+        marker = writer.mark_done(cell.id, duration, extra=times)
+        if cache is not None:
+            cache.store(cell.id, marker)
+    else:
+        writer.mark_failed(cell.id, error, duration, extra=times)
+    if state is None:
+        writer.commit()
+
+    return CellResult(
+        id=cell.id,
+        cell_type=cell.cell_type,
+        status="done" if error is None else "failed",
+        started_at=started_at,
+        finished_at=finished_at,
+        duration=duration,
+        exit_code=exit_code,
+        error=error,
+        metrics=metrics,
+    )
+
+
+def _settle_cell(workdir: Path, cell: Cell, skip_breaks: bool, state: StateWriter) -> CellResult:
+    """Complete a non-shell cell that needs no process, or report it as waiting."""
+    result = CellResult(id=cell.id, cell_type=cell.cell_type, status="waiting")
+    if cell.cell_type == "note" or (cell.cell_type == "input" and read_input_response(workdir, cell.id) is not None):
+        result.started_at = result.finished_at = _now_iso()
+        state.mark_done(cell.id, 0.0, extra={"started_at": result.started_at, "finished_at": result.finished_at})
+        result.status, result.duration = "done", 0.0
+    elif cell.cell_type == "break" and (cell.skip or skip_breaks):
+        state.mark_skipped(cell.id)
+        result.status = "skipped"
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Scheduling
+# ---------------------------------------------------------------------------
+
+
+def run_notebook(
+    notebook: Notebook,
+    workdir: Path,
+    workers: int = DEFAULT_RUN_WORKERS,
+    skip_breaks: bool = False,
+    env: dict[str, str] | None = None,
+    login: bool = True,
+    rerun: bool = False,
+) -> RunResult:
+    """Run every cell whose dependencies are complete, starting shell cells as soon as they are ready.
+
+    With ``rerun``, all cell state is reset first; cached results still apply.
+    """
+    start = time.perf_counter()
+    started_at = _now_iso()
+    workdir.mkdir(parents=True, exist_ok=True)
+    graph = build_graph(notebook, BARRIER_CELL_TYPES)
+    cells = {cell.id: cell for cell in notebook.cells}
+    depends_on = {node.id: node.depends_on for node in graph.nodes}
+
+    # Transitions from finished workers are committed together, once per scheduling round
+    state = StateWriter(workdir)
+    if rerun:
+        state.reset_all()
+        state.commit()
+    cache = ResultCache(notebook, workdir, graph)
+
+    results: dict[str, CellResult] = {}
+    complete: set[str] = set()
+    pending: list[str] = []  # notebook order, so barriers and earlier cells are considered first
+    for entry in get_all_status(workdir, list(cells)):
+        cid, status = entry["id"], entry["status"]
+        stale = (
+            status == "done"
+            and cells[cid].cell_type in CACHED_CELL_TYPES
+            and cache.is_stale(cid, read_marker(workdir, cid, status))
+        )
+        if stale:
+            state.reset(cid)
+        if status in ("done", "skipped") and not stale:
+            complete.add(cid)
+            results[cid] = CellResult(id=cid, cell_type=cells[cid].cell_type, status=status)
+        else:
+            pending.append(cid)
+
+    failed = False
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running: dict[Future[CellResult], str] = {}
+        while True:
+            state.commit()  # before dependents of the cells that just finished start
+            # Start ready cells while workers are free; settling a cell can make later ones ready
+            progressed = not failed
+            while progressed:
+                progressed = False
+                for cid in list(pending):
+                    if len(running) >= workers:
+                        break
+                    if not all(dep in complete for dep in depends_on[cid]):
+                        continue
+                    pending.remove(cid)
+                    cell = cells[cid]
+                    cached = cache.lookup(cid) if cell.cell_type in CACHED_CELL_TYPES else None
+                    if cached is not None:
+                        print(f"[cached] {cid}", file=sys.stderr, flush=True)
+                        cache.store(cid, state.mark_done(cid, extra=cached))
+                        results[cid] = CellResult(id=cid, cell_type=cell.cell_type, status="done", cached=True)
+                    elif cell.cell_type == "shell":
+                        print(f"[start] {cid}", file=sys.stderr, flush=True)
+                        running[pool.submit(run_shell_cell, workdir, cell, env, login, state, cache)] = cid
+                        continue
+                    else:
+                        results[cid] = _settle_cell(workdir, cell, skip_breaks, state)
+                    if results[cid].status != "waiting":
+                        complete.add(cid)
+                        progressed = True
+
+            state.commit()
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                cid = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:  # keep the other cells' transitions; commit this one as failed
+                    error = f"Could not run cell: {e}"
+                    state.mark_failed(cid, error)
+                    result = CellResult(id=cid, cell_type=cells[cid].cell_type, status="failed", error=error)
+                results[cid] = result
+                duration = f" ({result.duration:.2f}s)" if result.duration is not None else ""
+                print(f"[{result.status}] {cid}{duration}", file=sys.stderr, flush=True)
+                if result.status == "done":
+                    complete.add(cid)
+                else:
+                    failed = True
+
+    cache.save()
+    for cid in pending:
+        results[cid] = CellResult(id=cid, cell_type=cells[cid].cell_type, status="blocked")
+    ordered = [results[cell.id] for cell in notebook.cells]
+
+    if failed:
+        status = "failed"
+    else:
+        waiting = [r for r in ordered if r.status == "waiting"]
+        status = f"waiting-{waiting[0].cell_type}" if waiting else "complete"
+
+    wall_seconds = round(time.perf_counter() - start, 6)
+    return RunResult(
+        status=status,
+        workers=workers,
+        wall_seconds=wall_seconds,
+        busy_seconds=round(sum(r.duration or 0.0 for r in ordered if r.started_at is not None), 6),
+        cells=ordered,
+        run_id=record_run(workdir, notebook.name, status, started_at, wall_seconds),
+    )
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run AnyT Notebook shell cells in parallel")
+    parser.add_argument("notebook", help="Path to .anyt.md file")
+    parser.add_argument(
+        "--workers",
+        "-j",
+        type=int,
+        default=DEFAULT_RUN_WORKERS,
+        help=f"Concurrent shell cells (default: {DEFAULT_RUN_WORKERS})",
+    )
+    parser.add_argument("--skip-breaks", action="store_true", help="Skip all break cells instead of pausing")
+    parser.add_argument(
+        "--rerun", action="store_true", help="Reset all cells first; cached results of unchanged cells are reused"
+    )
+    parser.add_argument("--workspace-dir", help="Override the notebook's workdir")
+    parser.add_argument(
+        "--no-login-shell", action="store_true", help="Run shell cells without sourcing shell profile files"
+    )
+    parser.add_argument("--compact", action="store_true", help="Print compact JSON")
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    file_path = Path(args.notebook)
+    try:
+        notebook, errors = load_notebook(file_path)
+        if errors:
+            raise ValidationError("; ".join(errors))
+
+        notebook_dir = file_path.resolve().parent
+        workdir = Path(args.workspace_dir) if args.workspace_dir else notebook_dir / notebook.workdir
+        env = notebook_env(notebook, notebook_dir)
+
+        result = run_notebook(
+            notebook, workdir, args.workers, args.skip_breaks, env, not args.no_login_shell, args.rerun
+        )
+        print(json.dumps(asdict(result), indent=None if args.compact else 2))
+        return _EXIT_CODES[result.status]
+
+    except NotebookError as e:
+        prefix = _ERROR_PREFIXES.get(type(e), "Error")
+        print(f"\n{prefix}: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
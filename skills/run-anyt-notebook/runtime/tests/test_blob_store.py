@@ -0,0 +1,203 @@
+"""Tests for blob_store module."""
+
+import errno
+import functools
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+import blob_store
+import result_cache
+from blob_store import detach, gc, main, object_path, preserve, read_manifest, size_report, store_files
+from config import BLOB_MIN_BYTES, ValidationError
+from manage_state import reset_cell
+from parse_notebook import Cell, Notebook
+from run_notebook import run_notebook
+
+_BIG = b"frame" * (BLOB_MIN_BYTES // 5 + 1)
+
+
+@pytest.fixture
+def workdir(tmp_path: Path) -> Path:
+    path = tmp_path / "anyt_workspace_test"
+    (path / "frames").mkdir(parents=True)
+    return path
+
+
+def _write(workdir: Path, name: str, data: bytes = _BIG) -> Path:
+    path = workdir / name
+    path.write_bytes(data)
+    return path
+
+
+def _can_reflink(directory: Path) -> bool:
+    source, target = _write(directory, ".probe-a", b"x"), directory / ".probe-b"
+    try:
+        blob_store._reflink(source, target)
+        return True
+    except OSError as e:
+        assert e.errno in blob_store._UNSUPPORTED
+        return False
+    finally:
+        source.unlink()
+        target.unlink(missing_ok=True)
+
+
+class TestStore:
+    def test_identical_files_share_one_object(self, workdir: Path):
+        a, b = _write(workdir, "frames/a.jpg"), _write(workdir, "frames/b.jpg")
+        _write(workdir, "frames/small.txt", b"tiny")
+        stored = store_files(workdir, "extract", ["frames"])
+
+        assert sorted(stored) == ["frames/a.jpg", "frames/b.jpg"]
+        assert read_manifest(workdir, "extract") == stored
+        digest = stored["frames/a.jpg"]
+        assert stored["frames/b.jpg"] == digest
+        assert a.read_bytes() == b.read_bytes() == _BIG
+
+        report = size_report(workdir)
+        assert report["stored_bytes"] == 2 * len(_BIG)
+        if _can_reflink(workdir):
+            assert object_path(workdir, digest).read_bytes() == _BIG
+            assert (report["objects"], report["saved_bytes"]) == (1, len(_BIG))
+        else:
+            # Without clones a copy would only cost space: nothing is stored until it is needed
+            assert not object_path(workdir, digest).exists()
+            assert (report["objects"], report["disk_bytes"], report["saved_bytes"]) == (0, 2 * len(_BIG), 0)
+
+    def test_copy_mode_reports_its_cost(self, workdir: Path):
+        _write(workdir, "a.bin")
+        stored = store_files(workdir, "c", ["a.bin"], mode="copy")
+        assert object_path(workdir, stored["a.bin"]).read_bytes() == _BIG
+        report = size_report(workdir)
+        assert (report["disk_bytes"], report["saved_bytes"]) == (2 * len(_BIG), -len(_BIG))
+
+    def test_deferred_object_is_copied_before_overwrite(self, workdir: Path, monkeypatch: pytest.MonkeyPatch):
+        def no_reflink(source: Path, target: Path) -> None:
+            raise OSError(errno.EOPNOTSUPP, "no clones")
+
+        monkeypatch.setattr(blob_store, "_reflink", no_reflink)
+        path = _write(workdir, "clip.mp4")
+        digest = store_files(workdir, "cut", ["clip.mp4"])["clip.mp4"]
+        assert not object_path(workdir, digest).exists()
+
+        assert preserve(workdir, ["clip.mp4"]) == 1
+        assert preserve(workdir, ["clip.mp4"]) == 0
+        path.write_bytes(b"re-encoded")
+        assert object_path(workdir, digest).read_bytes() == _BIG
+
+    @pytest.mark.parametrize("mode", ["symlink", "hardlink"])
+    def test_unknown_mode(self, workdir: Path, mode: str):
+        with pytest.raises(ValidationError, match="Unknown link mode"):
+            store_files(workdir, "c", ["frames"], mode=mode)
+
+    def test_workspace_files_stay_writable(self, workdir: Path, capsys: pytest.CaptureFixture[str]):
+        path = _write(workdir, "clip.mp4")
+        again = _write(workdir, "copy.mp4")
+        assert main([str(workdir), "add", "--cell", "cut", "clip.mp4", "copy.mp4", "--mode", "copy"]) == 0
+        capsys.readouterr()
+        obj = object_path(workdir, read_manifest(workdir, "cut")["clip.mp4"])
+        for stored in (path, again):
+            assert stored.stat().st_nlink == 1
+            assert stored.stat().st_mode & 0o200
+            assert not os.path.samefile(stored, obj)
+        assert obj.stat().st_mode & 0o777 == 0o444
+
+        path.write_bytes(b"re-encoded in place")
+        assert obj.read_bytes() == _BIG
+
+    def test_detach_gives_writable_copy(self, workdir: Path):
+        path = _write(workdir, "clip.mp4")
+        store_files(workdir, "cut", ["clip.mp4"], mode="copy")
+        # As stored by earlier versions: the workspace file hardlinked to the read-only object
+        path.unlink()
+        os.link(object_path(workdir, read_manifest(workdir, "cut")["clip.mp4"]), path)
+        assert path.stat().st_nlink == 2
+
+        assert detach(workdir, ["clip.mp4"]) == 1
+        assert path.stat().st_nlink == 1
+        path.write_bytes(b"re-encoded")
+        assert object_path(workdir, read_manifest(workdir, "cut")["clip.mp4"]).read_bytes() == _BIG
+
+
+class TestGc:
+    def test_unreferenced_objects_are_removed(self, workdir: Path):
+        _write(workdir, "a.bin")
+        _write(workdir, "b.bin", _BIG + b"!")
+        store_files(workdir, "one", ["a.bin"], mode="copy")
+        store_files(workdir, "two", ["b.bin"], mode="copy")
+        assert gc(workdir)["removed"] == 0
+
+        reset_cell(workdir, "one")
+        assert gc(workdir, dry_run=True) == {"removed": 1, "freed_bytes": len(_BIG), "kept": 1, "dry_run": True}
+        assert gc(workdir)["removed"] == 1
+        assert size_report(workdir)["objects"] == 1
+
+    def test_shared_store_keeps_other_workspaces_objects(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setenv("ANYT_OBJECT_STORE", str(tmp_path / "store"))
+        a, b = tmp_path / "a", tmp_path / "b"
+        for workdir in (a, b):
+            workdir.mkdir()
+            _write(workdir, "out.bin")
+            store_files(workdir, "cell", ["out.bin"], mode="copy")
+
+        reset_cell(a, "cell")
+        assert gc(a)["removed"] == 0  # b still lists it
+        assert object_path(b, read_manifest(b, "cell")["out.bin"]).read_bytes() == _BIG
+
+        reset_cell(b, "cell")
+        assert gc(a)["removed"] == 0  # b's refs are only rewritten by its own gc
+        assert gc(b) == {"removed": 1, "freed_bytes": len(_BIG), "kept": 0, "dry_run": False}
+
+    def test_refs_of_deleted_workspaces_are_dropped(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setenv("ANYT_OBJECT_STORE", str(tmp_path / "store"))
+        gone, kept = tmp_path / "gone", tmp_path / "kept"
+        for workdir in (gone, kept):
+            workdir.mkdir()
+        _write(gone, "out.bin")
+        store_files(gone, "cell", ["out.bin"], mode="copy")
+        shutil.rmtree(gone)
+
+        assert gc(kept)["removed"] == 1
+        assert list((tmp_path / "store" / "refs").iterdir()) == []
+
+    def test_cli_report(self, workdir: Path, capsys: pytest.CaptureFixture[str]):
+        _write(workdir, "a.bin")
+        assert main([str(workdir), "add", "--cell", "one", "a.bin", "--mode", "copy"]) == 0
+        capsys.readouterr()
+        assert main([str(workdir), "report"]) == 0
+        assert f'"exclusive_bytes": {len(_BIG)}' in capsys.readouterr().out
+
+
+class TestResultCacheRestore:
+    def test_deleted_output_is_restored(self, workdir: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(result_cache, "store_files", functools.partial(store_files, mode="copy"))
+        _write(workdir, "source.mp4")
+        notebook = Notebook(
+            schema="2.0", name="t", cells=[Cell(cell_type="shell", id="cut", content="cp source.mp4 clip.mp4")]
+        )
+        run_notebook(notebook, workdir, login=False)
+        (workdir / "clip.mp4").unlink()
+
+        result = run_notebook(notebook, workdir, login=False, rerun=True)
+        assert result.cells[0].cached
+        assert (workdir / "clip.mp4").read_bytes() == _BIG
+
+    def test_overwritten_output_is_restored(self, workdir: Path):
+        _write(workdir, "a.mp4")
+        _write(workdir, "b.mp4", _BIG + b"b")
+
+        def cut(source: str) -> Notebook:
+            cell = Cell(cell_type="shell", id="cut", content=f"cp {source} clip.mp4")
+            return Notebook(schema="2.0", name="t", cells=[cell])
+
+        run_notebook(cut("a.mp4"), workdir, login=False)
+        run_notebook(cut("b.mp4"), workdir, login=False)
+        assert (workdir / "clip.mp4").read_bytes() == _BIG + b"b"
+
+        # Back to the first version: its output was kept before being overwritten
+        result = run_notebook(cut("a.mp4"), workdir, login=False)
+        assert result.cells[0].cached
+        assert (workdir / "clip.mp4").read_bytes() == _BIG
@@ -0,0 +1,143 @@
+"""Tests for cell_graph module."""
+
+import textwrap
+
+import pytest
+
+from cell_graph import ANY, build_graph, recorded_durations
+from manage_state import mark_done
+from parse_notebook import Cell, Notebook
+
+
+def _notebook(*cells: Cell) -> Notebook:
+    return Notebook(schema="2.0", name="test", cells=list(cells))
+
+
+def _shell(cell_id: str, script: str, after: list[str] | None = None) -> Cell:
+    return Cell(cell_type="shell", id=cell_id, content=textwrap.dedent(script).strip(), after=after)
+
+
+def _task(cell_id: str, content: str) -> Cell:
+    return Cell(cell_type="task", id=cell_id, content=textwrap.dedent(content).strip())
+
+
+def _deps(notebook: Notebook) -> dict[str, list[str]]:
+    return {node.id: node.depends_on for node in build_graph(notebook).nodes}
+
+
+class TestResources:
+    def test_shell_file_utilities(self):
+        graph = build_graph(
+            _notebook(_shell("s", "mkdir -p out && cp data/in.csv out/ 2>/dev/null\ncat a.txt > b.txt"))
+        )
+        node = graph.nodes[0]
+        assert node.reads == ["a.txt", "data/in.csv"]
+        assert node.writes == ["b.txt", "cell:s", "out"]
+
+    def test_unknown_command_is_opaque(self):
+        node = build_graph(_notebook(_shell("s", "npm install"))).nodes[0]
+        assert node.reads == [ANY]
+        assert ANY in node.writes
+
+    @pytest.mark.parametrize(
+        "script",
+        ['F=out.txt; cat "$F"', 'rm -rf "${DIR}"', "cat *.csv", "echo hi > $LOG", "cp {a,b}.txt out"],
+    )
+    def test_unexpanded_operands_are_opaque(self, script: str):
+        node = build_graph(_notebook(_shell("s", script))).nodes[0]
+        assert node.reads == [ANY]
+        assert ANY in node.writes
+
+    def test_test_bracket_is_not_a_glob(self):
+        node = build_graph(_notebook(_shell("s", "[ -f out.txt ] && echo $HOME"))).nodes[0]
+        assert node.reads == ["out.txt"]
+
+    def test_task_output_and_mentions(self):
+        task = _task(
+            "t",
+            """
+            Read `transcripts/` and the file notes/todo.md, see https://example.com/a/b.
+
+            **Output:** sections.json, frames/<id>.jpg
+            """,
+        )
+        node = build_graph(_notebook(task)).nodes[0]
+        assert node.reads == ["notes/todo.md", "transcripts"]
+        assert node.writes == ["cell:t", "frames/*.jpg", "sections.json"]
+
+    def test_task_without_paths_is_opaque(self):
+        node = build_graph(_notebook(_task("t", "Do something clever."))).nodes[0]
+        assert node.reads == [ANY]
+        assert ANY in node.writes
+
+
+class TestDependencies:
+    def test_independent_shells_share_a_level(self):
+        nb = _notebook(
+            _shell("a", "mkdir -p a"),
+            _shell("b", "mkdir -p b"),
+            _shell("c", "ls a b"),
+        )
+        graph = build_graph(nb)
+        assert _deps(nb) == {"a": [], "b": [], "c": ["a", "b"]}
+        assert graph.levels() == [["a", "b"], ["c"]]
+
+    def test_variable_reader_waits_for_writer(self):
+        nb = _notebook(_shell("writer", "echo 1 > out.txt"), _shell("reader", 'F=out.txt\ncat "$F"'))
+        assert build_graph(nb).levels() == [["writer"], ["reader"]]
+
+    def test_write_after_read_is_ordered(self):
+        nb = _notebook(_shell("reader", "cat data.txt"), _shell("writer", "touch data.txt"))
+        assert _deps(nb)["writer"] == ["reader"]
+
+    def test_tasks_read_earlier_inputs_and_shells_read_named_ones(self):
+        form = '<form type="json">\n{"fields": [{"name": "repoUrl", "type": "text", "label": "Repo"}]}\n</form>'
+        nb = _notebook(
+            Cell(cell_type="input", id="config", content=form),
+            _shell("clone", "echo repoUrl"),
+            _shell("other", "mkdir -p x"),
+            _task("plan", "Plan it.\n\n**Output:** plan.md"),
+        )
+        deps = _deps(nb)
+        assert deps["clone"] == ["config"]
+        assert deps["other"] == []
+        assert "config" in deps["plan"]
+
+    def test_break_is_a_barrier(self):
+        nb = _notebook(
+            _shell("a", "mkdir -p a"),
+            _shell("b", "mkdir -p b"),
+            Cell(cell_type="break", id="review"),
+            _shell("c", "mkdir -p c"),
+        )
+        assert _deps(nb) == {"a": [], "b": [], "review": ["a", "b"], "c": ["review"]}
+
+    def test_after_overrides_inference(self):
+        nb = _notebook(
+            _shell("setup", "npm install"),
+            _shell("lint", "npm run lint", after=["setup"]),
+            _shell("docs", "npm run docs", after=["setup"]),
+            _shell("free", "npm run other", after=[]),
+        )
+        graph = build_graph(nb)
+        assert _deps(nb) == {"setup": [], "lint": ["setup"], "docs": ["setup"], "free": []}
+        assert [n.explicit for n in graph.nodes] == [False, True, True, True]
+
+    def test_only_direct_dependencies_are_kept(self):
+        nb = _notebook(_shell("a", "touch x"), _shell("b", "cat x > y"), _shell("c", "cat x y"))
+        assert _deps(nb)["c"] == ["b"]
+
+
+class TestCriticalPath:
+    def test_unweighted(self):
+        nb = _notebook(_shell("a", "touch x"), _shell("b", "touch y"), _shell("c", "cat x > z"), _shell("d", "cat z"))
+        assert build_graph(nb).critical_path() == (["a", "c", "d"], 3.0)
+
+    def test_recorded_durations(self, tmp_path):
+        nb = _notebook(_shell("a", "touch x"), _shell("b", "touch y"), _shell("c", "cat x y"))
+        mark_done(tmp_path, "a", duration=1.0)
+        mark_done(tmp_path, "b", duration=5.0)
+        graph = build_graph(nb)
+        weights = recorded_durations(tmp_path, graph)
+        assert weights == {"a": 1.0, "b": 5.0}
+        assert graph.critical_path(weights) == (["b", "c"], 5.0)
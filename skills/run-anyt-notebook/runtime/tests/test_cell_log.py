@@ -0,0 +1,186 @@
+"""Tests for cell_log module."""
+
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+import cell_log
+from cell_log import (
+    CellLogWriter,
+    LogReader,
+    follow_log,
+    iter_log,
+    log_path,
+    log_segments,
+    read_log_tail,
+    resolve_compression,
+)
+from config import LOG_INDEX_STRIDE, ValidationError
+from manage_state import main, mark_done
+
+
+@pytest.fixture
+def workdir(tmp_path: Path) -> Path:
+    return tmp_path / "anyt_workspace_test"
+
+
+def _lines(start: int, stop: int) -> bytes:
+    return b"".join(f"line {i}\n".encode() for i in range(start, stop))
+
+
+class TestWriter:
+    def test_small_output_is_one_file(self, workdir: Path):
+        with CellLogWriter(workdir, "s") as log:
+            log.write("hello ")
+            log.write(b"world\n")
+        assert log_path(workdir, "s").read_text() == "hello world\n"
+        assert log_segments(log_path(workdir, "s")) == []
+
+    @pytest.mark.parametrize("compression", ["gzip", None])
+    def test_rotation_keeps_exact_output(self, workdir: Path, compression: str | None):
+        output = _lines(0, 500)
+        with CellLogWriter(workdir, "s", segment_bytes=1000, compression=compression) as log:
+            for i in range(0, len(output), 337):
+                log.write(output[i : i + 337])
+
+        segments = log_segments(log_path(workdir, "s"))
+        assert len(segments) >= 3
+        assert all(p.name.endswith(".gz") for p in segments) == (compression == "gzip")
+        assert [int(p.name.split(".")[2]) for p in segments] == list(range(1, len(segments) + 1))
+        assert b"".join(iter_log(workdir, "s")) == output
+
+    def test_new_writer_replaces_previous_log(self, workdir: Path):
+        with CellLogWriter(workdir, "s", segment_bytes=100) as log:
+            log.write(_lines(0, 100))
+        with CellLogWriter(workdir, "s") as log:
+            log.write("second run\n")
+        assert log_segments(log_path(workdir, "s")) == []
+        assert b"".join(iter_log(workdir, "s")) == b"second run\n"
+
+    def test_compression_settings(self):
+        assert resolve_compression("none") is None
+        assert resolve_compression("gzip") == "gzip"
+        with pytest.raises(ValidationError, match="Unknown log compression"):
+            resolve_compression("lz4")
+
+    def test_zstd_requires_package(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(cell_log, "zstandard", None)
+        assert resolve_compression("auto") == "gzip"
+        with pytest.raises(ValidationError, match="zstandard"):
+            resolve_compression("zstd")
+
+
+class TestTail:
+    def test_tail_from_index(self, workdir: Path):
+        with CellLogWriter(workdir, "s", segment_bytes=1000) as log:
+            log.write(_lines(0, 500))
+            log.write("partial")
+        # Served from the index: the rotated segments are not needed
+        for segment in log_segments(log_path(workdir, "s")):
+            segment.unlink()
+        assert read_log_tail(workdir, "s", 3) == ["line 498", "line 499", "partial"]
+
+    def test_tail_without_index(self, workdir: Path):
+        with CellLogWriter(workdir, "s", segment_bytes=1000, tail_lines=2) as log:
+            log.write(_lines(0, 502))
+        tail = log_path(workdir, "s").with_name("output.log.tail")
+        tail.unlink()
+        assert read_log_tail(workdir, "s", 4) == ["line 498", "line 499", "line 500", "line 501"]
+
+    def test_tail_spans_rotated_segment(self, workdir: Path):
+        with CellLogWriter(workdir, "s", segment_bytes=1000, tail_lines=2) as log:
+            log.write(_lines(0, 200))
+        # More lines than the index or the short active segment hold
+        expected = [f"line {i}" for i in range(150, 200)]
+        assert read_log_tail(workdir, "s", 50) == expected
+
+    def test_stale_index_is_ignored(self, workdir: Path):
+        with CellLogWriter(workdir, "s") as log:
+            log.write("one\ntwo\n")
+        with log_path(workdir, "s").open("ab") as f:
+            f.write(b"three\n")
+        assert read_log_tail(workdir, "s", 2) == ["two", "three"]
+
+    def test_missing_log(self, workdir: Path):
+        assert read_log_tail(workdir, "nope", 5) == []
+
+
+@pytest.fixture
+def long_log(workdir: Path) -> bytes:
+    """A log of 3000 lines over several gzip segments, written in uneven chunks."""
+    output = _lines(0, 3000)
+    with CellLogWriter(workdir, "s", segment_bytes=10_000, compression="gzip") as log:
+        for i in range(0, len(output), 777):
+            log.write(output[i : i + 777])
+    return output
+
+
+class TestLogReader:
+    def test_line_index(self, workdir: Path, long_log: bytes):
+        index = log_path(workdir, "s").with_name("output.log.idx").read_bytes()
+        offsets = [int.from_bytes(index[i : i + 8], "little") for i in range(0, len(index), 8)]
+        assert offsets == [long_log.index(f"line {n}\n".encode()) for n in range(0, 3000, LOG_INDEX_STRIDE)]
+
+    def test_head_pages(self, workdir: Path, long_log: bytes):
+        reader = LogReader(workdir, "s")
+        assert reader.size == len(long_log)
+        assert reader.head(3) == ["line 0", "line 1", "line 2"]
+        assert reader.head(2, skip=2047) == ["line 2047", "line 2048"]
+        assert reader.head(5, skip=2998) == ["line 2998", "line 2999"]
+        assert reader.head(5, skip=3000) == []
+
+    def test_read_range_across_segments(self, workdir: Path, long_log: bytes):
+        reader = LogReader(workdir, "s")
+        assert reader.segment_count >= 2
+        assert reader.read_range(9_990, 20_010) == long_log[9_990:20_010]
+        assert reader.read_range(len(long_log) - 5) == long_log[-5:]
+
+    def test_tail_and_line_offset(self, workdir: Path, long_log: bytes):
+        reader = LogReader(workdir, "s")
+        assert reader.tail(2) == ["line 2998", "line 2999"]
+        assert reader.line_offset(1000) == long_log.index(b"line 1000\n")
+        assert reader.line_offset(3000) is None
+
+    def test_log_without_index(self, workdir: Path):
+        path = log_path(workdir, "legacy")
+        path.parent.mkdir(parents=True)
+        path.write_bytes(_lines(0, 600))
+        assert LogReader(workdir, "legacy").head(1, skip=555) == ["line 555"]
+
+
+class TestFollow:
+    def test_follow_until_cell_finishes(self, workdir: Path):
+        log = CellLogWriter(workdir, "s")
+        log.write("before\n")
+
+        def produce() -> None:
+            for i in range(3):
+                time.sleep(0.05)
+                log.write(f"tick {i}\n")
+            log.close()
+            mark_done(workdir, "s")
+
+        thread = threading.Thread(target=produce)
+        thread.start()
+        received = b"".join(follow_log(workdir, "s", timeout=5))
+        thread.join()
+        assert received == b"tick 0\ntick 1\ntick 2\n"
+
+    def test_follow_times_out(self, workdir: Path):
+        with CellLogWriter(workdir, "s") as log:
+            log.write("idle\n")
+        start = time.monotonic()
+        assert list(follow_log(workdir, "s", offset=0, timeout=0.3)) == [b"idle\n"]
+        assert time.monotonic() - start >= 0.3
+
+
+class TestCli:
+    def test_head_tail_and_range(self, workdir: Path, long_log: bytes, capsys: pytest.CaptureFixture[str]):
+        assert main([str(workdir), "head", "--cell", "s", "-n", "2", "--skip", "10"]) == 0
+        assert capsys.readouterr().out == "line 10\nline 11\n"
+        assert main([str(workdir), "tail", "--cell", "s", "-n", "1"]) == 0
+        assert capsys.readouterr().out == "line 2999\n"
+        assert main([str(workdir), "read-range", "--cell", "s", "--start", "7", "--end", "14"]) == 0
+        assert capsys.readouterr().out == long_log[7:14].decode()
@@ -0,0 +1,49 @@
+"""Tests for cell_metrics module."""
+
+import resource
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from cell_metrics import ProcessSampler, read_remote_calls, shell_metrics
+
+
+class TestRemoteCalls:
+    def test_sums_reported_calls(self, tmp_path: Path):
+        path = tmp_path / "metrics.jsonl"
+        path.write_text(
+            '{"kind": "remote", "name": "tts", "queue_seconds": 1.5, "wait_seconds": 4}\n'
+            '{"name": "upload", "wait_seconds": 0.5}\n'
+            '{"kind": "other"}\n'
+            "not json\n",
+            encoding="utf-8",
+        )
+        assert read_remote_calls(path) == {"calls": 2, "queue_seconds": 1.5, "wait_seconds": 4.5}
+
+    def test_nothing_reported(self, tmp_path: Path):
+        assert read_remote_calls(tmp_path / "missing.jsonl") is None
+        (tmp_path / "empty.jsonl").write_text("")
+        assert read_remote_calls(tmp_path / "empty.jsonl") is None
+
+
+class TestShellMetrics:
+    def test_from_rusage(self):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        metrics = shell_metrics(1.25, usage)
+        assert metrics["wall_seconds"] == 1.25
+        assert metrics["cpu_seconds"] == pytest.approx(usage.ru_utime + usage.ru_stime, abs=1e-5)
+        assert isinstance(metrics["peak_rss_bytes"], int) and metrics["peak_rss_bytes"] > 0
+
+    def test_without_usage(self):
+        assert shell_metrics(0.5, None, remote={"calls": 1}) == {"wall_seconds": 0.5, "remote": {"calls": 1}}
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="process tree sampling needs /proc")
+    def test_sampler_counts_descendants(self):
+        proc = subprocess.Popen(["bash", "-c", "sleep 0.4 & sleep 0.4 & sh -c 'sleep 0.4' & wait"])
+        sampler = ProcessSampler(proc.pid, interval=0.05).start()
+        proc.wait()
+        sampler.stop()
+        assert sampler.max_concurrent >= 3
+        assert len(sampler.seen) >= 4
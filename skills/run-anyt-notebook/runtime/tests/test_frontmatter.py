@@ -0,0 +1,126 @@
+"""Tests for frontmatter module."""
+
+import pytest
+
+import frontmatter
+from frontmatter import AgentProfile, Frontmatter, compile_frontmatter, parse_frontmatter
+from parse_notebook import ParseError
+
+
+def _lines(text: str) -> list[str]:
+    return text.strip("\n").splitlines()
+
+
+AGENTS = """
+schema: "2.0"
+name: demo
+description: A long description
+  that continues here # trailing comment
+dependencies:
+  node: ">=18"
+  python: ">=3.10"
+agents:
+  - id: claude-default
+    name: Claude Code
+    type: claude
+    default: true
+    permissionMode: bypassPermissions
+  - id: codex-default
+    name: Codex
+    type: codex
+    additionalArgs: ["--fast", "--quiet"]
+"""
+
+
+class TestParseFrontmatter:
+    def test_typed_fields(self):
+        fm = parse_frontmatter(_lines(AGENTS))
+        assert fm.schema == "2.0"
+        assert fm.description == "A long description that continues here"
+        assert fm.dependencies == {"node": ">=18", "python": ">=3.10"}
+        assert fm.agents == [
+            AgentProfile(
+                id="claude-default",
+                name="Claude Code",
+                type="claude",
+                default=True,
+                permission_mode="bypassPermissions",
+            ),
+            AgentProfile(id="codex-default", name="Codex", type="codex", additional_args=["--fast", "--quiet"]),
+        ]
+
+    def test_defaults(self):
+        assert parse_frontmatter([]) == Frontmatter()
+
+    def test_indentless_sequence(self):
+        fm = parse_frontmatter(_lines("agents:\n- id: a\n  name: A\n  type: gemini\n"))
+        assert [a.id for a in fm.agents] == ["a"]
+
+    def test_line_parser_matches_yaml(self):
+        pytest.importorskip("yaml")
+        lines = _lines(AGENTS)
+        fast = compile_frontmatter(frontmatter._parse_lines(lines))
+        assert fast == compile_frontmatter(frontmatter._load_yaml(lines))
+
+    SCALARS = """
+schema: 2.0
+name: 007
+version: 1.10
+description: 2024-01-01
+workdir:
+agents:
+  - id: a
+    name: A
+    type: claude
+    default: yes
+    model: 3.50
+"""
+
+    def test_scalars_keep_their_text_on_both_paths(self):
+        pytest.importorskip("yaml")
+        lines = _lines(self.SCALARS)
+        fast = compile_frontmatter(frontmatter._parse_lines(lines))
+        assert (fast.schema, fast.name, fast.version, fast.description) == ("2.0", "007", "1.10", "2024-01-01")
+        assert fast.workdir == Frontmatter().workdir
+        assert (fast.agents[0].default, fast.agents[0].model) == (True, "3.50")
+        assert compile_frontmatter(frontmatter._load_yaml(lines)) == fast
+        # Lists with unquoted items go to YAML, which keeps their text too
+        args = parse_frontmatter(_lines(self.SCALARS + "    additionalArgs: [1.10, --fast]\n")).agents[0]
+        assert args.additional_args == ["1.10", "--fast"]
+
+    def test_block_scalar_falls_back_to_yaml(self):
+        pytest.importorskip("yaml")
+        fm = parse_frontmatter(_lines("name: demo\ndescription: |\n  line one\n  line two\n"))
+        assert fm.description == "line one\nline two"
+
+    @pytest.mark.parametrize(
+        "text",
+        [
+            "name: demo\ndescription: |\n  line one\nworkdir: out\n",
+            "agents:\n  - id: a\n    name: A\n    type: codex\n    additionalArgs:\n      - --fast\n",
+        ],
+    )
+    def test_unsupported_yaml_is_an_error_without_yaml(self, monkeypatch: pytest.MonkeyPatch, text: str):
+        monkeypatch.setattr(frontmatter, "yaml", None)
+        with pytest.raises(ParseError, match="install PyYAML"):
+            parse_frontmatter(_lines(text))
+
+
+class TestCompileFrontmatter:
+    def test_yaml_scalars_are_coerced(self):
+        fm = compile_frontmatter({"schema": 2.0, "version": 1, "agents": [{"id": "a", "name": "A", "type": "codex"}]})
+        assert (fm.schema, fm.version) == ("2.0", "1")
+
+    @pytest.mark.parametrize(
+        "data",
+        [
+            {"name": ["not", "a", "string"]},
+            {"dependencies": "node"},
+            {"agents": {"id": "a"}},
+            {"agents": [{"id": "a", "type": "claude"}]},
+            {"agents": [{"id": "a", "name": "A", "type": "claude", "default": "maybe"}]},
+        ],
+    )
+    def test_wrong_shapes_raise(self, data: dict[str, object]):
+        with pytest.raises(ParseError):
+            compile_frontmatter(data)
@@ -1,18 +1,35 @@
 """Tests for manage_state module."""
 
+import functools
 import json
+import os
+import shutil
+import time
 from pathlib import Path
 
 import pytest
 
+import manage_state
+from cell_log import CellLogWriter, LogReader, read_log_tail
+from config import ValidationError
 from manage_state import (
+    StateWriter,
+    benchmark_transitions,
+    get_all_status,
     get_cell_status,
+    list_status,
+    main,
     mark_done,
     mark_failed,
     mark_skipped,
+    notebook_stats,
+    read_index,
     read_input_response,
+    read_marker,
+    rebuild_index,
     reset_all,
     reset_cell,
+    run_state_batch,
     save_input_response,
     save_shell_output,
     save_shell_script,
@@ -94,6 +111,19 @@ class TestInputResponses:
     def test_read_missing_response(self, workdir: Path):
         assert read_input_response(workdir, "nonexistent") is None
 
+    def test_schema_rejects_invalid_response_before_writing(self, workdir: Path):
+        from parse_notebook import Cell, compile_form
+
+        form = '{"fields": [{"name": "port", "type": "number", "label": "Port", "required": true}]}'
+        schema = compile_form(Cell(cell_type="input", id="config", content=f'<form type="json">{form}</form>'))
+
+        with pytest.raises(ValidationError, match="must be a number"):
+            save_input_response(workdir, "config", {"port": "eighty"}, schema)
+        assert read_input_response(workdir, "config") is None
+
+        save_input_response(workdir, "config", {"port": 80}, schema)
+        assert read_input_response(workdir, "config") == {"port": 80}
+
 
 class TestReset:
     def test_reset_cell(self, workdir: Path):
@@ -110,3 +140,324 @@ class TestReset:
         reset_all(workdir)
         assert get_cell_status(workdir, "cell-1") == "pending"
         assert get_cell_status(workdir, "cell-2") == "pending"
+
+    def test_reset_moves_state_to_trash(self, workdir: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(manage_state, "purge_in_background", lambda workdir: None)
+        save_shell_output(workdir, "big", "x\n" * 1000)
+        mark_done(workdir, "big")
+        mark_done(workdir, "other")
+
+        reset_cell(workdir, "big")
+        reset_all(workdir)
+        trash = workdir / ".anyt" / "trash"
+        assert sorted(p.name.split(".")[0] for p in trash.iterdir()) == ["big", "cells"]
+        assert get_cell_status(workdir, "other") == "pending"
+        mark_done(workdir, "other")  # the cell directories are recreated as needed
+
+        assert manage_state.purge_trash(workdir) == 2
+        assert list(trash.iterdir()) == []
+        assert get_cell_status(workdir, "other") == "done"
+
+    def test_trash_is_emptied_in_background(self, workdir: Path):
+        save_shell_output(workdir, "big", "x\n" * 1000)
+        reset_cell(workdir, "big")
+        trash = workdir / ".anyt" / "trash"
+        deadline = time.monotonic() + 5
+        while any(trash.iterdir()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert list(trash.iterdir()) == []
+
+    def test_purge_cli(self, workdir: Path, capsys: pytest.CaptureFixture[str], monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(manage_state, "purge_in_background", lambda workdir: None)
+        mark_done(workdir, "a")
+        assert main([str(workdir), "reset", "--cell", "a"]) == 0
+        assert main([str(workdir), "purge"]) == 0
+        assert capsys.readouterr().out.splitlines()[-1] == "Purged 1 trash entry"
+
+
+class TestStateJournal:
+    def test_transitions_are_journaled(self, workdir: Path):
+        mark_done(workdir, "a")
+        mark_failed(workdir, "b", "oops")
+        mark_skipped(workdir, "c")
+        reset_cell(workdir, "c")
+
+        lines = (workdir / ".anyt" / "state.jsonl").read_text().splitlines()
+        assert [json.loads(line)["status"] for line in lines] == ["done", "failed", "skipped", "reset"]
+        assert read_index(workdir) == {"a": "done", "b": "failed"}
+
+    def test_status_is_read_from_journal(self, workdir: Path, monkeypatch: pytest.MonkeyPatch):
+        mark_done(workdir, "a")
+        _age_state(workdir)
+        # The markers are a projection; status does not look at them once a journal exists
+        monkeypatch.setattr(manage_state, "_probe_status", _fail_probe)
+        assert get_all_status(workdir, ["a", "b"]) == [{"id": "a", "status": "done"}, {"id": "b", "status": "pending"}]
+
+    def test_markers_changed_by_other_tools(self, workdir: Path):
+        mark_done(workdir, "a")
+        mark_done(workdir, "c")
+        cells = workdir / ".anyt" / "cells"
+        _age_state(workdir)
+        # notebook-cli writes and deletes markers without touching the journal
+        shutil.rmtree(cells / "a")
+        (cells / "b").mkdir()
+        (cells / "b" / ".done").write_text("{}")
+        (cells / "c" / ".done").unlink()
+        (cells / "c" / ".failed").write_text('{"status": "failed"}')
+
+        assert get_cell_status(workdir, "a") == "pending"
+        assert get_all_status(workdir, ["a", "b", "c"]) == [
+            {"id": "a", "status": "pending"},
+            {"id": "b", "status": "done"},
+            {"id": "c", "status": "failed"},
+        ]
+        assert list_status(workdir) == {"b": "done", "c": "failed"}
+        assert read_marker(workdir, "c") == {"status": "failed"}
+
+        # The next transition sees the same statuses and the journal takes over again
+        mark_skipped(workdir, "d")
+        assert rebuild_index(workdir) == {"b": "done", "c": "failed", "d": "skipped"}
+
+    def test_legacy_workspace_is_seeded_from_markers(self, workdir: Path):
+        for cid, marker in [("old-done", ".done"), ("old-failed", ".failed")]:
+            cell_dir = workdir / ".anyt" / "cells" / cid
+            cell_dir.mkdir(parents=True)
+            (cell_dir / marker).write_text("{}")
+        assert read_index(workdir) is None
+        assert get_all_status(workdir, ["old-done"]) == [{"id": "old-done", "status": "done"}]
+
+        mark_done(workdir, "new")
+        assert read_index(workdir) == {"old-done": "done", "old-failed": "failed", "new": "done"}
+
+    def test_rebuild_index_and_torn_lines(self, workdir: Path):
+        mark_done(workdir, "a")
+        mark_done(workdir, "b")
+        with (workdir / ".anyt" / "state.jsonl").open("a") as f:
+            f.write('{"cell": "a", "sta')
+        assert read_index(workdir) == {"a": "done", "b": "done"}
+        mark_failed(workdir, "b", "oops")
+        assert read_index(workdir) == {"a": "done", "b": "failed"}
+
+        reset_all(workdir)
+        assert read_index(workdir) == {}
+        mark_skipped(workdir, "c")
+        assert rebuild_index(workdir) == {"c": "skipped"}
+        assert len((workdir / ".anyt" / "state.jsonl").read_text().splitlines()) == 1
+
+
+def _fail_probe(_cell_dir: Path) -> str:
+    raise AssertionError("markers should not be read")
+
+
+def _age_state(workdir: Path) -> None:
+    """Date every cell directory a minute back, so the changes a test makes next stand out."""
+    past = time.time() - 60
+    for path in [*(workdir / ".anyt" / "cells").iterdir(), workdir / ".anyt" / "cells", workdir / ".anyt"]:
+        os.utime(path, (past, past))
+
+
+class TestStateWriter:
+    def test_group_commit(self, workdir: Path):
+        state = StateWriter(workdir)
+        state.mark_done("a", 1.0, extra={"exit_code": 0})
+        state.mark_failed("b", "oops")
+        assert get_cell_status(workdir, "a") == "pending"
+
+        assert state.commit() == 2
+        assert state.commit() == 0
+        assert get_all_status(workdir, ["a", "b"]) == [{"id": "a", "status": "done"}, {"id": "b", "status": "failed"}]
+        marker = read_marker(workdir, "a")
+        assert marker is not None
+        assert (marker["duration"], marker["exit_code"]) == (1.0, 0)
+
+    def test_no_temporary_files_left(self, workdir: Path):
+        with StateWriter(workdir) as state:
+            state.mark_done("a")
+            state.mark_skipped("a")
+        assert sorted(p.name for p in (workdir / ".anyt" / "cells" / "a").iterdir()) == [".skipped"]
+        assert [p.name for p in (workdir / ".anyt").iterdir() if p.name.endswith(".tmp")] == []
+
+    def test_context_discards_on_error(self, workdir: Path):
+        with pytest.raises(RuntimeError), StateWriter(workdir) as state:
+            state.mark_done("a")
+            raise RuntimeError
+        assert get_cell_status(workdir, "a") == "pending"
+
+    def test_torn_marker_still_counts(self, workdir: Path):
+        mark_done(workdir, "a")
+        (workdir / ".anyt" / "cells" / "a" / ".done").write_text("")
+        assert read_marker(workdir, "a") == {"status": "done"}
+
+    def test_journal_overrides_stale_markers(self, workdir: Path):
+        mark_failed(workdir, "a", "oops")
+        mark_done(workdir, "b")
+        _age_state(workdir)
+        # Crash after the journal fsync: the marker updates never happened
+        with (workdir / ".anyt" / "state.jsonl").open("a") as f:
+            f.write(json.dumps({"cell": "a", "status": "done"}) + "\n")
+            f.write(json.dumps({"cell": "b", "status": "reset"}) + "\n")
+
+        assert get_cell_status(workdir, "a") == "done"
+        assert get_all_status(workdir, ["a", "b"]) == [{"id": "a", "status": "done"}, {"id": "b", "status": "pending"}]
+        assert read_marker(workdir, "a") == {"status": "done"}
+        assert read_marker(workdir, "b") is None
+
+    def test_benchmark(self, workdir: Path):
+        result = benchmark_transitions(workdir, cells=20, group=5)
+        assert result["cells"] == 20
+        assert set(result) == {"cells", "group", "single", "grouped"}
+        assert list(workdir.iterdir()) == []
+
+
+class TestStateBatch:
+    def test_ops_apply_in_order_and_reads_see_earlier_ops(self, workdir: Path):
+        mark_done(workdir, "old")
+        results = run_state_batch(
+            workdir,
+            [
+                {"op": "reset", "cell": "old"},
+                {"op": "mark-failed", "cell": "a", "error": "boom", "duration": 1.5},
+                {"op": "save-output", "cell": "a", "output": "log text"},
+                {"op": "save-input", "cell": "form", "values": {"x": 1}},
+                {"op": "status"},
+                {"op": "read-marker", "cell": "old"},
+                {"op": "read-input", "cell": "form"},
+            ],
+        )
+        assert [r["op"] for r in results] == [
+            "reset",
+            "mark-failed",
+            "save-output",
+            "save-input",
+            "status",
+            "read-marker",
+            "read-input",
+        ]
+        assert results[4]["result"] == [{"id": "a", "status": "failed"}]
+        assert results[5]["result"] is None
+        assert results[6]["result"] == {"x": 1}
+
+        assert get_all_status(workdir, ["old", "a"]) == [
+            {"id": "old", "status": "pending"},
+            {"id": "a", "status": "failed"},
+        ]
+        assert (workdir / ".anyt" / "cells" / "a" / "output.log").read_text() == "log text"
+        assert read_input_response(workdir, "form") == {"x": 1}
+
+    def test_bad_op_rejects_whole_batch(self, workdir: Path):
+        with pytest.raises(ValidationError, match="Batch op 1"):
+            run_state_batch(workdir, [{"op": "mark-done", "cell": "a"}, {"op": "mark-done"}])
+        with pytest.raises(ValidationError, match="wrong type"):
+            run_state_batch(workdir, [{"op": "mark-done", "cell": "a", "duration": "slow"}])
+        assert get_cell_status(workdir, "a") == "pending"
+
+    def test_save_input_is_validated_against_schema(self, workdir: Path):
+        from parse_notebook import Cell, compile_form
+
+        form = '{"fields": [{"name": "port", "type": "number", "label": "Port"}]}'
+        schema = compile_form(Cell(cell_type="input", id="config", content=f'<form type="json">{form}</form>'))
+        assert schema is not None
+
+        ops: list[object] = [
+            {"op": "mark-done", "cell": "x"},
+            {"op": "save-input", "cell": "config", "values": {"port": "no"}},
+        ]
+        with pytest.raises(ValidationError, match="invalid response"):
+            run_state_batch(workdir, ops, {"config": schema})
+        assert get_cell_status(workdir, "x") == "pending"
+
+    def test_save_input_is_durable(self, workdir: Path, monkeypatch):
+        writes: list[tuple[str, bool]] = []
+        write_atomic = manage_state._write_atomic
+
+        def spy(path: Path, text: str, durable: bool = False) -> None:
+            writes.append((path.name, durable))
+            write_atomic(path, text, durable)
+
+        monkeypatch.setattr(manage_state, "_write_atomic", spy)
+        run_state_batch(workdir, [{"op": "save-input", "cell": "form", "values": {"x": 1}}])
+        save_input_response(workdir, "other", {"x": 2})
+
+        assert writes == [("response.json", True), ("response.json", True)]
+        assert read_input_response(workdir, "form") == {"x": 1}
+
+    def test_save_output_writes_an_indexed_log(self, workdir: Path, monkeypatch):
+        monkeypatch.setattr(manage_state, "CellLogWriter", functools.partial(CellLogWriter, segment_bytes=1024))
+        output = "".join(f"line {i}\n" for i in range(600))
+        run_state_batch(workdir, [{"op": "save-output", "cell": "a", "output": output}])
+
+        cell_dir = workdir / ".anyt" / "cells" / "a"
+        names = {p.name for p in cell_dir.iterdir()}
+        assert {"output.log.tail", "output.log.idx"} <= names
+        assert any(name.startswith("output.log.1") for name in names)  # rotated, maybe compressed
+        assert read_log_tail(workdir, "a", 2) == ["line 598", "line 599"]
+        assert LogReader(workdir, "a").head(2, 300) == ["line 300", "line 301"]
+
+    def test_reset_all_then_mark(self, workdir: Path):
+        mark_done(workdir, "a")
+        results = run_state_batch(workdir, [{"op": "reset"}, {"op": "mark-skipped", "cell": "b"}, {"op": "status"}])
+        assert results[2]["result"] == [{"id": "b", "status": "skipped"}]
+        assert [s["status"] for s in get_all_status(workdir, ["a", "b"])] == ["pending", "skipped"]
+
+    def test_cli(self, workdir: Path, capsys: pytest.CaptureFixture[str]):
+        ops = json.dumps([{"op": "mark-done", "cell": "a"}, {"op": "status", "cells": ["a", "b"]}])
+        assert main([str(workdir), "batch", ops]) == 0
+        results = json.loads(capsys.readouterr().out)
+        assert results[1]["result"] == [{"id": "a", "status": "done"}, {"id": "b", "status": "pending"}]
+
+        assert main([str(workdir), "batch", "{}"]) == 1
+        assert "must be a JSON list" in capsys.readouterr().err
+
+
+class TestStats:
+    def test_profile(self, workdir: Path):
+        mark_done(
+            workdir,
+            "render",
+            6.0,
+            extra={
+                "started_at": "2026-01-01T00:00:00+00:00",
+                "finished_at": "2026-01-01T00:00:06+00:00",
+                "metrics": {"cpu_seconds": 5.0, "peak_rss_bytes": 2048, "bytes_written": 100, "processes": 3},
+            },
+        )
+        mark_done(
+            workdir,
+            "fetch",
+            2.0,
+            extra={
+                "started_at": "2026-01-01T00:00:00+00:00",
+                "finished_at": "2026-01-01T00:00:02+00:00",
+                "metrics": {"cpu_seconds": 0.5, "peak_rss_bytes": 4096, "remote": {"calls": 2, "wait_seconds": 1.5}},
+            },
+        )
+        mark_done(workdir, "reused", 9.0, extra={"cached": True})
+
+        stats = notebook_stats(workdir, ["fetch", "render", "reused", "todo"])
+        assert [c["id"] for c in stats["cells"]] == ["render", "fetch", "reused", "todo"]  # type: ignore[attr-defined]
+        assert [c["share"] for c in stats["cells"]] == [0.75, 0.25, 0.0, 0.0]  # type: ignore[attr-defined]
+        totals = stats["totals"]
+        assert totals == {
+            "duration_seconds": 8.0,
+            "cpu_seconds": 5.5,
+            "bytes_read": 0,
+            "bytes_written": 100,
+            "processes": 3,
+            "cells": 4,
+            "span_seconds": 6.0,
+            "parallelism": 1.333,
+            "cpu_utilization": 0.688,
+            "peak_rss_bytes": 4096,
+            "remote": {"calls": 2, "queue_seconds": 0.0, "wait_seconds": 1.5},
+        }
+
+    def test_cli_metrics_option(self, workdir: Path, capsys: pytest.CaptureFixture[str]):
+        assert (
+            main([str(workdir), "mark-done", "--cell", "t", "--duration", "3", "--metrics", '{"cpu_seconds": 1}']) == 0
+        )
+        assert read_marker(workdir, "t")["metrics"] == {"cpu_seconds": 1}  # type: ignore[index]
+        assert main([str(workdir), "mark-done", "--cell", "t", "--metrics", "[1]"]) == 1
+        assert "--metrics must be a JSON object" in capsys.readouterr().err
+
+        assert main([str(workdir), "stats"]) == 0
+        assert json.loads(capsys.readouterr().out)["totals"]["cpu_seconds"] == 1
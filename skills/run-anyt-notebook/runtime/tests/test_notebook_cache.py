@@ -0,0 +1,117 @@
+"""Tests for notebook_cache module and cached notebook loading."""
+
+import os
+import textwrap
+from pathlib import Path
+
+import pytest
+
+import notebook_cache
+import parse_notebook
+from notebook_cache import cache_dir, read_entry, write_entry
+from parse_notebook import load_notebook
+
+NOTEBOOK = """\
+---
+schema: "2.0"
+name: cached
+workdir: ws
+---
+
+<shell id="setup">
+echo hi
+</shell>
+"""
+
+
+@pytest.fixture
+def notebook_path(tmp_path: Path) -> Path:
+    p = tmp_path / "cached.anyt.md"
+    p.write_text(textwrap.dedent(NOTEBOOK), encoding="utf-8")
+    return p
+
+
+def _fail_parse(*_args: object) -> None:
+    raise AssertionError("parse_notebook should not run on a cache hit")
+
+
+class TestLoadNotebook:
+    def test_miss_writes_entry_under_workdir(self, notebook_path: Path):
+        nb, errors = load_notebook(notebook_path)
+        assert nb.name == "cached"
+        assert errors == []
+        assert list(cache_dir(notebook_path.parent / "ws").glob("*.json"))
+
+    def test_hit_skips_parsing(self, notebook_path: Path, monkeypatch):
+        first, _ = load_notebook(notebook_path)
+        monkeypatch.setattr(parse_notebook, "parse_notebook_bytes", _fail_parse)
+        monkeypatch.setattr(parse_notebook, "validate_notebook", _fail_parse)
+
+        second, errors = load_notebook(notebook_path)
+        assert second == first
+        assert second.cells[0].span == first.cells[0].span
+        assert errors == []
+
+    def test_touched_file_hits_via_content_hash(self, notebook_path: Path, monkeypatch):
+        load_notebook(notebook_path)
+        st = notebook_path.stat()
+        os.utime(notebook_path, ns=(st.st_atime_ns, st.st_mtime_ns + 5_000_000_000))
+        monkeypatch.setattr(parse_notebook, "parse_notebook_bytes", _fail_parse)
+
+        nb, _ = load_notebook(notebook_path)
+        assert nb.cells[0].id == "setup"
+
+    def test_edited_file_is_reparsed(self, notebook_path: Path):
+        load_notebook(notebook_path)
+        notebook_path.write_text(notebook_path.read_text().replace("setup", "setup-two"), encoding="utf-8")
+
+        nb, _ = load_notebook(notebook_path)
+        assert nb.cells[0].id == "setup-two"
+
+    def test_edit_during_parse_is_not_cached(self, notebook_path: Path, monkeypatch):
+        real = parse_notebook.validate_notebook
+
+        def edit_then_validate(nb: parse_notebook.Notebook) -> list[str]:
+            # The file changes after its bytes were read but before the entry is written
+            notebook_path.write_text(notebook_path.read_text().replace("setup", "setup-two"), encoding="utf-8")
+            return real(nb)
+
+        monkeypatch.setattr(parse_notebook, "validate_notebook", edit_then_validate)
+        nb, _ = load_notebook(notebook_path)
+        assert nb.cells[0].id == "setup"
+        assert not list(cache_dir(notebook_path.parent / "ws").glob("*.json"))
+
+        monkeypatch.undo()
+        nb, _ = load_notebook(notebook_path)
+        assert nb.cells[0].id == "setup-two"
+
+    def test_cached_validation_errors(self, notebook_path: Path):
+        notebook_path.write_text(notebook_path.read_text().replace('"2.0"', '"1.0"'), encoding="utf-8")
+        load_notebook(notebook_path)
+        _, errors = load_notebook(notebook_path)
+        assert any("Schema" in e for e in errors)
+
+    def test_no_cache(self, notebook_path: Path):
+        load_notebook(notebook_path, use_cache=False)
+        assert not cache_dir(notebook_path.parent / "ws").exists()
+
+
+class TestEviction:
+    def test_entries_are_bounded(self, tmp_path: Path, monkeypatch):
+        monkeypatch.setattr(notebook_cache, "MAX_PARSE_CACHE_ENTRIES", 3)
+        directory = tmp_path / "cache"
+        sources = []
+        seen: set[Path] = set()
+        for i in range(5):
+            src = tmp_path / f"nb{i}.anyt.md"
+            src.write_text(f"notebook {i}", encoding="utf-8")
+            sources.append(src)
+            write_entry(directory, src, {"i": i}, src.stat(), notebook_cache.file_hash(src))
+            # Age each new entry so the write order is also the LRU order
+            for entry in set(directory.glob("*.json")) - seen:
+                os.utime(entry, (i, i))
+                seen.add(entry)
+
+        assert len(list(directory.glob("*.json"))) == 3
+        assert read_entry(directory, sources[0]) is None
+        assert read_entry(directory, sources[4]) == {"i": 4}
@@ -0,0 +1,191 @@
+"""Tests for the notebook daemon and its client."""
+
+import os
+import socket
+import stat
+import tempfile
+import textwrap
+import threading
+from pathlib import Path
+
+import pytest
+
+import daemon_client
+import manage_state
+import notebook_daemon
+import parse_notebook
+from config import DaemonError
+from daemon_client import call, forward_cli
+from notebook_daemon import NotebookDaemon
+
+NOTEBOOK = """\
+---
+schema: "2.0"
+name: daemon-test
+workdir: ws
+---
+
+<shell id="setup">
+echo hi
+</shell>
+"""
+
+
+@pytest.fixture
+def notebook_path(tmp_path: Path) -> Path:
+    p = tmp_path / "nb.anyt.md"
+    p.write_text(textwrap.dedent(NOTEBOOK), encoding="utf-8")
+    return p
+
+
+@pytest.fixture
+def daemon(tmp_path: Path, monkeypatch):
+    path = tmp_path / "d.sock"
+    monkeypatch.setenv("ANYT_NOTEBOOK_SOCKET", str(path))
+    monkeypatch.delenv("ANYT_NOTEBOOK_NO_DAEMON", raising=False)
+    server = NotebookDaemon(path, watch_interval=0.05)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+class TestDaemon:
+    def test_ping(self, daemon: Path):
+        assert "pid" in call("ping")
+
+    def test_run_parse_notebook(self, daemon: Path, notebook_path: Path):
+        result = call("run", {"tool": "parse_notebook", "argv": [str(notebook_path), "--validate"]})
+        assert result == {"exit_code": 0, "stdout": "Notebook is valid.\n", "stderr": ""}
+
+    def test_run_reports_usage_errors(self, daemon: Path):
+        result = call("run", {"tool": "manage_state", "argv": []})
+        assert result["exit_code"] == 2
+        assert "usage" in result["stderr"]
+
+    def test_run_resolves_relative_paths_against_cwd(self, daemon: Path, notebook_path: Path):
+        argv = ["ws", "mark-done", "--cell", "setup"]
+        result = call("run", {"tool": "manage_state", "argv": argv, "cwd": str(notebook_path.parent)})
+        assert result["exit_code"] == 0
+        assert manage_state.get_cell_status(notebook_path.parent / "ws", "setup") == "done"
+
+    def test_batch_stdin(self, daemon: Path, notebook_path: Path):
+        params = {"tool": "parse_notebook", "argv": [str(notebook_path), "--batch"], "stdin": '[{"op": "cells"}]'}
+        result = call("run", params)
+        assert result["exit_code"] == 0
+        assert '"ok": true' in result["stdout"]
+
+    def test_query_keeps_notebook_resident(self, daemon: Path, notebook_path: Path):
+        results = call("query", {"notebook": str(notebook_path), "queries": [{"op": "cell", "id": "setup"}]})
+        assert results[0]["result"]["content"] == "echo hi"
+        assert parse_notebook.resident_notebooks is not None
+        assert parse_notebook.resident_notebooks.get(notebook_path.resolve()) is not None
+
+    def test_update_invalidates_resident_notebook(self, daemon: Path, notebook_path: Path):
+        call("query", {"notebook": str(notebook_path), "queries": [{"op": "cells"}]})
+        argv = [str(notebook_path), "update", "--cell", "setup", "--content", "echo bye"]
+        assert call("run", {"tool": "update_notebook", "argv": argv})["exit_code"] == 0
+
+        results = call("query", {"notebook": str(notebook_path), "queries": [{"op": "cell", "id": "setup"}]})
+        assert results[0]["result"]["content"] == "echo bye"
+
+    def test_status_tracks_marker_changes(self, daemon: Path, tmp_path: Path):
+        workdir = tmp_path / "ws"
+        assert call("status", {"workdir": str(workdir), "cells": ["a"]}) == [{"id": "a", "status": "pending"}]
+        manage_state.mark_done(workdir, "a")
+        assert call("status", {"workdir": str(workdir), "cells": ["a"]}) == [{"id": "a", "status": "done"}]
+
+    def test_unknown_method(self, daemon: Path):
+        with pytest.raises(DaemonError, match="Unknown method"):
+            call("bogus")
+
+    def test_forward_cli_replays_output(self, daemon: Path, notebook_path: Path, capsys):
+        assert forward_cli("parse_notebook", [str(notebook_path), "--validate"]) == 0
+        assert capsys.readouterr().out == "Notebook is valid.\n"
+
+    def test_tool_crash_is_reported(self, daemon: Path, monkeypatch, capsys):
+        def crash(argv: list[str]) -> int:
+            raise RuntimeError("boom")
+
+        monkeypatch.setitem(notebook_daemon._TOOLS, "parse_notebook", crash)
+        with pytest.raises(DaemonError, match="RuntimeError: boom"):
+            call("run", {"tool": "parse_notebook", "argv": []})
+        assert call("ping")["pid"] > 0  # the daemon keeps serving
+
+        assert forward_cli("parse_notebook", []) == 1
+        assert "Daemon error: RuntimeError: boom" in capsys.readouterr().err
+
+
+class TestClientFallback:
+    def test_no_socket_falls_back(self, tmp_path: Path, monkeypatch):
+        monkeypatch.setenv("ANYT_NOTEBOOK_SOCKET", str(tmp_path / "missing.sock"))
+        assert forward_cli("parse_notebook", ["x"]) is None
+
+    def test_stale_socket_falls_back(self, tmp_path: Path, monkeypatch):
+        stale = tmp_path / "stale.sock"
+        stale.touch()
+        monkeypatch.setenv("ANYT_NOTEBOOK_SOCKET", str(stale))
+        assert forward_cli("parse_notebook", ["x"]) is None
+
+    def test_disabled_by_env(self, daemon: Path, monkeypatch):
+        monkeypatch.setenv("ANYT_NOTEBOOK_NO_DAEMON", "1")
+        assert forward_cli("parse_notebook", ["x"]) is None
+
+    def test_default_socket_is_per_user(self, tmp_path: Path, monkeypatch):
+        monkeypatch.delenv("ANYT_NOTEBOOK_SOCKET", raising=False)
+        monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+        assert daemon_client.socket_path() == tmp_path / f"anyt-notebook-{os.getuid()}.sock"
+
+    def test_default_socket_dir_is_private(self, tmp_path: Path, monkeypatch):
+        monkeypatch.delenv("ANYT_NOTEBOOK_SOCKET", raising=False)
+        monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+        monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+        path = daemon_client.socket_path()
+        assert path.parent == tmp_path / f"anyt-notebook-{os.getuid()}"
+
+        with NotebookDaemon(path):
+            assert stat.S_IMODE(path.parent.stat().st_mode) == 0o700
+            assert stat.S_IMODE(path.stat().st_mode) == 0o600
+
+    def test_unsafe_socket_dir_is_refused(self, tmp_path: Path, monkeypatch):
+        shared = tmp_path / "shared"
+        shared.mkdir()
+        shared.chmod(0o777)
+        path = shared / "d.sock"
+        with pytest.raises(DaemonError, match="writable by other users"):
+            NotebookDaemon(path)
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as planted:
+            planted.bind(str(path))
+            planted.listen(1)
+            monkeypatch.setenv("ANYT_NOTEBOOK_SOCKET", str(path))
+            assert forward_cli("parse_notebook", ["x"]) is None
+
+    def test_writable_socket_is_refused(self, daemon: Path):
+        daemon.chmod(0o666)
+        assert forward_cli("parse_notebook", ["x"]) is None
+        with pytest.raises(PermissionError):
+            call("ping", path=daemon)
+
+    def test_failure_after_send_is_not_rerun(self, tmp_path: Path, monkeypatch, capsys):
+        path = tmp_path / "drop.sock"
+        monkeypatch.setenv("ANYT_NOTEBOOK_SOCKET", str(path))
+        received: list[bytes] = []
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(str(path))
+            server.listen(1)
+
+            def accept_and_drop() -> None:
+                conn, _ = server.accept()
+                with conn:
+                    received.append(conn.recv(65536))
+
+            thread = threading.Thread(target=accept_and_drop, daemon=True)
+            thread.start()
+            assert forward_cli("update_notebook", ["nb.anyt.md", "--delete", "x"]) == 1
+            thread.join()
+
+        assert b'"update_notebook"' in received[0]
+        assert "Daemon error: Daemon closed the connection without a response" in capsys.readouterr().err
@@ -0,0 +1,183 @@
+"""Tests for notebook_diff module."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+import notebook_diff
+from config import ValidationError
+from notebook_diff import diff_notebooks, main, merge_notebooks
+from parse_notebook import parse_notebook_bytes
+
+BASE = """\
+---
+schema: "2.0"
+name: diff-test
+---
+
+# Setup
+
+<shell id="install">
+pip install -r requirements.txt
+</shell>
+
+<task id="write" label="Write">
+Write the report.
+Keep it short.
+Cite sources.
+</task>
+
+<note id="end">
+Done.
+</note>
+"""
+
+
+def _ids(source: bytes) -> list[str]:
+    return [cell.id for cell in parse_notebook_bytes(source).cells]
+
+
+def _edit(text: str, *replacements: tuple[str, str]) -> bytes:
+    for old, new in replacements:
+        assert old in text
+        text = text.replace(old, new, 1)
+    return text.encode()
+
+
+def _move_end_first(text: str) -> str:
+    end = '<note id="end">\nDone.\n</note>\n'
+    return text.replace("\n" + end, "").replace("# Setup\n", f"# Setup\n\n{end}")
+
+
+class TestDiff:
+    def test_identical(self):
+        result = diff_notebooks(BASE.encode(), BASE.encode())
+        assert result["changes"] == []
+        assert result["summary"]["unchanged"] == 5  # type: ignore[index]
+
+    def test_reports_each_kind_of_change(self):
+        new = _edit(
+            BASE,
+            ('<task id="write" label="Write">', '<task id="write" label="Draft" agent="fast">'),
+            ("Keep it short.", "Keep it brief."),
+            ("# Setup\n", "# Set up the environment\n"),
+            ('<note id="end">\nDone.\n</note>\n', '<shell id="lint">\nruff check .\n</shell>\n'),
+        )
+        changes = {c["id"]: c for c in diff_notebooks(BASE.encode(), new)["changes"]}  # type: ignore[union-attr]
+        assert set(changes) == {"install", "write", "lint", "end"}
+        assert changes["install"]["text_diff"] == ["@@ -1,3 +1,3 @@", " ", "-# Setup", "+# Set up the environment", " "]
+        assert "content_diff" not in changes["install"]
+        assert changes["write"]["fields"] == {"label": ["Write", "Draft"], "agent": [None, "fast"]}
+        assert "-Keep it short." in changes["write"]["content_diff"]
+        assert (changes["lint"]["change"], changes["lint"]["type"]) == ("added", "shell")
+        assert changes["end"]["change"] == "removed"
+
+    def test_moves(self):
+        write = '\n<task id="write" label="Write">\nWrite the report.\nKeep it short.\nCite sources.\n</task>\n'
+        swapped = _edit(BASE, (write, ""), ("Done.\n</note>\n", "Done.\n</note>\n" + write))
+        assert _ids(swapped) == ["install", "end", "write"]
+        result = diff_notebooks(BASE.encode(), swapped)
+        assert result["changes"] == [{"id": "end", "change": "moved", "type": "note"}]
+
+        # Prose goes with the cell after it: the heading now introduces "end"
+        changes = diff_notebooks(BASE.encode(), _move_end_first(BASE).encode())["changes"]
+        assert [(c["id"], c["change"], c.get("moved")) for c in changes] == [  # type: ignore[union-attr]
+            ("end", "modified", True),
+            ("install", "modified", False),
+        ]
+
+    def test_unchanged_cells_are_not_decoded(self, monkeypatch: pytest.MonkeyPatch):
+        cells = "".join(f'\n<shell id="c{i}">\necho {i}\n</shell>\n' for i in range(3000))
+        old = f'---\nschema: "2.0"\nname: big\n---\n{cells}'
+        diffed: list[str] = []
+        real = notebook_diff._line_diff
+        monkeypatch.setattr(notebook_diff, "_line_diff", lambda a, b, n: diffed.append(a) or real(a, b, n))
+        result = diff_notebooks(old.encode(), _edit(old, ("echo 1500\n", "echo changed\n")))
+        assert diffed == ["echo 1500"]
+        assert result["summary"]["modified"] == 1  # type: ignore[index]
+
+    def test_missing_final_newline_is_not_a_change(self):
+        bare = BASE.removesuffix("\n")
+        assert diff_notebooks(bare.encode(), BASE.encode())["changes"] == []
+
+        appended = (BASE + '\n<shell id="lint">\nruff check .\n</shell>').encode()
+        changes = diff_notebooks(bare.encode(), appended)["changes"]
+        assert changes == [{"id": "lint", "change": "added", "type": "shell"}]
+
+    def test_other_attribute_change_is_shown(self):
+        new = _edit(BASE, ('<shell id="install">', '<shell id="install" timeout="30">'))
+        (change,) = diff_notebooks(BASE.encode(), new)["changes"]  # type: ignore[misc]
+        assert change["id"] == "install"
+        assert '+<shell id="install" timeout="30">' in change["text_diff"]
+
+    def test_duplicate_ids(self):
+        with pytest.raises(ValidationError, match="Duplicate cell ID 'end' in new"):
+            diff_notebooks(BASE.encode(), (BASE + '\n<note id="end">\nAgain.\n</note>\n').encode())
+
+
+class TestMerge:
+    def test_changes_to_different_cells(self):
+        ours = _edit(BASE, ("pip install", "uv pip install"))
+        theirs = _edit(
+            _move_end_first(BASE),
+            ("Done.", "Finished."),
+            ("</task>\n", '</task>\n\n<shell id="publish">\n./publish.sh\n</shell>\n'),
+        )
+        merged, report = merge_notebooks(BASE.encode(), ours, theirs)
+        assert report["clean"]
+        assert _ids(merged) == ["end", "install", "write", "publish"]
+        text = merged.decode()
+        assert "uv pip install" in text and "Finished." in text
+
+    def test_line_edits_in_one_cell(self):
+        ours = _edit(BASE, ("Write the report.", "Write the summary."))
+        theirs = _edit(BASE, ("Cite sources.", "Cite sources inline."))
+        merged, report = merge_notebooks(BASE.encode(), ours, theirs)
+        assert report["summary"]["merged"] == 1  # type: ignore[index]
+        assert "Write the summary.\nKeep it short.\nCite sources inline.\n" in merged.decode()
+
+    def test_conflicts(self):
+        ours = _edit(BASE, ("Keep it short.", "Keep it shorter."), ('<note id="end">\nDone.\n</note>\n', ""))
+        theirs = _edit(BASE, ("Keep it short.", "Make it long."), ("Done.", "All done."))
+        merged, report = merge_notebooks(BASE.encode(), ours, theirs)
+        assert not report["clean"]
+        assert report["conflicts"] == [
+            {"id": "write", "kind": "content", "hunks": 1},
+            {"id": "end", "kind": "delete/modify"},
+        ]
+        text = merged.decode()
+        assert "<<<<<<< ours\nKeep it shorter.\n=======\nMake it long.\n>>>>>>> theirs\n" in text
+        assert '<<<<<<< ours\n=======\n\n<note id="end">\nAll done.\n</note>\n>>>>>>> theirs\n' in text
+
+    def test_same_change_on_both_sides(self):
+        both = _edit(BASE, ("Done.", "Finished."))
+        merged, report = merge_notebooks(BASE.encode(), both, both)
+        assert merged == both
+        assert report["summary"]["both"] == 1  # type: ignore[index]
+
+    def test_missing_final_newline(self):
+        bare = BASE.removesuffix("\n")
+        ours = (BASE + '\n<shell id="lint">\nruff check .\n</shell>\n').encode()
+        theirs = _edit(bare, ("Done.", "Finished."))
+        merged, report = merge_notebooks(bare.encode(), ours, theirs)
+        assert report["clean"]
+        assert report["summary"]["merged"] == 0  # type: ignore[index]
+        assert merged == _edit(ours.decode(), ("Done.", "Finished."))
+
+        merged, report = merge_notebooks(bare.encode(), bare.encode(), theirs)
+        assert merged == theirs
+
+    def test_cli(self, tmp_path: Path, capsys: pytest.CaptureFixture[str]):
+        paths = []
+        for name, text in [("base", BASE.encode()), ("ours", BASE.encode()), ("theirs", _edit(BASE, ("Done.", "Ok.")))]:
+            paths.append(tmp_path / f"{name}.anyt.md")
+            paths[-1].write_bytes(text)
+        assert main(["merge", *map(str, paths), "--output", str(paths[1])]) == 0
+        assert json.loads(capsys.readouterr().out)["clean"]
+        assert paths[1].read_bytes() == paths[2].read_bytes()
+
+        assert main(["diff", str(paths[0]), str(paths[1])]) == 0
+        assert json.loads(capsys.readouterr().out)["changes"][0]["content_diff"] == ["@@ -1 +1 @@", "-Done.", "+Ok."]
+        assert main(["diff", str(paths[0]), str(tmp_path / "missing.anyt.md")]) == 1
+        assert "Parse error: File not found" in capsys.readouterr().err
@@ -1,19 +1,34 @@
 """Tests for parse_notebook module."""
 
+import json
+import mmap
 import textwrap
 from pathlib import Path
 
 import pytest
 
 from parse_notebook import (
+    AgentProfile,
+    Cell,
+    LazyCell,
     Notebook,
     ParseError,
+    ValidationError,
+    build_cell_index,
+    compile_form,
     extract_form_description,
     extract_form_fields,
     format_form_prompt,
+    iter_cells,
+    main,
+    parse_batch_queries,
     parse_notebook,
+    run_batch,
+    scan_notebook,
+    validate_form_response,
     validate_notebook,
 )
+from update_notebook import update_cell_content
 
 
 @pytest.fixture
@@ -245,6 +260,98 @@ class TestParseNotebook:
             )
 
 
+class TestScanNotebook:
+    NOTEBOOK = """\
+    ---
+    schema: "2.0"
+    name: test
+    ---
+
+    # test
+
+    <shell id="setup">
+    mkdir -p src
+    </shell>
+
+    <task id="build" label="Build">
+    Build it.
+
+    **Output:** src/app.ts
+    </task>
+    """
+
+    def test_spans_locate_cells(self, tmp_notebook):
+        path = tmp_notebook(self.NOTEBOOK)
+        data = path.read_bytes()
+        nb = parse_notebook(path)
+
+        setup, build = nb.cells
+        assert setup.span is not None
+        assert build.span is not None
+        assert (setup.span.start_line, setup.span.end_line) == (8, 10)
+        assert (build.span.start_line, build.span.end_line) == (12, 16)
+        assert data[setup.span.start_offset : setup.span.end_offset] == b'<shell id="setup">\nmkdir -p src\n</shell>\n'
+        assert data[build.span.content_start : build.span.content_end].decode().strip() == build.content
+
+    def test_iter_cells_streams_file(self, tmp_notebook):
+        cells = iter_cells(tmp_notebook(self.NOTEBOOK))
+        first = next(cells)
+        assert first.id == "setup"
+        assert [c.id for c in cells] == ["build"]
+
+    def test_scan_mmap_buffer(self, tmp_notebook):
+        path = tmp_notebook(self.NOTEBOOK)
+        with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            frontmatter, cells = scan_notebook(iter(mm.readline, b""))
+            assert frontmatter.name == "test"
+            assert [c.content for c in cells] == ["mkdir -p src", "Build it.\n\n**Output:** src/app.ts"]
+
+    def test_mismatched_close_reports_line(self, tmp_notebook):
+        path = tmp_notebook("""\
+        ---
+        schema: "2.0"
+        name: test
+        ---
+
+        <task id="hello">
+        Hello
+        </shell>
+        """)
+        with pytest.raises(ParseError, match="line 8"):
+            parse_notebook(path)
+
+
+class TestLazyParse:
+    NOTEBOOK = TestScanNotebook.NOTEBOOK
+
+    def test_lazy_matches_eager(self, tmp_notebook):
+        path = tmp_notebook(self.NOTEBOOK)
+        lazy = parse_notebook(path, lazy=True)
+        eager = parse_notebook(path)
+
+        assert all(isinstance(c, LazyCell) for c in lazy.cells)
+        assert lazy.cells == eager.cells
+        assert [c.content for c in lazy.cells] == [c.content for c in eager.cells]
+
+    def test_content_is_not_decoded_until_accessed(self, tmp_path: Path):
+        path = tmp_path / "bad.anyt.md"
+        path.write_bytes(b'---\nschema: "2.0"\nname: test\n---\n\n<shell id="setup">\n\xff\xfe\n</shell>\n')
+
+        nb = parse_notebook(path, lazy=True)
+        assert validate_notebook(nb) == []
+        with pytest.raises(UnicodeDecodeError):
+            _ = nb.cells[0].content
+
+    def test_content_can_be_assigned(self, tmp_notebook):
+        cell = parse_notebook(tmp_notebook(self.NOTEBOOK), lazy=True).cells[0]
+        cell.content = "replaced"
+        assert cell.content == "replaced"
+
+    def test_cells_use_slots(self, tmp_notebook):
+        cell = parse_notebook(tmp_notebook(self.NOTEBOOK), lazy=True).cells[0]
+        assert not hasattr(cell, "__dict__")
+
+
 class TestValidateNotebook:
     def test_valid_notebook(self, tmp_notebook):
         nb = parse_notebook(
@@ -314,6 +421,69 @@ class TestValidateNotebook:
         errors = validate_notebook(nb)
         assert any("agent" in e.lower() for e in errors)
 
+    def test_agent_may_reference_profile_id(self, tmp_notebook):
+        nb = parse_notebook(
+            tmp_notebook("""\
+            ---
+            schema: "2.0"
+            name: test
+            agents:
+              - id: codex-default
+                name: Codex
+                type: codex
+            ---
+
+            <task id="hello" agent="codex-default">
+            Hello
+            </task>
+            """)
+        )
+        assert validate_notebook(nb) == []
+
+    def test_invalid_agent_profiles(self):
+        profiles = [
+            AgentProfile(id="a", name="A", type="claude", default=True),
+            AgentProfile(id="a", name="B", type="robot", default=True),
+        ]
+        errors = validate_notebook(Notebook(schema="2.0", name="test", agents=profiles))
+        assert any("Duplicate agent profile" in e for e in errors)
+        assert any("'robot'" in e for e in errors)
+        assert any("default" in e for e in errors)
+
+    def test_after_attribute(self, tmp_notebook):
+        nb = parse_notebook(
+            tmp_notebook("""\
+            ---
+            schema: "2.0"
+            name: test
+            ---
+
+            <shell id="a">
+            echo a
+            </shell>
+
+            <shell id="b" after="">
+            echo b
+            </shell>
+
+            <shell id="c" after="a, b">
+            echo c
+            </shell>
+
+            <shell id="d" after="e">
+            echo d
+            </shell>
+
+            <shell id="e">
+            echo e
+            </shell>
+            """)
+        )
+        assert [c.after for c in nb.cells] == [None, [], ["a", "b"], ["e"], None]
+        errors = validate_notebook(nb)
+        assert len(errors) == 1
+        assert "'after' on cell 'd'" in errors[0]
+
     def test_skip_on_non_break(self):
         from parse_notebook import Cell
 
@@ -508,3 +678,157 @@ class TestFormatFormPrompt:
 
         cell = Cell(cell_type="task", id="hello", content="Do something")
         assert format_form_prompt(cell) is None
+
+
+class TestBatchQueries:
+    @pytest.fixture
+    def notebook(self, tmp_notebook):
+        return parse_notebook(
+            tmp_notebook("""\
+            ---
+            schema: "2.0"
+            name: test
+            ---
+
+            <input id="config">
+            ## Setup
+
+            <form type="json">
+            {"fields": [{"name": "name", "type": "text", "label": "Project Name", "required": true}]}
+            </form>
+            </input>
+
+            <shell id="setup">
+            echo hi
+            </shell>
+            """)
+        )
+
+    def test_cell_index(self, notebook):
+        assert build_cell_index(notebook) == {"config": 0, "setup": 1}
+
+    def test_parse_shorthand_queries(self):
+        assert parse_batch_queries(["validate", "cell:setup"]) == [{"op": "validate"}, {"op": "cell", "id": "setup"}]
+
+    def test_parse_json_queries(self):
+        assert parse_batch_queries(['[{"op": "form", "id": "config"}]']) == [{"op": "form", "id": "config"}]
+
+    def test_invalid_json_raises(self):
+        with pytest.raises(ParseError):
+            parse_batch_queries(["[not json"])
+
+    def test_answers_all_queries_in_order(self, notebook):
+        queries = [
+            {"op": "cell", "id": "setup"},
+            {"op": "form", "id": "config"},
+            {"op": "form-prompt", "id": "config"},
+            {"op": "validate"},
+        ]
+        results = list(run_batch(notebook, [], queries))
+
+        assert all(r["ok"] for r in results)
+        assert results[0]["result"]["content"] == "echo hi"
+        assert results[1]["result"][0]["name"] == "name"
+        assert "Project Name" in results[2]["result"]
+        assert results[3]["result"] == {"valid": True, "errors": []}
+
+    def test_failed_queries_do_not_stop_batch(self, notebook):
+        queries = [{"op": "cell", "id": "missing"}, {"op": "form", "id": "setup"}, {"op": "bogus"}, {"op": "cells"}]
+        results = list(run_batch(notebook, [], queries))
+
+        assert [r["ok"] for r in results] == [False, False, False, True]
+        assert results[0]["error"] == "Cell not found: missing"
+        assert "No form" in results[1]["error"]
+        assert len(results[3]["result"]) == 2
+
+    def test_version_matches_edits(self, tmp_path: Path, capsys: pytest.CaptureFixture[str]):
+        path = tmp_path / "v.anyt.md"
+        path.write_text('---\nschema: "2.0"\nname: v\n---\n\n<shell id="setup">\necho hi\n</shell>\n', encoding="utf-8")
+        assert main([str(path), "--batch", "version", "cell:setup"]) == 0
+        version = json.loads(capsys.readouterr().out.splitlines()[0])["result"]
+        assert update_cell_content(path, "setup", "echo bye", expect_version=version) != version
+        assert next(run_batch(parse_notebook(path), [], [{"op": "version"}]))["ok"] is False
+
+        assert main([str(path)]) == 0
+        parsed = json.loads(capsys.readouterr().out)
+        assert parsed["version"] is None  # the frontmatter field
+        assert update_cell_content(path, "setup", "echo again", expect_version=parsed["content_version"])
+
+
+def _input_cell(form: str, description: str = "## Setup") -> Cell:
+    return Cell(cell_type="input", id="config", content=f'{description}\n\n<form type="json">\n{form}\n</form>')
+
+
+class TestCompileForm:
+    FORM = """{"fields": [
+        {"name": "name", "type": "text", "label": "Name", "required": true,
+         "validation": {"minLength": 3, "pattern": "^[a-z][a-z0-9-]*$"}},
+        {"name": "db", "type": "select", "label": "Database",
+         "options": [{"value": "pg", "label": "PostgreSQL"}, {"value": "my", "label": "MySQL"}]},
+        {"name": "port", "type": "number", "label": "Port", "validation": {"min": 1024, "max": 65535}},
+        {"name": "public", "type": "checkbox", "label": "Public"},
+        {"name": "feats", "type": "multiselect", "label": "Features", "validation": {"maxItems": 1},
+         "options": [{"value": "a", "label": "Auth"}, {"value": "b", "label": "API"}]},
+        {"name": "logo", "type": "file", "label": "Logo"}
+    ]}"""
+
+    def test_schema_is_cached_by_content(self):
+        first = compile_form(_input_cell(self.FORM))
+        second = compile_form(_input_cell(self.FORM))
+        assert first is not None
+        assert first is second
+        assert first.description == "## Setup"
+        assert first.option_values["db"] == frozenset({"pg", "my"})
+
+    def test_rejects_unknown_field_type(self):
+        with pytest.raises(ValidationError, match="Invalid field type 'color'"):
+            compile_form(_input_cell('{"fields": [{"name": "c", "type": "color", "label": "C"}]}'))
+
+    def test_rejects_select_without_options(self):
+        with pytest.raises(ValidationError, match="options"):
+            compile_form(_input_cell('{"fields": [{"name": "c", "type": "select", "label": "C"}]}'))
+
+    def test_rejects_missing_label(self):
+        with pytest.raises(ValidationError, match="missing 'label'"):
+            compile_form(_input_cell('{"fields": [{"name": "c", "type": "text"}]}'))
+
+    def test_rejects_duplicate_names(self):
+        form = '{"fields": [{"name": "c", "type": "text", "label": "C"}, {"name": "c", "type": "text", "label": "D"}]}'
+        with pytest.raises(ValidationError, match="Duplicate"):
+            compile_form(_input_cell(form))
+
+    def test_invalid_json_raises_parse_error(self):
+        with pytest.raises(ParseError, match="Invalid JSON"):
+            compile_form(_input_cell("{not json"))
+
+    def test_valid_response(self):
+        schema = compile_form(_input_cell(self.FORM))
+        assert schema is not None
+        values = {
+            "name": "my-app",
+            "db": "pg",
+            "port": 3000,
+            "public": True,
+            "feats": ["a"],
+            "logo": {"filename": "l.png", "path": "/tmp/l.png"},
+        }
+        assert validate_form_response(schema, values) == []
+
+    def test_invalid_response(self):
+        schema = compile_form(_input_cell(self.FORM))
+        assert schema is not None
+        values = {"name": "X", "db": "oracle", "port": 80, "public": "yes", "feats": ["a", "b"], "extra": 1}
+        errors = validate_form_response(schema, values)
+
+        assert "Unknown field 'extra'" in errors
+        assert any("minLength" in e for e in errors)
+        assert any("pattern" in e for e in errors)
+        assert any("'db' must be one of" in e for e in errors)
+        assert any("below min" in e for e in errors)
+        assert any("true or false" in e for e in errors)
+        assert any("maxItems" in e for e in errors)
+
+    def test_required_field_missing(self):
+        schema = compile_form(_input_cell(self.FORM))
+        assert schema is not None
+        assert validate_form_response(schema, {}) == ["Field 'name' is required"]
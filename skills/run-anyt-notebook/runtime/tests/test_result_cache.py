@@ -0,0 +1,149 @@
+"""Tests for result_cache module."""
+
+from pathlib import Path
+
+import pytest
+
+import result_cache
+from frontmatter import AgentProfile
+from manage_state import get_cell_status, mark_done, read_marker
+from parse_notebook import Cell, Notebook
+from result_cache import PathHasher, ResultCache, cache_report, record_cell
+from run_notebook import run_notebook
+
+
+@pytest.fixture
+def workdir(tmp_path: Path) -> Path:
+    path = tmp_path / "anyt_workspace_test"
+    path.mkdir()
+    return path
+
+
+def _notebook(*cells: Cell, agents: list[AgentProfile] | None = None) -> Notebook:
+    return Notebook(schema="2.0", name="test", cells=list(cells), agents=agents or [])
+
+
+def _shell(cell_id: str, script: str) -> Cell:
+    return Cell(cell_type="shell", id=cell_id, content=script)
+
+
+def _task(cell_id: str, content: str, agent: str | None = None) -> Cell:
+    return Cell(cell_type="task", id=cell_id, content=content, agent=agent)
+
+
+class TestKeys:
+    def test_change_reaches_dependents_only(self, workdir: Path):
+        before = _notebook(_shell("a", "echo 1 > a.txt"), _shell("b", "cat a.txt > b.txt"), _shell("c", "touch c"))
+        after = _notebook(_shell("a", "echo 2 > a.txt"), _shell("b", "cat a.txt > b.txt"), _shell("c", "touch c"))
+        old, new = ResultCache(before, workdir).keys, ResultCache(after, workdir).keys
+        assert old["a"] != new["a"]
+        assert old["b"] != new["b"]
+        assert old["c"] == new["c"]
+
+    def test_external_input_files(self, workdir: Path):
+        notebook = _notebook(_shell("a", "cat data/in.csv > a.txt"), _shell("b", "cat a.txt > b.txt"))
+        (workdir / "data").mkdir()
+        (workdir / "data" / "in.csv").write_text("x\n")
+        cache = ResultCache(notebook, workdir)
+        (workdir / "a.txt").write_text("written by a, so not part of any key\n")
+        assert ResultCache(notebook, workdir).keys == cache.keys
+
+        (workdir / "data" / "in.csv").write_text("y\n")
+        assert ResultCache(notebook, workdir).keys["a"] != cache.keys["a"]
+
+    def test_agent_model(self, workdir: Path):
+        task = _task("t", "Summarize notes.md.\n\n**Output:** summary.md", agent="fast")
+        keys = [
+            ResultCache(
+                _notebook(task, agents=[AgentProfile(id="fast", name="Fast", type="claude", model=model)]), workdir
+            ).keys["t"]
+            for model in ("small", "large")
+        ]
+        assert keys[0] != keys[1]
+
+    def test_hashes_are_remembered(self, workdir: Path, monkeypatch: pytest.MonkeyPatch):
+        (workdir / "big.bin").write_bytes(b"x" * 1000)
+        PathHasher(workdir).hash("big.bin")
+        hasher = PathHasher(workdir)
+        hasher.hash("big.bin")
+        hasher.save()
+
+        calls: list[Path] = []
+        monkeypatch.setattr(result_cache, "file_hash", lambda path: calls.append(path) or "")
+        assert PathHasher(workdir).hash("big.bin") is not None
+        assert calls == []
+        (workdir / "big.bin").write_bytes(b"y" * 1001)
+        PathHasher(workdir).hash("big.bin")
+        assert calls == [workdir / "big.bin"]
+
+
+class TestReuse:
+    def _run(self, notebook: Notebook, workdir: Path, rerun: bool = False):
+        return run_notebook(notebook, workdir, login=False, rerun=rerun)
+
+    def test_rerun_reuses_unchanged_results(self, workdir: Path):
+        notebook = _notebook(_shell("count", "echo x >> runs.txt"))
+        self._run(notebook, workdir)
+        marker = read_marker(workdir, "count")
+        assert marker is not None and marker["cache_key"] == ResultCache(notebook, workdir).keys["count"]
+        assert list(marker["outputs"]) == ["runs.txt"]  # type: ignore[arg-type]
+
+        result = self._run(notebook, workdir, rerun=True)
+        assert result.status == "complete"
+        assert result.cells[0].cached
+        assert (workdir / "runs.txt").read_text() == "x\n"
+
+    def test_changed_output_is_not_reused(self, workdir: Path):
+        notebook = _notebook(_shell("count", "echo x >> runs.txt"))
+        self._run(notebook, workdir)
+        (workdir / "runs.txt").write_text("edited\n")
+        result = self._run(notebook, workdir, rerun=True)
+        assert not result.cells[0].cached
+        assert (workdir / "runs.txt").read_text() == "edited\nx\n"
+
+    def test_edited_cell_is_stale(self, workdir: Path):
+        self._run(_notebook(_shell("a", "echo 1 > a.txt"), _shell("b", "cat a.txt > b.txt")), workdir)
+        edited = _notebook(_shell("a", "echo 2 > a.txt"), _shell("b", "cat a.txt > b.txt"))
+        assert [r["cache"] for r in cache_report(edited, ResultCache(edited, workdir))] == ["stale", "stale"]
+
+        self._run(edited, workdir)
+        assert (workdir / "b.txt").read_text() == "2\n"
+        assert [r["cache"] for r in cache_report(edited, ResultCache(edited, workdir))] == ["fresh", "fresh"]
+
+    def test_opaque_cells_are_not_reused(self, workdir: Path):
+        notebook = _notebook(_shell("s", "python3 -c 'print(1)'"))
+        self._run(notebook, workdir)
+        assert not self._run(notebook, workdir, rerun=True).cells[0].cached
+
+    def test_unanalysable_reads_are_not_reused(self, workdir: Path):
+        (workdir / "in.txt").write_text("1\n")
+        notebook = _notebook(
+            _shell("var", 'F=in.txt\ncat "$F" > copy.txt'),
+            _shell("after", "cat copy.txt > final.txt"),
+            _task("vague", "Write a summary.\n\n**Output:** summary.md"),
+        )
+        cache = ResultCache(notebook, workdir)
+        assert cache._checkable == set()
+
+        self._run(notebook, workdir)
+        (workdir / "in.txt").write_text("2\n")
+        result = self._run(notebook, workdir, rerun=True)
+        assert [r.cached for r in result.cells[:2]] == [False, False]
+        assert (workdir / "final.txt").read_text() == "2\n"
+
+    def test_recorded_task(self, workdir: Path):
+        notebook = _notebook(
+            _task("t", "Summarize notes.md.\n\n**Output:** summary.md"), _shell("s", "cat summary.md > s.txt")
+        )
+        (workdir / "notes.md").write_text("notes\n")
+        assert self._run(notebook, workdir).status == "waiting-task"
+        (workdir / "summary.md").write_text("done\n")
+        mark_done(workdir, "t", 12.5)
+        data = record_cell(ResultCache(notebook, workdir), "t")
+        assert data["duration"] == 12.5 and "cache_key" in data
+
+        result = self._run(notebook, workdir, rerun=True)
+        assert result.status == "complete"
+        assert get_cell_status(workdir, "t") == "done"
+        # The shell cell waited for the task and runs for the first time
+        assert [r.cached for r in result.cells] == [True, False]
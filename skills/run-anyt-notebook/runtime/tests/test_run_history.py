@@ -0,0 +1,120 @@
+"""Tests for run_history module."""
+
+from pathlib import Path
+
+import pytest
+
+import run_history
+from config import ValidationError
+from manage_state import mark_done
+from parse_notebook import Cell, Notebook
+from run_history import (
+    cell_trend,
+    current_run,
+    diff_runs,
+    list_runs,
+    main,
+    prune_runs,
+    read_run,
+    read_snapshot,
+    record_run,
+    resolve_run,
+    runs_dir,
+)
+from run_notebook import run_notebook
+
+
+@pytest.fixture
+def workdir(tmp_path: Path) -> Path:
+    path = tmp_path / "anyt_workspace_test"
+    path.mkdir()
+    return path
+
+
+def _notebook(*scripts: str) -> Notebook:
+    cells = [Cell(cell_type="shell", id=f"s{i}", content=script) for i, script in enumerate(scripts, 1)]
+    return Notebook(schema="2.0", name="history", cells=cells)
+
+
+def _objects(workdir: Path) -> int:
+    return len(list((runs_dir(workdir) / "objects").glob("??/*")))
+
+
+class TestRecord:
+    def test_runner_records_current_run(self, workdir: Path):
+        result = run_notebook(_notebook("echo hi"), workdir, login=False)
+        assert result.run_id is not None
+        assert current_run(workdir) == result.run_id
+
+        run = read_run(workdir, result.run_id)
+        assert run["status"] == "complete" and run["notebook"] == "history"
+        assert run["cells"]["s1"]["status"] == "done"  # type: ignore[index]
+        assert b'"status": "done"' in (read_snapshot(workdir, run, "s1", ".done") or b"")
+
+    def test_storage_grows_with_changes_only(self, workdir: Path):
+        notebook = _notebook("echo one", "echo two")
+        first = run_notebook(notebook, workdir, login=False).run_id
+        stored = _objects(workdir)
+        second = run_notebook(notebook, workdir, login=False).run_id
+        assert _objects(workdir) == stored
+        assert first and second and diff_runs(workdir, first, second)["cells"] == []
+
+        mark_done(workdir, "s2", 9.0)
+        record_run(workdir)
+        assert _objects(workdir) == stored + 1
+
+    def test_large_files_are_listed_not_copied(self, workdir: Path, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(run_history, "RUN_SNAPSHOT_MAX_BYTES", 8)
+        mark_done(workdir, "big", 1.0)
+        run = read_run(workdir, record_run(workdir))
+        entry = run["cells"]["big"]["files"][".done"]  # type: ignore[index]
+        assert "sha" not in entry and entry["size"] > 8
+
+
+class TestCompare:
+    def test_trend_and_diff(self, workdir: Path):
+        fast, slow = _notebook("python3 -c 'pass'"), _notebook("python3 -c 'import time; time.sleep(0.3)'")
+        run_notebook(fast, workdir, login=False)
+        run_notebook(fast, workdir, login=False)  # nothing runs: no new trend row
+        run_notebook(slow, workdir, login=False, rerun=True)
+
+        trend = cell_trend(workdir, "s1")
+        assert [row["run"] for row in trend] == [list_runs(workdir)[0], list_runs(workdir)[2]]
+        assert trend[1]["change_seconds"] > 0.2  # type: ignore[operator]
+        assert "cpu_seconds" in trend[1]
+
+        diff = diff_runs(workdir, resolve_run(workdir, "current~2"), resolve_run(workdir, "current"))
+        cell = diff["cells"][0]  # type: ignore[index]
+        assert cell["id"] == "s1" and cell["status"] == ["done", "done"]
+        assert cell["change_seconds"] > 0.2
+        assert {".done", "script.sh"} <= set(cell["files"]["changed"])
+
+    def test_resolve(self, workdir: Path):
+        with pytest.raises(ValidationError, match="No run"):
+            resolve_run(workdir, "current")
+        first, second = record_run(workdir), record_run(workdir)
+        assert resolve_run(workdir, "current") == second
+        assert resolve_run(workdir, "current~1") == resolve_run(workdir, first[:-2]) == first
+        with pytest.raises(ValidationError, match="Only 1 runs"):
+            resolve_run(workdir, "current~2")
+        with pytest.raises(ValidationError, match="Unknown run"):
+            resolve_run(workdir, "nope")
+
+    def test_prune(self, workdir: Path):
+        mark_done(workdir, "a", 1.0)
+        record_run(workdir)
+        mark_done(workdir, "a", 2.0)
+        latest = record_run(workdir)
+        assert _objects(workdir) == 2
+
+        assert prune_runs(workdir, keep=1)["runs_removed"] == 1
+        assert list_runs(workdir) == [latest]
+        assert _objects(workdir) == 1
+
+    def test_cli(self, workdir: Path, capsys: pytest.CaptureFixture[str]):
+        mark_done(workdir, "a", 1.0)
+        record_run(workdir, status="complete")
+        assert main([str(workdir), "list"]) == 0
+        assert '"done": 1' in capsys.readouterr().out
+        assert main([str(workdir), "diff", "missing"]) == 1
+        assert "Unknown run" in capsys.readouterr().err
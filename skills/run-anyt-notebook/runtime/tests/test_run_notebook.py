@@ -0,0 +1,144 @@
+"""Tests for run_notebook module."""
+
+from pathlib import Path
+
+import pytest
+
+import run_notebook as run_notebook_module
+from manage_state import get_cell_status, read_marker, save_input_response
+from parse_notebook import Cell, Notebook
+from run_notebook import RunResult, load_env_file, run_notebook
+
+
+@pytest.fixture
+def workdir(tmp_path: Path) -> Path:
+    return tmp_path / "anyt_workspace_test"
+
+
+def _notebook(*cells: Cell) -> Notebook:
+    return Notebook(schema="2.0", name="test", cells=list(cells))
+
+
+def _shell(cell_id: str, script: str) -> Cell:
+    return Cell(cell_type="shell", id=cell_id, content=script)
+
+
+def _run(notebook: Notebook, workdir: Path, workers: int = 4, skip_breaks: bool = False) -> RunResult:
+    # Skip profile files so timings do not depend on the machine's shell setup
+    return run_notebook(notebook, workdir, workers, skip_breaks, login=False)
+
+
+def _statuses(workdir: Path, notebook: Notebook) -> dict[str, str]:
+    return {cell.id: get_cell_status(workdir, cell.id) for cell in notebook.cells}
+
+
+class TestParallelRun:
+    def test_wide_notebook_runs_concurrently(self, workdir: Path):
+        notebook = _notebook(*(_shell(f"s{i}", f"sleep 0.4 && touch out{i}.txt") for i in range(4)))
+        result = _run(notebook, workdir, workers=4)
+
+        assert result.status == "complete"
+        assert all((workdir / f"out{i}.txt").exists() for i in range(4))
+        assert result.busy_seconds >= 1.6
+        assert result.wall_seconds < 1.2
+
+    def test_markers_record_start_and_finish(self, workdir: Path):
+        notebook = _notebook(_shell("a", "echo hi > a.txt"), _shell("b", "cat a.txt > b.txt"))
+        _run(notebook, workdir, workers=2)
+
+        a, b = read_marker(workdir, "a"), read_marker(workdir, "b")
+        assert a is not None and b is not None
+        assert a["exit_code"] == 0
+        assert str(a["finished_at"]) <= str(b["started_at"])
+        assert (workdir / "b.txt").read_text() == "hi\n"
+        assert (workdir / ".anyt" / "cells" / "a" / "script.sh").read_text() == "echo hi > a.txt"
+
+    def test_markers_record_metrics(self, workdir: Path):
+        script = 'sleep 0.2 & wait; echo \'{"queue_seconds": 1.5, "wait_seconds": 3}\' >> "$ANYT_CELL_METRICS"'
+        _run(_notebook(_shell("m", script)), workdir)
+
+        marker = read_marker(workdir, "m")
+        assert marker is not None
+        metrics = marker["metrics"]
+        assert isinstance(metrics, dict)
+        assert metrics["wall_seconds"] >= 0.2
+        assert {"cpu_seconds", "peak_rss_bytes", "bytes_read", "bytes_written"} <= set(metrics)
+        assert metrics["remote"] == {"calls": 1, "queue_seconds": 1.5, "wait_seconds": 3}
+        if "processes" in metrics:
+            assert metrics["processes"] >= 1
+
+    def test_failure_stops_scheduling(self, workdir: Path):
+        notebook = _notebook(_shell("bad", "echo oops; exit 3"), _shell("next", "touch next.txt"))
+        result = _run(notebook, workdir, workers=1)
+
+        assert result.status == "failed"
+        assert _statuses(workdir, notebook) == {"bad": "failed", "next": "pending"}
+        marker = read_marker(workdir, "bad")
+        assert marker is not None and marker["exit_code"] == 3
+        assert (workdir / ".anyt" / "cells" / "bad" / "output.log").read_text() == "oops\n"
+
+    def test_runner_error_marks_cell_failed(self, workdir: Path, monkeypatch: pytest.MonkeyPatch):
+        real = run_notebook_module.save_shell_script
+
+        def save(workdir: Path, cell_id: str, script: str) -> None:
+            if cell_id == "broken":
+                raise OSError(28, "No space left on device")
+            real(workdir, cell_id, script)
+
+        monkeypatch.setattr(run_notebook_module, "save_shell_script", save)
+        notebook = _notebook(_shell("ok", "sleep 0.2"), _shell("broken", "true"), _shell("after", "true"))
+        notebook.cells[2].after = ["broken"]
+        result = _run(notebook, workdir, workers=2)
+
+        assert result.status == "failed"
+        assert _statuses(workdir, notebook) == {"ok": "done", "broken": "failed", "after": "pending"}
+        marker = read_marker(workdir, "broken")
+        assert marker is not None and "No space left on device" in str(marker["error"])
+
+    def test_completed_cells_are_not_rerun(self, workdir: Path):
+        notebook = _notebook(_shell("count", "echo x >> runs.txt"))
+        _run(notebook, workdir)
+        _run(notebook, workdir)
+        assert (workdir / "runs.txt").read_text() == "x\n"
+
+
+class TestBarriers:
+    def test_input_waits_for_response(self, workdir: Path):
+        notebook = _notebook(
+            _shell("before", "touch before.txt"),
+            Cell(cell_type="input", id="config", content="Pick a name"),
+            _shell("after", "touch after.txt"),
+        )
+        result = _run(notebook, workdir)
+        assert result.status == "waiting-input"
+        assert _statuses(workdir, notebook) == {"before": "done", "config": "pending", "after": "pending"}
+
+        save_input_response(workdir, "config", {"name": "x"})
+        assert _run(notebook, workdir).status == "complete"
+        assert (workdir / "after.txt").exists()
+
+    def test_break_pauses_unless_skipped(self, workdir: Path):
+        notebook = _notebook(Cell(cell_type="break", id="review"), _shell("after", "touch after.txt"))
+        assert _run(notebook, workdir).status == "waiting-break"
+        assert not (workdir / "after.txt").exists()
+
+        assert _run(notebook, workdir, skip_breaks=True).status == "complete"
+        assert _statuses(workdir, notebook) == {"review": "skipped", "after": "done"}
+
+    def test_independent_shells_run_past_pending_task(self, workdir: Path):
+        notebook = _notebook(
+            Cell(cell_type="task", id="write", content="Summarize notes.md.\n\n**Output:** summary.md"),
+            _shell("other", "touch other.txt"),
+            _shell("uses", "cat summary.md > copy.md"),
+        )
+        result = _run(notebook, workdir)
+        assert result.status == "waiting-task"
+        assert _statuses(workdir, notebook) == {"write": "pending", "other": "done", "uses": "pending"}
+
+
+class TestEnvFile:
+    def test_load_env_file(self, tmp_path: Path):
+        env_file = tmp_path / ".env"
+        env_file.write_text("# comment\nA=1\nexport B='two words'\nC=\"x=y\"\nbogus\n", encoding="utf-8")
+        assert load_env_file(env_file) == {"A": "1", "B": "two words", "C": "x=y"}
+        assert load_env_file(tmp_path / "missing.env") == {}
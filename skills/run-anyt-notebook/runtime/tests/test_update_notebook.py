@@ -0,0 +1,396 @@
+"""Tests for update_notebook module."""
+
+import fcntl
+import io
+import random
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+import update_notebook
+from config import ConflictError, ParseError, ValidationError
+from manage_state import get_cell_status, mark_done
+from notebook_cache import notebook_version
+from parse_notebook import parse_notebook, resolve_workdir
+from update_notebook import (
+    NotebookEditor,
+    add_cell,
+    apply_edits,
+    benchmark,
+    lock_path,
+    main,
+    move_cell,
+    remove_cell,
+    update_cell_content,
+)
+
+NOTEBOOK = """\
+---
+schema: "2.0"
+name: edit-test
+workdir: ws
+---
+
+# Title
+
+<note id="intro">
+Read me.
+</note>
+
+<shell id="build">
+make
+</shell>
+
+<task id="review" label="Review">
+Check it.
+</task>
+"""
+
+_OPEN = re.compile(
+    r"^<(task|shell|input|note|break)\s+((?:[a-z]+=(?:\"[^\"]*\"|\'[^\']*\')[\s]*)+)>\s*$", re.IGNORECASE
+)
+_CLOSE = re.compile(r"^</(task|shell|input|note|break)>\s*$", re.IGNORECASE)
+
+
+def _bounds(lines: list[str], cell_id: str) -> tuple[int | None, int | None]:
+    """Line-scanning reference: where a cell opens and closes, as the editor did before the index."""
+    start: int | None = None
+    cell_type: str | None = None
+    for i, line in enumerate(lines):
+        match = _OPEN.match(line.strip())
+        if match and dict(re.findall(r'([a-z]+)=["\']([^"\']*)["\']', match.group(2))).get("id") == cell_id:
+            start, cell_type = i, match.group(1).lower()
+            continue
+        close = _CLOSE.match(line.strip())
+        if start is not None and close and close.group(1).lower() == cell_type:
+            return start, i
+    return start, None
+
+
+def _reference(text: str, op: tuple[str, ...]) -> str | None:
+    """The file contents the original line-based implementation produced, or None if it raised."""
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    if op[0] == "add":
+        new_cell = f'\n<{op[1]} id="{op[2]}">\n{op[3]}\n</{op[1]}>\n'
+        if len(op) > 4:
+            _, end = _bounds(lines, op[4])
+            if end is None:
+                return None
+            lines.insert(end + 1, new_cell)
+        else:
+            lines.append(new_cell)
+        return "\n".join(lines)
+    start, end = _bounds(lines, op[1])
+    if start is None or end is None:
+        return None
+    if op[0] == "update":
+        return "\n".join([*lines[: start + 1], op[2], *lines[end:]])
+    stop = end + 1
+    if stop < len(lines) and lines[stop].strip() == "":
+        stop += 1
+    return "\n".join(lines[:start] + lines[stop:])
+
+
+def _apply(path: Path, op: tuple[str, ...]) -> None:
+    if op[0] == "add":
+        add_cell(path, op[1], op[2], op[3], after=op[4] if len(op) > 4 else None)
+    elif op[0] == "update":
+        update_cell_content(path, op[1], op[2])
+    else:
+        remove_cell(path, op[1])
+
+
+@pytest.fixture
+def notebook_path(tmp_path: Path) -> Path:
+    path = tmp_path / "edit.anyt.md"
+    path.write_text(NOTEBOOK, encoding="utf-8")
+    return path
+
+
+class TestEdits:
+    def test_update(self, notebook_path: Path):
+        update_cell_content(notebook_path, "build", "make all\nmake test")
+        assert '<shell id="build">\nmake all\nmake test\n</shell>\n' in notebook_path.read_text()
+
+    def test_add_and_remove(self, notebook_path: Path):
+        add_cell(notebook_path, "shell", "deploy", "./deploy.sh", label="Deploy", after="build")
+        text = notebook_path.read_text()
+        assert text.index('<shell id="deploy" label="Deploy">') < text.index('<task id="review"')
+        remove_cell(notebook_path, "deploy")
+        remove_cell(notebook_path, "review")
+        # The blank line written before an added cell stays behind
+        assert notebook_path.read_text() == NOTEBOOK.split('<task id="review"')[0]
+
+    @pytest.mark.parametrize(
+        ("call", "message"),
+        [
+            (lambda p: update_cell_content(p, "missing", "x"), "Cell not found: missing"),
+            (lambda p: add_cell(p, "note", "n", "x", after="missing"), "'after' reference: missing"),
+            (lambda p: remove_cell(p.with_name("nope.anyt.md"), "build"), "File not found"),
+        ],
+    )
+    def test_errors_leave_file_alone(self, notebook_path: Path, call, message: str):
+        with pytest.raises(ParseError, match=message):
+            call(notebook_path)
+        assert notebook_path.read_text() == NOTEBOOK
+
+    def test_unclosed_cell(self, tmp_path: Path):
+        path = tmp_path / "bad.anyt.md"
+        path.write_text('<shell id="a">\necho\n')
+        with pytest.raises(ParseError, match="Unclosed cell tag for: a"):
+            update_cell_content(path, "a", "x")
+
+    def test_crlf_is_normalized(self, tmp_path: Path):
+        path = tmp_path / "crlf.anyt.md"
+        path.write_bytes(b'<note id="a">\r\nold\r\n</note>\r\n')
+        update_cell_content(path, "a", "new")
+        assert path.read_bytes() == b'<note id="a">\nnew\n</note>\n'
+
+    def test_matches_line_based_editor(self, tmp_path: Path):
+        rng = random.Random(7)
+        path = tmp_path / "fuzz.anyt.md"
+        text = NOTEBOOK + "trailing text without newline"
+        path.write_text(text, encoding="utf-8")
+        for step in range(150):
+            ids = [*re.findall(r'id="([^"]+)"', text), "ghost"]
+            kind = rng.choice(["update", "add", "add", "remove"])
+            if kind == "update":
+                op: tuple[str, ...] = ("update", rng.choice(ids), rng.choice(["", "one", "a\nb", "  \n"]))
+            elif kind == "add":
+                op = ("add", rng.choice(["note", "shell"]), f"c{step}", "body")
+                if rng.random() < 0.7:
+                    op += (rng.choice(ids),)
+            else:
+                op = ("remove", rng.choice(ids))
+            expected = _reference(text, op)
+            if expected is None:
+                with pytest.raises(ParseError):
+                    _apply(path, op)
+            else:
+                _apply(path, op)
+                text = expected
+            assert path.read_text(encoding="utf-8") == text, op
+
+
+class TestMove:
+    def _ids(self, path: Path) -> list[str]:
+        return [cell.id for cell in parse_notebook(path).cells]
+
+    def test_keeps_tag_text_and_layout(self, notebook_path: Path):
+        tagged = NOTEBOOK.replace('<shell id="build">', '<shell id="build" agent="ci" skip=\'true\'>')
+        notebook_path.write_text(tagged)
+        move_cell(notebook_path, "build", after="review")
+        text = notebook_path.read_text()
+        assert self._ids(notebook_path) == ["intro", "review", "build"]
+        assert text.endswith('</task>\n\n<shell id="build" agent="ci" skip=\'true\'>\nmake\n</shell>\n')
+
+        move_cell(notebook_path, "build", before="intro")
+        assert self._ids(notebook_path) == ["build", "intro", "review"]
+        move_cell(notebook_path, "build", after="intro")
+        assert notebook_path.read_text() == tagged
+
+    def test_end_without_newline(self, tmp_path: Path):
+        path = tmp_path / "tail.anyt.md"
+        path.write_text('<note id="a">\nA\n</note>\n\n<note id="b">\nB\n</note>')
+        move_cell(path, "a", after="b")
+        assert path.read_text() == '<note id="b">\nB\n</note>\n\n<note id="a">\nA\n</note>\n'
+
+    def test_state_follows_cell(self, notebook_path: Path):
+        workdir = resolve_workdir(notebook_path)
+        mark_done(workdir, "build", 1.0)
+        apply_edits(notebook_path, [{"op": "move", "cell": "build", "before": "intro"}])
+        assert self._ids(notebook_path) == ["build", "intro", "review"]
+        assert get_cell_status(workdir, "build") == "done"
+
+    @pytest.mark.parametrize(
+        ("kwargs", "error", "message"),
+        [
+            ({"after": "ghost"}, ParseError, "'after' reference: ghost"),
+            ({"before": "build"}, ValidationError, "before itself"),
+            ({}, ValidationError, "exactly one"),
+            ({"after": "intro", "before": "review"}, ValidationError, "exactly one"),
+        ],
+    )
+    def test_errors_leave_file_alone(self, notebook_path: Path, kwargs: dict[str, str], error: type, message: str):
+        with pytest.raises(error, match=message):
+            move_cell(notebook_path, "build", **kwargs)
+        assert notebook_path.read_text() == NOTEBOOK
+
+    def test_cli(self, notebook_path: Path, capsys: pytest.CaptureFixture[str]):
+        assert main([str(notebook_path), "move", "--cell", "review", "--before", "build"]) == 0
+        assert "Moved cell 'review' before 'build'" in capsys.readouterr().out
+        assert self._ids(notebook_path) == ["intro", "review", "build"]
+
+
+class TestIndex:
+    def test_index_is_reused_and_kept_current(self, notebook_path: Path, monkeypatch: pytest.MonkeyPatch):
+        update_cell_content(notebook_path, "intro", "Hello.")
+        scanned: list[int] = []
+        real_scan = update_notebook._scan
+        monkeypatch.setattr(
+            update_notebook, "_scan", lambda data, base=0: scanned.append(len(data)) or real_scan(data, base)
+        )
+
+        update_cell_content(notebook_path, "review", "Looks good.")
+        add_cell(notebook_path, "note", "end", "Bye.")
+        # Only the inserted text was scanned, never the whole file
+        assert scanned == [len("Looks good.\n"), len('\n<note id="end">\nBye.\n</note>\n') + 1]
+
+        with NotebookEditor(notebook_path) as editor:
+            text = notebook_path.read_bytes()
+            for i in range(len(editor._tags.kinds)):
+                tag = editor._tags.tag(i)
+                line = text[tag.start : tag.stop].decode()
+                assert line.startswith("</" if not tag.opening else f"<{tag.cell_type}")
+
+    def test_external_change_is_rescanned(self, notebook_path: Path):
+        update_cell_content(notebook_path, "intro", "Hello.")
+        notebook_path.write_text(NOTEBOOK.replace("# Title\n", "# A much longer title\n"))
+        update_cell_content(notebook_path, "build", "make -j")
+        assert notebook_path.read_text() == NOTEBOOK.replace("# Title\n", "# A much longer title\n").replace(
+            "\nmake\n", "\nmake -j\n"
+        )
+
+    def test_save_is_atomic_and_keeps_mode(self, notebook_path: Path):
+        notebook_path.chmod(0o640)
+        inode = notebook_path.stat().st_ino
+        link = notebook_path.with_name("link.anyt.md")
+        link.symlink_to(notebook_path.name)
+        update_cell_content(link, "build", "make")
+        assert link.is_symlink()
+        assert notebook_path.stat().st_ino != inode
+        assert notebook_path.stat().st_mode & 0o777 == 0o640
+        assert not [p for p in notebook_path.parent.iterdir() if p.name.endswith(".tmp")]
+
+    def test_version_is_content_hash(self, notebook_path: Path):
+        with NotebookEditor(notebook_path) as editor:  # scanned
+            assert editor.version == notebook_version(notebook_path)
+        version = update_cell_content(notebook_path, "build", "ninja")
+        assert version == notebook_version(notebook_path)
+        with NotebookEditor(notebook_path) as editor:  # from the index
+            assert editor.version == version
+            assert editor.content("build") == "ninja"
+
+
+class TestConcurrency:
+    def test_stale_version_conflicts(self, notebook_path: Path):
+        version = notebook_version(notebook_path)
+        newer = update_cell_content(notebook_path, "build", "ninja", expect_version=version)
+        with pytest.raises(ConflictError, match=f"changed since version {version} \\(now {newer}\\)"):
+            remove_cell(notebook_path, "intro", expect_version=version)
+        with pytest.raises(ConflictError):
+            apply_edits(notebook_path, [{"op": "remove", "cell": "intro"}], expect_version=version)
+        assert notebook_path.read_text() == NOTEBOOK.replace("\nmake\n", "\nninja\n")
+        assert remove_cell(notebook_path, "intro", expect_version=newer) == notebook_version(notebook_path)
+
+    def test_lock_timeout(self, notebook_path: Path):
+        lock_file = lock_path(notebook_path)
+        assert lock_file.parent == notebook_path.parent / ".anyt" / "locks"
+        lock_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_file, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            with pytest.raises(ConflictError, match="Timed out"):
+                NotebookEditor(notebook_path, lock_timeout=0.05)
+        with NotebookEditor(notebook_path, lock_timeout=0.05):
+            pass
+
+    def test_concurrent_writers_lose_nothing(self, notebook_path: Path):
+        ids = [f"t{i}" for i in range(8)]
+        apply_edits(notebook_path, [{"op": "add", "type": "note", "id": i, "content": "0"} for i in ids])
+
+        def write(cell_id: str) -> None:
+            for n in range(1, 11):
+                update_cell_content(notebook_path, cell_id, str(n))
+
+        with ThreadPoolExecutor(len(ids)) as pool:
+            list(pool.map(write, ids))
+        with NotebookEditor(notebook_path) as editor:
+            assert [editor.content(i) for i in ids] == ["10"] * len(ids)
+
+    def test_benchmark(self, notebook_path: Path):
+        report = benchmark(notebook_path, writers=3, edits=4)
+        assert report["edits"] == 24 and report["lost_updates"] == 0
+        assert notebook_path.read_text() == NOTEBOOK
+
+
+class TestApply:
+    def test_edits_see_earlier_ones_and_write_once(self, notebook_path: Path, monkeypatch: pytest.MonkeyPatch):
+        saves: list[int] = []
+        real_save = NotebookEditor.save
+        monkeypatch.setattr(NotebookEditor, "save", lambda self: saves.append(1) or real_save(self))
+        ops: list[object] = [
+            {"op": "add", "type": "shell", "id": "test", "content": "make test", "after": "build"},
+            {"op": "update", "cell": "test", "content": "make check"},
+            {"op": "remove", "cell": "intro"},
+            {"op": "add", "type": "note", "id": "intro", "content": "Moved to the end."},
+        ]
+        result = apply_edits(notebook_path, ops)
+        assert result["edits"][0] == {"op": "add", "cell": "test"}  # type: ignore[index]
+        assert result["version"] == notebook_version(notebook_path)
+        assert saves == [1]
+
+        expected: str | None = NOTEBOOK
+        for op in [
+            ("add", "shell", "test", "make test", "build"),
+            ("update", "test", "make check"),
+            ("remove", "intro"),
+            ("add", "note", "intro", "Moved to the end."),
+        ]:
+            assert expected is not None
+            expected = _reference(expected, op)
+        assert notebook_path.read_text() == expected
+
+    @pytest.mark.parametrize(
+        ("ops", "error", "message"),
+        [
+            (
+                [{"op": "update", "cell": "build", "content": "x"}, {"op": "remove", "cell": "ghost"}],
+                ParseError,
+                r"Edit op 1 \(remove\): Cell not found: ghost",
+            ),
+            (
+                [{"op": "add", "type": "shell", "id": "build", "content": "x"}],
+                ValidationError,
+                "more than one cell the ID: build",
+            ),
+            (
+                [{"op": "update", "cell": "intro", "content": '<note id="build">\nx\n</note>'}],
+                ValidationError,
+                "ID: build",
+            ),
+            ([{"op": "add", "type": "cell", "id": "x", "content": ""}], ValidationError, "invalid cell type 'cell'"),
+            ([{"op": "update", "cell": "build"}], ValidationError, "missing 'content'"),
+            ([{"op": "remove", "cell": "build", "after": "x"}], ValidationError, "does not take 'after'"),
+            (["remove"], ValidationError, "must be a JSON object"),
+        ],
+    )
+    def test_failed_batch_writes_nothing(self, notebook_path: Path, ops: list[object], error: type, message: str):
+        with pytest.raises(error, match=message):
+            apply_edits(notebook_path, ops)
+        assert notebook_path.read_text() == NOTEBOOK
+
+    def test_remove_then_reuse_id(self, notebook_path: Path):
+        remove: dict[str, str] = {"op": "remove", "cell": "build"}
+        apply_edits(notebook_path, [remove, {"op": "add", "type": "shell", "id": "build", "content": "ninja"}])
+        assert notebook_path.read_text().count('id="build"') == 1
+
+    def test_cli_reads_stdin(
+        self, notebook_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+    ):
+        monkeypatch.setattr("sys.stdin", io.StringIO('[{"op": "remove", "cell": "review"}]'))
+        assert main([str(notebook_path), "apply"]) == 0
+        assert '"cell": "review"' in capsys.readouterr().out
+        assert main([str(notebook_path), "apply", "{}"]) == 1
+        assert "Validation error: Edit operations must be a JSON list" in capsys.readouterr().err
+
+
+class TestCli:
+    def test_update(self, notebook_path: Path, capsys: pytest.CaptureFixture[str]):
+        assert main([str(notebook_path), "update", "--cell", "build", "--content", "ninja"]) == 0
+        assert f"Updated cell 'build' (version {notebook_version(notebook_path)})" in capsys.readouterr().out
+        assert main([str(notebook_path), "remove", "--cell", "build", "--expect-version", "0" * 16]) == 1
+        assert "Conflict: " in capsys.readouterr().err
+        assert main([str(notebook_path), "remove", "--cell", "ghost"]) == 1
+        assert "Parse error: Cell not found: ghost" in capsys.readouterr().err
@@ -0,0 +1,53 @@
+"""Tests for validate_notebooks module."""
+
+from pathlib import Path
+
+import pytest
+
+from validate_notebooks import find_notebooks, validate_file, validate_notebooks
+
+VALID = '---\nschema: "2.0"\nname: ok\n---\n\n<shell id="setup">\necho hi\n</shell>\n'
+INVALID = '---\nschema: "1.0"\nname: old\n---\n'
+UNPARSEABLE = "# no frontmatter\n"
+
+
+@pytest.fixture
+def tree(tmp_path: Path) -> Path:
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "a.anyt").write_text(VALID, encoding="utf-8")
+    (tmp_path / "nested" / "b.anyt.md").write_text(INVALID, encoding="utf-8")
+    (tmp_path / "nested" / "c.anyt").write_text(UNPARSEABLE, encoding="utf-8")
+    (tmp_path / "notes.md").write_text("not a notebook", encoding="utf-8")
+    return tmp_path
+
+
+class TestFindNotebooks:
+    def test_recurses_and_filters(self, tree: Path):
+        names = [p.name for p in find_notebooks([tree])]
+        assert names == ["a.anyt", "b.anyt.md", "c.anyt"]
+
+    def test_deduplicates_files_and_dirs(self, tree: Path):
+        assert len(find_notebooks([tree, tree / "a.anyt"])) == 3
+
+
+class TestValidate:
+    def test_valid_file(self, tree: Path):
+        result = validate_file(tree / "a.anyt")
+        assert result["valid"] is True
+        assert result["cells"] == 1
+
+    def test_invalid_file(self, tree: Path):
+        result = validate_file(tree / "nested" / "b.anyt.md")
+        assert result["valid"] is False
+        assert any("Schema" in str(e) for e in result["errors"])  # type: ignore[union-attr]
+
+    def test_unparseable_file_is_reported(self, tree: Path):
+        result = validate_file(tree / "nested" / "c.anyt")
+        assert result["valid"] is False
+        assert "Parse error" in str(result["errors"])
+
+    @pytest.mark.parametrize("jobs", [1, 2])
+    def test_pool_yields_every_notebook(self, tree: Path, jobs: int):
+        results = list(validate_notebooks(find_notebooks([tree]), jobs=jobs))
+        assert sorted(Path(str(r["path"])).name for r in results) == ["a.anyt", "b.anyt.md", "c.anyt"]
+        assert sum(bool(r["valid"]) for r in results) == 1
@@ -5,17 +5,65 @@ Update cells in an AnyT Notebook (.anyt.md) file.
 Run with: uv run --project runtime runtime/update_notebook.py <notebook.anyt.md> --cell <id> --content <new>
 
 Preserves the original file structure, only modifying the targeted cell content.
+``move`` reorders a cell without retyping it, so its tag line keeps every attribute.
+``apply`` takes a JSON list of update/add/remove/move operations and writes them all at
+once, or nothing if any of them fails.
+
+Edits go through ``NotebookEditor``, which works from an index of the byte offsets of
+every cell tag line instead of scanning the file. The index is kept beside the parse
+cache (``.anyt/parse-cache/<key>.index``) and in the notebook daemon's memory,
+tied to the file's (inode, mtime, size), and updated from the edit itself. An edit
+splices the affected byte range; saving writes a temporary file and renames it over
+the notebook, so readers never see a partial file.
+
+Writers serialize on an advisory ``flock`` of ``.anyt/locks/<notebook name>.lock`` in
+the notebook's directory (see ``lock_path``), held from reading the file to renaming the
+new one, so concurrent edits through this module are applied one after the other
+instead of overwriting each other. Programs that write notebooks some other way are
+only serialized with these edits if they take the same lock. Every edit prints the
+notebook's content version (the start of its SHA-256, also reported as
+``content_version`` by ``parse_notebook.py`` and by its ``--batch version`` query); an
+edit given ``--expect-version`` fails with a conflict instead of applying to content
+that changed since that version was read.
 """
 
 import argparse
+import bisect
+import fcntl
+import hashlib
+import json
+import os
 import re
+import stat
 import sys
+import tempfile
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 
-from config import NotebookError, ParseError
+from config import (
+    NOTEBOOK_INDEX_FORMAT,
+    NOTEBOOK_LOCK_TIMEOUT,
+    NOTEBOOK_LOCKS_DIR_NAME,
+    NOTEBOOK_VERSION_LENGTH,
+    STATE_DIR_NAME,
+    VALID_CELL_TYPES,
+    ConflictError,
+    NotebookError,
+    ParseError,
+    ValidationError,
+)
+from daemon_client import forward_cli
+from notebook_cache import ResidentCache, cache_dir
+from parse_notebook import resolve_workdir
 
 _ERROR_PREFIXES: dict[type[NotebookError], str] = {
+    ConflictError: "Conflict",
     ParseError: "Parse error",
+    ValidationError: "Validation error",
 }
 
 # Match opening cell tags
@@ -26,151 +74,676 @@ _OPEN_TAG_RE = re.compile(
 _CLOSE_TAG_RE = re.compile(r"^</(task|shell|input|note|break)>\s*$", re.IGNORECASE)
 _ATTR_RE = re.compile(r'([a-z]+)=["\']([^"\']*)["\']')
 
-
-def update_cell_content(file_path: Path, cell_id: str, new_content: str) -> None:
-    """Replace the content of a specific cell in the notebook file."""
-    if not file_path.exists():
-        raise ParseError(f"File not found: {file_path}")
-
-    text = file_path.read_text(encoding="utf-8")
-    lines = text.split("\n")
-
-    # Find the cell boundaries
-    cell_start: int | None = None
-    cell_end: int | None = None
-    cell_type: str | None = None
-
-    for i, line in enumerate(lines):
-        stripped = line.strip()
-
-        open_match = _OPEN_TAG_RE.match(stripped)
-        if open_match:
-            attrs = dict(_ATTR_RE.findall(open_match.group(2)))
-            if attrs.get("id") == cell_id:
-                cell_start = i
-                cell_type = open_match.group(1).lower()
-                continue
-
-        if cell_start is not None and cell_type is not None:
-            close_match = _CLOSE_TAG_RE.match(stripped)
-            if close_match and close_match.group(1).lower() == cell_type:
-                cell_end = i
+# Lines that may hold a cell tag; each candidate line is checked with the patterns above
+_CANDIDATE_RE = re.compile(rb"</?(?:task|shell|input|note|break)\b", re.IGNORECASE)
+
+# In-memory tag indexes keyed by notebook path; enabled by the notebook daemon
+resident_index: ResidentCache | None = None
+
+
+# ---------------------------------------------------------------------------
+# Tag index
+# ---------------------------------------------------------------------------
+
+
+@dataclass(slots=True, frozen=True)
+class _Tag:
+    start: int  # offset of the line holding the tag
+    stop: int  # offset of the line's newline (or the end of the file)
+    opening: bool
+    cell_type: str
+    cell_id: str | None  # opening tags only
+
+
+@dataclass(slots=True)
+class _TagIndex:
+    """The tag lines of a notebook in file order, as columns.
+
+    Offsets are kept in arrays so indexes of large notebooks load, store and shift
+    without building an object per tag. Never modified in place: the daemon may share
+    an index between editors.
+    """
+
+    starts: "array[int]"
+    stops: "array[int]"
+    kinds: list[str]  # "<type" for opening tags, "/type" for closing ones
+    ids: list[str | None]
+
+    def tag(self, i: int) -> _Tag:
+        kind = self.kinds[i]
+        return _Tag(self.starts[i], self.stops[i], kind[0] == "<", kind[1:], self.ids[i])
+
+    def find(self, cell_id: str) -> tuple[_Tag | None, _Tag | None]:
+        """Opening and closing tag lines of a cell; the closing one is None if the cell is unclosed.
+
+        As when the file was scanned line by line: the first closing tag of the same type
+        after the last opening tag with this id before it.
+        """
+        try:
+            first = self.ids.index(cell_id)
+        except ValueError:
+            return None, None
+        opening = first
+        for i in range(first + 1, len(self.kinds)):
+            kind = self.kinds[i]
+            if kind[0] == "<":
+                if self.ids[i] == cell_id:
+                    opening = i
+            elif kind[1:] == self.kinds[opening][1:]:
+                return self.tag(opening), self.tag(i)
+        return self.tag(opening), None
+
+    def splice(self, start: int, stop: int, inserted: "_TagIndex", delta: int) -> "_TagIndex":
+        """The index after bytes ``[start, stop)`` are replaced by text holding the ``inserted`` tags."""
+        lo = bisect.bisect_right(self.stops, start)  # tag lines ending before the splice
+        hi = bisect.bisect_left(self.starts, stop)  # tag lines starting after it
+        return _TagIndex(
+            self.starts[:lo] + inserted.starts + array("q", [x + delta for x in self.starts[hi:]]),
+            self.stops[:lo] + inserted.stops + array("q", [x + delta for x in self.stops[hi:]]),
+            self.kinds[:lo] + inserted.kinds + self.kinds[hi:],
+            self.ids[:lo] + inserted.ids + self.ids[hi:],
+        )
+
+
+def _match_tag(line: str) -> tuple[str, str | None] | None:
+    stripped = line.strip()
+    open_match = _OPEN_TAG_RE.match(stripped)
+    if open_match:
+        return f"<{open_match.group(1).lower()}", dict(_ATTR_RE.findall(open_match.group(2))).get("id")
+    close_match = _CLOSE_TAG_RE.match(stripped)
+    if close_match:
+        return f"/{close_match.group(1).lower()}", None
+    return None
+
+
+def _scan(data: bytes, base: int = 0) -> _TagIndex:
+    """The tag lines in ``data`` (which starts at a line start), with offsets shifted by ``base``."""
+    index = _TagIndex(array("q"), array("q"), [], [])
+    last_line = -1
+    for candidate in _CANDIDATE_RE.finditer(data):
+        start = data.rfind(b"\n", 0, candidate.start()) + 1
+        if start == last_line:
+            continue
+        last_line = start
+        stop = data.find(b"\n", candidate.end())
+        stop = len(data) if stop < 0 else stop
+        tag = _match_tag(data[start:stop].decode("utf-8", errors="replace"))
+        if tag is not None:
+            index.starts.append(base + start)
+            index.stops.append(base + stop)
+            index.kinds.append(tag[0])
+            index.ids.append(tag[1])
+    return index
+
+
+def _index_path(source: Path) -> Path | None:
+    try:
+        workdir = resolve_workdir(source)
+    except (NotebookError, OSError):
+        return None  # no frontmatter to find the workdir from: keep the index in memory only
+    key = hashlib.sha256(str(source).encode("utf-8")).hexdigest()[:24]
+    return cache_dir(workdir) / f"{key}.index"
+
+
+def _load_index(source: Path, signature: tuple[int, int, int]) -> tuple[_TagIndex, bool, str] | None:
+    """Tag index, carriage-return flag and content version recorded for this version of the file, or None.
+
+    The file is a JSON header line, the start and stop offsets as raw 64-bit arrays, and
+    the tag kinds and ids as JSON.
+    """
+    if resident_index is not None:
+        resident = resident_index.get(source)
+        if isinstance(resident, tuple):
+            return resident
+    path = _index_path(source)
+    if path is None:
+        return None
+    try:
+        data = path.read_bytes()
+        newline = data.index(b"\n")
+        header = json.loads(data[:newline])
+        if header.get("format") != NOTEBOOK_INDEX_FORMAT or header.get("signature") != list(signature):
+            return None
+        size = header["count"] * 8
+        body = newline + 1
+        starts, stops = array("q"), array("q")
+        starts.frombytes(data[body : body + size])
+        stops.frombytes(data[body + size : body + 2 * size])
+        kinds, ids = json.loads(data[body + 2 * size :])
+        return _TagIndex(starts, stops, kinds, ids), bool(header["cr"]), str(header["version"])
+    except (OSError, ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+def _store_index(source: Path, signature: tuple[int, int, int], index: _TagIndex, cr: bool, version: str) -> None:
+    """Record the index for this version of the file. Failures (read-only workdir, etc.) are ignored."""
+    if resident_index is not None:
+        resident_index.put(source, (index, cr, version), signature)
+    path = _index_path(source)
+    if path is None:
+        return
+    header = {
+        "format": NOTEBOOK_INDEX_FORMAT,
+        "signature": list(signature),
+        "cr": cr,
+        "version": version,
+        "count": len(index.kinds),
+    }
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp.open("wb") as f:
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            f.write(index.starts.tobytes())
+            f.write(index.stops.tobytes())
+            f.write(json.dumps([index.kinds, index.ids]).encode("utf-8"))
+        os.replace(tmp, path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+
+
+# ---------------------------------------------------------------------------
+# Editor
+# ---------------------------------------------------------------------------
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+
+
+def _copy_range(src: int, dst: int, offset: int, length: int, digest: "hashlib._Hash") -> None:
+    """Append ``length`` bytes of ``src`` from ``offset`` to ``dst``, adding them to ``digest``."""
+    end = offset + length
+    while offset < end:
+        chunk = os.pread(src, min(end - offset, 1 << 20), offset)
+        if not chunk:
+            raise ParseError("Notebook changed while it was being edited")
+        digest.update(chunk)
+        _write_all(dst, chunk)
+        offset += len(chunk)
+
+
+def _version(digest: "hashlib._Hash") -> str:
+    return digest.hexdigest()[:NOTEBOOK_VERSION_LENGTH]
+
+
+def lock_path(path: Path) -> Path:
+    """The file writers of ``path`` flock. Not under the workdir, which an edit to the frontmatter can move."""
+    return path.parent / STATE_DIR_NAME / NOTEBOOK_LOCKS_DIR_NAME / f"{path.name}.lock"
+
+
+def _lock(path: Path, timeout: float) -> int:
+    """Take the notebook's writer lock, waiting up to ``timeout`` seconds. Returns the lock file descriptor."""
+    lock = lock_path(path)
+    lock.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(lock, os.O_RDWR | os.O_CREAT, 0o644)
+    deadline = time.monotonic() + timeout
+    delay = 0.0005
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                os.close(fd)
+                raise ConflictError(f"Timed out after {timeout:g}s waiting for another writer of {path.name}") from None
+            time.sleep(delay)
+            delay = min(delay * 2, 0.01)
+
+
+class NotebookEditor:
+    """Splices cells in a notebook file and writes the result with one atomic rename.
+
+    The new contents are held as a piece table: ranges of the original file plus the
+    inserted text. Edits only touch the pieces and tag offsets around them, so their cost
+    follows the size of the change. Files with carriage returns have their newlines
+    normalized on the first edit, as reading the whole file in text mode used to do.
+
+    The editor holds the notebook's writer lock from opening the file until ``close()``.
+    ``version`` is the content version of the file as read, and after ``save()`` of the
+    file as written; with ``expect_version``, opening fails with ConflictError unless the
+    file is still at that version.
+
+    Use as a context manager; nothing is written until ``save()``.
+    """
+
+    def __init__(
+        self, file_path: Path, expect_version: str | None = None, lock_timeout: float = NOTEBOOK_LOCK_TIMEOUT
+    ) -> None:
+        if not file_path.exists():
+            raise ParseError(f"File not found: {file_path}")
+        self.path = file_path.resolve()  # write through symlinks rather than replacing them
+        self._fd = -1
+        self._lock_fd = _lock(self.path, lock_timeout)
+        try:
+            self._fd = os.open(self.path, os.O_RDONLY)
+            self._load()
+        except BaseException:
+            self.close()
+            raise
+        if expect_version is not None and expect_version != self.version:
+            self.close()
+            raise ConflictError(
+                f"{file_path} changed since version {expect_version} (now {self.version}); read it again and retry"
+            )
+
+    def _load(self) -> None:
+        self._stat = os.fstat(self._fd)
+        signature = (self._stat.st_ino, self._stat.st_mtime_ns, self._stat.st_size)
+        self._size = self._stat.st_size
+        # Each piece is a (offset, length) range of the original file or inserted bytes
+        self._pieces: list[tuple[int, int] | bytes] = [(0, self._size)] if self._size else []
+
+        index = _load_index(self.path, signature)
+        if index is not None and not index[1]:
+            self._tags, _, self.version = index
+            return
+        data = os.pread(self._fd, self._size, 0) if self._size else b""
+        self.version = _version(hashlib.sha256(data))
+        if b"\r" in data:
+            data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+            self._size = len(data)
+            self._pieces = [data]
+        self._tags = _scan(data)
+
+    def __enter__(self) -> "NotebookEditor":
+        return self
+
+    def __exit__(self, exc_type: object, exc: object, tb: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        if self._lock_fd >= 0:
+            os.close(self._lock_fd)  # releases the lock
+            self._lock_fd = -1
+
+    # -- pieces --------------------------------------------------------------
+
+    def _slice(self, lo: int, hi: int) -> list[tuple[int, int] | bytes]:
+        """The pieces covering ``[lo, hi)`` of the current contents."""
+        out: list[tuple[int, int] | bytes] = []
+        pos = 0
+        for piece in self._pieces:
+            length = len(piece) if isinstance(piece, bytes) else piece[1]
+            a, b = max(lo, pos), min(hi, pos + length)
+            if a < b:
+                if isinstance(piece, bytes):
+                    out.append(piece[a - pos : b - pos])
+                else:
+                    out.append((piece[0] + a - pos, b - a))
+            pos += length
+            if pos >= hi:
                 break
-
-    if cell_start is None:
-        raise ParseError(f"Cell not found: {cell_id}")
-    if cell_end is None:
-        raise ParseError(f"Unclosed cell tag for: {cell_id}")
-
-    # Replace the content between open and close tags
-    new_lines = [*lines[: cell_start + 1], new_content, *lines[cell_end:]]
-    file_path.write_text("\n".join(new_lines), encoding="utf-8")
+        return out
+
+    def _read(self, lo: int, hi: int) -> bytes:
+        return b"".join(
+            p if isinstance(p, bytes) else os.pread(self._fd, p[1], p[0]) for p in self._slice(lo, min(hi, self._size))
+        )
+
+    def _line_stop(self, start: int) -> int:
+        """Offset of the newline ending the line that starts at ``start`` (or the end of the file)."""
+        pos = start
+        while pos < self._size:
+            chunk = self._read(pos, pos + 4096)
+            newline = chunk.find(b"\n")
+            if newline >= 0:
+                return pos + newline
+            pos += len(chunk)
+        return self._size
+
+    def splice(self, start: int, stop: int, data: bytes) -> None:
+        """Replace bytes ``[start, stop)`` with ``data``. Both ends must be line boundaries."""
+        tail = self._slice(stop, self._size)
+        self._pieces = [*self._slice(0, start), *([data] if data else []), *tail]
+        delta = len(data) - (stop - start)
+        self._size += delta
+        self._tags = self._tags.splice(start, stop, _scan(data, start), delta)
+
+    # -- cells ---------------------------------------------------------------
+
+    def find(self, cell_id: str) -> tuple[_Tag | None, _Tag | None]:
+        """Opening and closing tag lines of a cell; the closing one is None if the cell is unclosed."""
+        return self._tags.find(cell_id)
+
+    def _cell(self, cell_id: str) -> tuple[_Tag, _Tag]:
+        opening, closing = self.find(cell_id)
+        if opening is None:
+            raise ParseError(f"Cell not found: {cell_id}")
+        if closing is None:
+            raise ParseError(f"Unclosed cell tag for: {cell_id}")
+        return opening, closing
+
+    def content(self, cell_id: str) -> str:
+        """Current text between a cell's tag lines, without the final newline."""
+        opening, closing = self._cell(cell_id)
+        return self._read(opening.stop + 1, closing.start).decode("utf-8").removesuffix("\n")
+
+    def update(self, cell_id: str, content: str) -> None:
+        """Replace everything between a cell's tag lines with ``content``."""
+        opening, closing = self._cell(cell_id)
+        self.splice(opening.stop + 1, closing.start, content.encode("utf-8") + b"\n")
+
+    def add(
+        self, cell_type: str, cell_id: str, content: str, label: str | None = None, after: str | None = None
+    ) -> None:
+        """Insert a new cell after the cell ``after``, or at the end of the file."""
+        attrs = f'id="{cell_id}"'
+        if label:
+            attrs += f' label="{label}"'
+        new_cell = f"\n<{cell_type} {attrs}>\n{content}\n</{cell_type}>\n".encode()
+
+        if after:
+            _, closing = self.find(after)
+            if closing is None:
+                raise ParseError(f"Cell not found for 'after' reference: {after}")
+            if closing.stop < self._size:
+                self.splice(closing.stop + 1, closing.stop + 1, new_cell + b"\n")
+                return
+        self.splice(self._size, self._size, b"\n" + new_cell)
+
+    def remove(self, cell_id: str) -> None:
+        """Remove a cell's lines and the blank line after it, if any."""
+        opening, closing = self._cell(cell_id)
+        end: int | None = None  # None: the cell runs to the end of the file
+        if closing.stop < self._size:
+            end = closing.stop + 1
+            line_stop = self._line_stop(end)
+            if not self._read(end, line_stop).decode("utf-8", errors="replace").strip():
+                end = line_stop + 1 if line_stop < self._size else None
+        if end is None:
+            # Nothing follows the cell, so the newline ending the line before it goes too
+            self.splice(max(opening.start - 1, 0), self._size, b"")
+        else:
+            self.splice(opening.start, end, b"")
+
+    def move(self, cell_id: str, after: str | None = None, before: str | None = None) -> None:
+        """Move a cell, its tag lines byte for byte, to just after the cell ``after`` or before ``before``.
+
+        Cell state is keyed by ID, so a moved cell keeps its markers and outputs.
+        """
+        if (after is None) == (before is None):
+            raise ValidationError("Give exactly one of 'after' or 'before'")
+        where, target = ("after", after) if after is not None else ("before", before)
+        assert target is not None
+        if target == cell_id:
+            raise ValidationError(f"Cannot move cell '{cell_id}' {where} itself")
+        opening, closing = self._cell(cell_id)
+        target_open, target_close = self.find(target)
+        if target_open is None or target_close is None:
+            raise ParseError(f"Cell not found for '{where}' reference: {target}")
+        if opening.start < target_open.start < closing.start:
+            raise ValidationError(f"Cell '{target}' is inside cell '{cell_id}'")
+
+        block = self._read(opening.start, closing.stop) + b"\n"
+        self.remove(cell_id)
+        target_open, target_close = self._cell(target)
+        if where == "before":
+            self.splice(target_open.start, target_open.start, block + b"\n")
+        elif target_close.stop < self._size:
+            self.splice(target_close.stop + 1, target_close.stop + 1, b"\n" + block)
+        else:
+            self.splice(self._size, self._size, b"\n\n" + block)
+
+    # -- saving --------------------------------------------------------------
+
+    def save(self) -> str:
+        """Write the edited notebook to a temporary file and rename it over the original. Returns the new version."""
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        digest = hashlib.sha256()
+        try:
+            try:
+                for piece in self._pieces:
+                    if isinstance(piece, bytes):
+                        digest.update(piece)
+                        _write_all(fd, piece)
+                    else:
+                        _copy_range(self._fd, fd, *piece, digest)
+                os.fchmod(fd, stat.S_IMODE(self._stat.st_mode))
+                written = os.fstat(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp, self.path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        self.version = _version(digest)
+        cr = any(isinstance(p, bytes) and b"\r" in p for p in self._pieces)
+        _store_index(self.path, (written.st_ino, written.st_mtime_ns, written.st_size), self._tags, cr, self.version)
+        return self.version
+
+
+def update_cell_content(file_path: Path, cell_id: str, new_content: str, expect_version: str | None = None) -> str:
+    """Replace the content of a specific cell in the notebook file. Returns the new content version."""
+    with NotebookEditor(file_path, expect_version) as editor:
+        editor.update(cell_id, new_content)
+        return editor.save()
 
 
 def add_cell(
-    file_path: Path, cell_type: str, cell_id: str, content: str, label: str | None = None, after: str | None = None
-) -> None:
+    file_path: Path,
+    cell_type: str,
+    cell_id: str,
+    content: str,
+    label: str | None = None,
+    after: str | None = None,
+    expect_version: str | None = None,
+) -> str:
     """Add a new cell to the notebook. Inserts after the specified cell ID, or appends to the end."""
-    if not file_path.exists():
-        raise ParseError(f"File not found: {file_path}")
+    with NotebookEditor(file_path, expect_version) as editor:
+        editor.add(cell_type, cell_id, content, label, after)
+        return editor.save()
+
+
+def remove_cell(file_path: Path, cell_id: str, expect_version: str | None = None) -> str:
+    """Remove a cell from the notebook file. Returns the new content version."""
+    with NotebookEditor(file_path, expect_version) as editor:
+        editor.remove(cell_id)
+        return editor.save()
+
+
+def move_cell(
+    file_path: Path,
+    cell_id: str,
+    after: str | None = None,
+    before: str | None = None,
+    expect_version: str | None = None,
+) -> str:
+    """Move a cell after or before another one, keeping its text exactly. Returns the new content version."""
+    with NotebookEditor(file_path, expect_version) as editor:
+        editor.move(cell_id, after, before)
+        return editor.save()
+
+
+# ---------------------------------------------------------------------------
+# Batches
+# ---------------------------------------------------------------------------
+
+# Edit op -> (required fields, optional fields); every field is a string
+NOTEBOOK_EDIT_OPS: dict[str, tuple[tuple[str, ...], tuple[str, ...]]] = {
+    "update": (("cell", "content"), ()),
+    "add": (("type", "id", "content"), ("label", "after")),
+    "remove": (("cell",), ()),
+    "move": (("cell",), ("after", "before")),
+}
 
-    text = file_path.read_text(encoding="utf-8")
-    lines = text.split("\n")
-
-    # Build the new cell tag
-    attrs = f'id="{cell_id}"'
-    if label:
-        attrs += f' label="{label}"'
-    new_cell = f"\n<{cell_type} {attrs}>\n{content}\n</{cell_type}>\n"
-
-    if after:
-        # Find the closing tag of the 'after' cell
-        in_target = False
-        target_type: str | None = None
-        insert_idx: int | None = None
-
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            open_match = _OPEN_TAG_RE.match(stripped)
-            if open_match:
-                attrs_dict = dict(_ATTR_RE.findall(open_match.group(2)))
-                if attrs_dict.get("id") == after:
-                    in_target = True
-                    target_type = open_match.group(1).lower()
-                    continue
-
-            if in_target and target_type:
-                close_match = _CLOSE_TAG_RE.match(stripped)
-                if close_match and close_match.group(1).lower() == target_type:
-                    insert_idx = i + 1
-                    break
-
-        if insert_idx is None:
-            raise ParseError(f"Cell not found for 'after' reference: {after}")
-
-        lines.insert(insert_idx, new_cell)
-    else:
-        # Append to end
-        lines.append(new_cell)
-
-    file_path.write_text("\n".join(lines), encoding="utf-8")
-
-
-def remove_cell(file_path: Path, cell_id: str) -> None:
-    """Remove a cell from the notebook file."""
-    if not file_path.exists():
-        raise ParseError(f"File not found: {file_path}")
 
-    text = file_path.read_text(encoding="utf-8")
-    lines = text.split("\n")
-
-    cell_start: int | None = None
-    cell_end: int | None = None
-    cell_type: str | None = None
-
-    for i, line in enumerate(lines):
-        stripped = line.strip()
-        open_match = _OPEN_TAG_RE.match(stripped)
-        if open_match:
-            attrs = dict(_ATTR_RE.findall(open_match.group(2)))
-            if attrs.get("id") == cell_id:
-                cell_start = i
-                cell_type = open_match.group(1).lower()
-                continue
-
-        if cell_start is not None and cell_type is not None:
-            close_match = _CLOSE_TAG_RE.match(stripped)
-            if close_match and close_match.group(1).lower() == cell_type:
-                cell_end = i
+def _check_edit_op(position: int, op: object) -> dict[str, str]:
+    if not isinstance(op, dict):
+        raise ValidationError(f"Edit op {position} must be a JSON object")
+    name = op.get("op")
+    if not isinstance(name, str) or name not in NOTEBOOK_EDIT_OPS:
+        raise ValidationError(f"Edit op {position}: unknown op {name!r} (valid: {', '.join(NOTEBOOK_EDIT_OPS)})")
+    required, optional = NOTEBOOK_EDIT_OPS[name]
+    for key in required:
+        if key not in op:
+            raise ValidationError(f"Edit op {position} ({name}) is missing '{key}'")
+    for key, value in op.items():
+        if key == "op":
+            continue
+        if key not in required and key not in optional:
+            raise ValidationError(f"Edit op {position} ({name}) does not take '{key}'")
+        if not isinstance(value, str):
+            raise ValidationError(f"Edit op {position} ({name}): '{key}' must be a string")
+    if name == "add" and op["type"] not in VALID_CELL_TYPES:
+        raise ValidationError(f"Edit op {position} (add): invalid cell type '{op['type']}'")
+    return op
+
+
+def _duplicate_ids(index: _TagIndex) -> set[str]:
+    seen: set[str] = set()
+    duplicates: set[str] = set()
+    for kind, cell_id in zip(index.kinds, index.ids, strict=True):
+        if kind[0] == "<" and cell_id is not None:
+            (duplicates if cell_id in seen else seen).add(cell_id)
+    return duplicates
+
+
+def apply_edits(file_path: Path, ops: list[object], expect_version: str | None = None) -> dict[str, object]:
+    """Apply a list of edit operations in order and write the notebook once.
+
+    Every op is checked before any is applied, each sees the effect of the ones before
+    it, and the file is only written if all of them succeed and no cell ID ends up on
+    more than one cell (unless it already was). Returns the new version and one entry
+    per op.
+    """
+    checked = [_check_edit_op(i, op) for i, op in enumerate(ops)]
+    results: list[dict[str, str]] = []
+    with NotebookEditor(file_path, expect_version) as editor:
+        already = _duplicate_ids(editor._tags)
+        for i, op in enumerate(checked):
+            name = op["op"]
+            try:
+                if name == "update":
+                    editor.update(op["cell"], op["content"])
+                elif name == "add":
+                    editor.add(op["type"], op["id"], op["content"], op.get("label"), op.get("after"))
+                elif name == "move":
+                    editor.move(op["cell"], op.get("after"), op.get("before"))
+                else:
+                    editor.remove(op["cell"])
+            except NotebookError as e:
+                raise type(e)(f"Edit op {i} ({name}): {e}") from e
+            results.append({"op": name, "cell": op.get("cell") or op["id"]})
+
+        duplicates = _duplicate_ids(editor._tags) - already
+        if duplicates:
+            raise ValidationError(f"Edits would give more than one cell the ID: {', '.join(sorted(duplicates))}")
+        return {"version": editor.save(), "edits": results}
+
+
+# ---------------------------------------------------------------------------
+# Contention benchmark
+# ---------------------------------------------------------------------------
+
+
+def _benchmark_writer(path: str, writer: int, edits: int, lock_timeout: float) -> tuple[list[float], int]:
+    """One benchmark process: edit its own cell ``edits`` times, then bump the shared counter as often.
+
+    Returns the latency of each unconditional edit and the number of conflicts retried.
+    """
+    notebook = Path(path)
+    latencies: list[float] = []
+    conflicts = 0
+    for n in range(1, edits + 1):
+        began = time.perf_counter()
+        with NotebookEditor(notebook, lock_timeout=lock_timeout) as editor:
+            editor.update(f"bench-w{writer}", str(n))
+            editor.save()
+        latencies.append(time.perf_counter() - began)
+
+    counter_id = "bench-counter"
+    for _ in range(edits):
+        while True:
+            with NotebookEditor(notebook, lock_timeout=lock_timeout) as editor:
+                value, version = int(editor.content(counter_id)), editor.version
+            try:
+                update_cell_content(notebook, counter_id, str(value + 1), expect_version=version)
                 break
+            except ConflictError:
+                conflicts += 1
+    return latencies, conflicts
 
-    if cell_start is None:
-        raise ParseError(f"Cell not found: {cell_id}")
-    if cell_end is None:
-        raise ParseError(f"Unclosed cell tag for: {cell_id}")
 
-    # Remove lines from start to end (inclusive), plus any blank line after
-    end = cell_end + 1
-    if end < len(lines) and lines[end].strip() == "":
-        end += 1
+def benchmark(
+    file_path: Path, writers: int, edits: int, lock_timeout: float = NOTEBOOK_LOCK_TIMEOUT
+) -> dict[str, object]:
+    """Measure concurrent writers on a scratch copy of a notebook and check that no edit was lost.
 
-    new_lines = lines[:cell_start] + lines[end:]
-    file_path.write_text("\n".join(new_lines), encoding="utf-8")
-
-
-def main() -> int:
+    Each of ``writers`` processes makes ``edits`` unconditional edits to a cell of its
+    own, then increments a shared counter cell ``edits`` times by read, then write with
+    ``expect_version``, retrying on conflict. The notebook itself is left untouched.
+    """
+    if not file_path.exists():
+        raise ParseError(f"File not found: {file_path}")
+    if writers < 1 or edits < 1:
+        raise ValidationError("--writers and --edits must be at least 1")
+
+    with tempfile.TemporaryDirectory(prefix="anyt-bench-") as scratch:
+        copy = Path(scratch) / file_path.name
+        copy.write_bytes(file_path.read_bytes())
+        ops: list[object] = [{"op": "add", "type": "note", "id": "bench-counter", "content": "0"}]
+        ops += [{"op": "add", "type": "note", "id": f"bench-w{w}", "content": "0"} for w in range(writers)]
+        apply_edits(copy, ops)
+
+        began = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=writers) as pool:
+            futures = [pool.submit(_benchmark_writer, str(copy), w, edits, lock_timeout) for w in range(writers)]
+            reports = [f.result() for f in futures]
+        seconds = time.perf_counter() - began
+
+        with NotebookEditor(copy) as editor:
+            lost = sum(int(editor.content(f"bench-w{w}")) != edits for w in range(writers))
+            lost += writers * edits - int(editor.content("bench-counter"))
+        index_path = _index_path(copy.resolve())
+        if index_path is not None:
+            index_path.unlink(missing_ok=True)  # the workdir may be outside the scratch directory
+
+    latencies = sorted(latency * 1000 for report in reports for latency in report[0])
+    return {
+        "writers": writers,
+        "edits": 2 * writers * edits,
+        "seconds": round(seconds, 3),
+        "edits_per_second": round(2 * writers * edits / seconds, 1),
+        "p50_ms": round(latencies[len(latencies) // 2], 2),
+        "p95_ms": round(latencies[min(len(latencies) - 1, len(latencies) * 95 // 100)], 2),
+        "max_ms": round(latencies[-1], 2),
+        "conflicts": sum(report[1] for report in reports),
+        "lost_updates": lost,
+    }
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def main(argv: list[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description="Update cells in an AnyT Notebook (.anyt.md) file")
     parser.add_argument("notebook", help="Path to .anyt.md file")
 
     subparsers = parser.add_subparsers(dest="command", required=True)
 
+    # Edits can be made conditional on the version a caller last read
+    versioned = argparse.ArgumentParser(add_help=False)
+    versioned.add_argument(
+        "--expect-version",
+        help="Fail with a conflict unless the notebook is still at this version (from parse or a previous edit)",
+    )
+
     # update command
-    update_parser = subparsers.add_parser("update", help="Update a cell's content")
+    update_parser = subparsers.add_parser("update", parents=[versioned], help="Update a cell's content")
     update_parser.add_argument("--cell", required=True, help="Cell ID to update")
     update_parser.add_argument("--content", required=True, help="New cell content")
 
     # add command
-    add_parser = subparsers.add_parser("add", help="Add a new cell")
+    add_parser = subparsers.add_parser("add", parents=[versioned], help="Add a new cell")
     add_parser.add_argument(
         "--type", required=True, choices=["task", "shell", "input", "note", "break"], help="Cell type"
     )
@@ -180,23 +753,73 @@ def main() -> int:
     add_parser.add_argument("--after", help="Insert after this cell ID")
 
     # remove command
-    remove_parser = subparsers.add_parser("remove", help="Remove a cell")
+    remove_parser = subparsers.add_parser("remove", parents=[versioned], help="Remove a cell")
     remove_parser.add_argument("--cell", required=True, help="Cell ID to remove")
 
-    args = parser.parse_args()
+    # move command
+    move_parser = subparsers.add_parser("move", parents=[versioned], help="Move a cell")
+    move_parser.add_argument("--cell", required=True, help="Cell ID to move")
+    target = move_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--after", help="Move after this cell ID")
+    target.add_argument("--before", help="Move before this cell ID")
+
+    # apply command
+    apply_parser = subparsers.add_parser(
+        "apply", parents=[versioned], help="Apply many edits at once, or none if one fails"
+    )
+    apply_parser.add_argument(
+        "ops",
+        nargs="?",
+        help='JSON list of edits, e.g. [{"op": "update", "cell": "a", "content": "..."}] '
+        f"(ops: {', '.join(NOTEBOOK_EDIT_OPS)}). Read from stdin if omitted.",
+    )
+
+    # benchmark command
+    bench_parser = subparsers.add_parser(
+        "benchmark", help="Measure concurrent writers on a scratch copy of the notebook and check for lost edits"
+    )
+    bench_parser.add_argument("--writers", type=int, default=8, help="Concurrent writer processes (default: 8)")
+    bench_parser.add_argument("--edits", type=int, default=25, help="Edits of each kind per writer (default: 25)")
+
+    args = parser.parse_args(argv)
+
+    stdin_text: str | None = None
+    if args.command == "apply" and args.ops is None:
+        stdin_text = args.ops = sys.stdin.read()
+
+    if argv is None:
+        forwarded = forward_cli("update_notebook", sys.argv[1:], stdin=stdin_text)
+        if forwarded is not None:
+            return forwarded
 
     try:
         notebook_path = Path(args.notebook)
 
         if args.command == "update":
-            update_cell_content(notebook_path, args.cell, args.content)
-            print(f"Updated cell '{args.cell}'")
+            version = update_cell_content(notebook_path, args.cell, args.content, args.expect_version)
+            print(f"Updated cell '{args.cell}' (version {version})")
         elif args.command == "add":
-            add_cell(notebook_path, args.type, args.id, args.content, args.label, getattr(args, "after", None))
-            print(f"Added {args.type} cell '{args.id}'")
+            version = add_cell(
+                notebook_path, args.type, args.id, args.content, args.label, args.after, args.expect_version
+            )
+            print(f"Added {args.type} cell '{args.id}' (version {version})")
         elif args.command == "remove":
-            remove_cell(notebook_path, args.cell)
-            print(f"Removed cell '{args.cell}'")
+            version = remove_cell(notebook_path, args.cell, args.expect_version)
+            print(f"Removed cell '{args.cell}' (version {version})")
+        elif args.command == "move":
+            version = move_cell(notebook_path, args.cell, args.after, args.before, args.expect_version)
+            where = f"after '{args.after}'" if args.after else f"before '{args.before}'"
+            print(f"Moved cell '{args.cell}' {where} (version {version})")
+        elif args.command == "benchmark":
+            print(json.dumps(benchmark(notebook_path, args.writers, args.edits), indent=2))
+        elif args.command == "apply":
+            try:
+                ops = json.loads(args.ops)
+            except json.JSONDecodeError as e:
+                raise ValidationError(f"Edit operations are not valid JSON: {e}") from e
+            if not isinstance(ops, list):
+                raise ValidationError("Edit operations must be a JSON list")
+            print(json.dumps(apply_edits(notebook_path, ops, args.expect_version), indent=2))
 
         return 0
 
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Validate many AnyT Notebook files in parallel.
+
+Run with: uv run --project runtime runtime/validate_notebooks.py <path> [<path> ...] [--jobs N]
+
+Paths may be notebook files or directories (searched recursively for *.anyt and
+*.anyt.md). Parsing and validation are spread over a process pool; one JSON line is
+printed per notebook as soon as it finishes, followed by a summary line with timings.
+Exits 1 if any notebook is invalid.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from config import NOTEBOOK_GLOBS, NotebookError
+from parse_notebook import parse_notebook, validate_notebook
+
+
+def find_notebooks(paths: list[Path]) -> list[Path]:
+    """Expand files and directories into a sorted, de-duplicated list of notebook files."""
+    found: set[Path] = set()
+    for path in paths:
+        if path.is_dir():
+            for pattern in NOTEBOOK_GLOBS:
+                found.update(p.resolve() for p in path.rglob(pattern) if p.is_file())
+        else:
+            found.add(path.resolve())
+    return sorted(found)
+
+
+def validate_file(path: Path) -> dict[str, object]:
+    """Parse and validate one notebook. Never raises; failures are reported as errors."""
+    start = time.perf_counter()
+    cells = 0
+    try:
+        notebook = parse_notebook(path, lazy=True)
+        cells = len(notebook.cells)
+        errors = validate_notebook(notebook)
+    except NotebookError as e:
+        errors = [f"Parse error: {e}"]
+    except (OSError, UnicodeDecodeError) as e:
+        errors = [f"Read error: {e}"]
+
+    return {
+        "path": str(path),
+        "valid": not errors,
+        "errors": errors,
+        "cells": cells,
+        "seconds": round(time.perf_counter() - start, 6),
+    }
+
+
+def validate_notebooks(paths: list[Path], jobs: int | None = None) -> Iterator[dict[str, object]]:
+    """Validate notebooks across a process pool, yielding results in completion order."""
+    workers = jobs or os.cpu_count() or 1
+    if workers == 1 or len(paths) <= 1:
+        yield from (validate_file(p) for p in paths)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        futures = [pool.submit(validate_file, p) for p in paths]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Validate AnyT Notebook files in parallel")
+    parser.add_argument("paths", nargs="+", help="Notebook files or directories to search")
+    parser.add_argument("--jobs", "-j", type=int, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    notebooks = find_notebooks([Path(p) for p in args.paths])
+    if not notebooks:
+        print("No notebooks found", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    invalid = 0
+    busy = 0.0
+    for result in validate_notebooks(notebooks, args.jobs):
+        invalid += not result["valid"]
+        busy += float(str(result["seconds"]))
+        print(json.dumps(result), flush=True)
+
+    wall = time.perf_counter() - start
+    summary = {
+        "total": len(notebooks),
+        "valid": len(notebooks) - invalid,
+        "invalid": invalid,
+        "jobs": args.jobs or os.cpu_count() or 1,
+        "wall_seconds": round(wall, 6),
+        "busy_seconds": round(busy, 6),
+    }
+    print(json.dumps({"summary": summary}), flush=True)
+
+    return 1 if invalid else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())